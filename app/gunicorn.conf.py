@@ -0,0 +1,50 @@
+"""
+gunicorn settings for the production serving mode:
+
+    gunicorn --config gunicorn.conf.py myproject.wsgi
+
+The master process forks WEB_CONCURRENCY workers, each serving requests on
+GUNICORN_THREADS threads. Every thread keeps its own database connection
+open between requests, so a worker never holds more connections than it has
+threads; the cap in DATABASES enforces that.
+
+Workers count their requests into files in METRICS_DIR, so that /metrics
+serves the whole server's metrics whichever worker answers it; see
+projects/metrics.py.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', '8080'))
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = 30
+keepalive = 5
+
+# restart workers now and then to bound memory growth; the jitter keeps them
+# from all restarting at once
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+
+# read by myproject/settings.py when the workers load the application
+os.environ.setdefault('DB_CONN_MAX_AGE', '600')
+os.environ.setdefault('DB_MAX_CONNECTIONS_PER_WORKER', str(threads))
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'issue-tracker-metrics'))
+
+
+def on_starting(server):
+    # metrics start over with the server, as they would in a single process
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], 'metrics-*')):
+        os.remove(path)
+
+
+def worker_exit(server, worker):
+    # the counts since the worker's last flush, so a restart loses none
+    from projects.metrics import flushMetrics
+    flushMetrics(exiting=True)
@@ -0,0 +1,85 @@
+import threading
+import weakref
+
+from django.db import OperationalError
+
+
+# one slot semaphore per database alias and process; gunicorn forks the
+# workers before any connection is opened, so each worker gets its own
+slots = {}
+slotsLock = threading.Lock()
+
+
+def getSlots(alias, size):
+    with slotsLock:
+        if alias not in slots:
+            slots[alias] = threading.BoundedSemaphore(size)
+        return slots[alias]
+
+
+class PersistentConnectionMixin:
+    """
+    Database wrapper behaviour for the production serving mode, configured by
+    these keys of the DATABASES entry:
+
+    CONN_MAX_AGE         Django's own: connections are kept between requests
+                         and recycled once they are this many seconds old.
+    CONN_HEALTH_CHECKS   a connection kept from an earlier request is checked
+                         with a cheap query before its first use in the next
+                         one, and replaced if the server dropped it.
+    CONN_MAX_PER_WORKER  at most this many connections are open at once in
+                         the process; a thread waits up to CONN_WAIT_TIMEOUT
+                         seconds for one of them to be closed.
+    """
+    health_check_done = False
+    slot = None
+
+    def connect(self):
+        self.acquireSlot()
+        try:
+            super().connect()
+        except Exception:
+            self.releaseSlot()
+            raise
+        # a connection that was just opened needs no check
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if self.connection is not None and not self.health_check_done:
+            self.health_check_done = True
+            if (self.settings_dict.get('CONN_HEALTH_CHECKS') and not self.in_atomic_block
+                    and not self.is_usable()):
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # runs when a request starts and finishes
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            # a connection closed inside atomic() keeps its slot until the
+            # block exits and a new connection is made in its place
+            if self.connection is None:
+                self.releaseSlot()
+
+    def acquireSlot(self):
+        size = self.settings_dict.get('CONN_MAX_PER_WORKER')
+        if not size or self.slot is not None:
+            return
+
+        semaphore = getSlots(self.alias, size)
+        if not semaphore.acquire(timeout=self.settings_dict.get('CONN_WAIT_TIMEOUT', 10)):
+            raise OperationalError(
+                "Connection Error: all {} connections to database '{}' are in use.".format(size, self.alias))
+        # wrappers are per thread, so a thread that ends without closing its
+        # connection gives the slot back when its wrapper is collected
+        self.slot = weakref.finalize(self, semaphore.release)
+
+    def releaseSlot(self):
+        if self.slot is not None:
+            self.slot()
+            self.slot = None
@@ -56,6 +56,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so the time of every other middleware is included
+    'projects.metrics.metricsMiddleware',
+    'projects.profiling.profilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,12 +94,17 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 
 DATABASES = {
    'default': {
-       'ENGINE': 'django.db.backends.postgresql',
+       'ENGINE': 'myproject.db.postgresql',
        'NAME': 'python',
        'USER': 'python',
        'PASSWORD': 'python',
        'HOST': '10.109.178.43',
        'PORT': '5432',
+       # see myproject/db/persistent.py; gunicorn.conf.py turns on
+       # persistent connections for the production serving mode
+       'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+       'CONN_HEALTH_CHECKS': True,
+       'CONN_MAX_PER_WORKER': int(os.environ.get('DB_MAX_CONNECTIONS_PER_WORKER', 0)),
    }
 }
 
@@ -141,3 +149,136 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Pagination
+# Issue lists are paginated with an opaque (creation_date, id) cursor; clients
+# may ask for a different page size with ?page_size= up to the maximum below.
+
+ISSUE_PAGE_SIZE = 50
+
+ISSUE_MAX_PAGE_SIZE = 500
+
+
+# Streaming
+# List endpoints called with ?stream=true read rows through a chunked cursor
+# and stream them, this many rows at a time.
+
+STREAM_CHUNK_SIZE = 2000
+
+
+# Caching
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Project-scoped read responses are cached in the 'responses' cache under a
+# per-project version that every write bumps. Local memory evicts the least
+# recently used entries once MAX_ENTRIES is reached; it is per process, so
+# multi-worker deployments should set RESPONSE_CACHE_DIR to share a
+# file-based cache between workers instead.
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+RESPONSE_CACHE_TIMEOUT = 300
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+if os.environ.get('RESPONSE_CACHE_DIR'):
+    CACHES[RESPONSE_CACHE_ALIAS] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['RESPONSE_CACHE_DIR'],
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+
+# Project membership cache
+# Each worker process keeps up to MEMBERSHIP_CACHE_SIZE users' active flag and
+# project ids for the assignment and watcher checks. Changes made through
+# this process are seen at once; changes made by other workers after at most
+# MEMBERSHIP_CACHE_TIMEOUT seconds.
+
+MEMBERSHIP_CACHE_SIZE = 10000
+
+MEMBERSHIP_CACHE_TIMEOUT = 60
+
+
+# Full-text search
+# /issues/fulltext ranks at most this many matches of a query, the newest
+# ones; a query matching more issues returns the best of those.
+
+FULLTEXT_MAX_CANDIDATES = 5000
+
+
+# Request metrics
+# Every request's wall time, SQL time and SQL count are aggregated per route
+# into histograms with these bucket bounds (seconds and queries), served at
+# /metrics in the Prometheus text format. Each worker process keeps its own;
+# with METRICS_DIR set, processes share them through files in that directory,
+# written every METRICS_FLUSH_INTERVAL seconds, and /metrics serves
+# the sum of all of them. gunicorn.conf.py sets it.
+
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+
+
+# Request profiling
+# With PROFILING_DIR set, a request carrying an "X-Profile: <PROFILING_TOKEN>"
+# header, or a random PROFILING_SAMPLE_RATE fraction of all requests, is run
+# under cProfile; the profile and a summary of it are written to
+# PROFILING_DIR. Leave PROFILING_TOKEN unset to disable the header.
+
+PROFILING_DIR = os.environ.get('PROFILING_DIR')
+
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+
+PROFILING_TOP_FUNCTIONS = 30
+
+
+# Change log
+# Every write is recorded in an append-only change log; clients sync from
+# /changes?since=<cursor>, this many entries per page by default and at most
+# CHANGES_MAX_PAGE_SIZE.
+
+CHANGES_PAGE_SIZE = 500
+
+CHANGES_MAX_PAGE_SIZE = 5000
+
+
+# Background jobs
+# Side effects that need not hold up the request, such as notifying watchers,
+# are queued as Job rows in the same transaction as the write and run by
+# `manage.py runjobs` on JOBS_THREADS threads, JOBS_BATCH_SIZE jobs of a kind
+# at a time. A job failing is retried up to JOBS_MAX_ATTEMPTS times, after
+# JOBS_RETRY_DELAY seconds doubling with each attempt up to
+# JOBS_MAX_RETRY_DELAY; one claimed by a worker that stops responding is
+# taken over by another after JOBS_VISIBILITY_TIMEOUT seconds.
+
+JOBS_THREADS = 4
+
+JOBS_BATCH_SIZE = 50
+
+JOBS_MAX_ATTEMPTS = 5
+
+JOBS_RETRY_DELAY = 5
+
+JOBS_MAX_RETRY_DELAY = 600
+
+JOBS_VISIBILITY_TIMEOUT = 60
+
+JOBS_POLL_INTERVAL = 1
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Project, User, Issue, Label, Sprint, Comment
+from .models import Project, User, Issue, Label, Sprint, Comment, ProjectIssueCount, SprintIssueCount, ImportCheckpoint, Job
 
 admin.site.register(Project)
 admin.site.register(User)
@@ -8,6 +8,10 @@ admin.site.register(Issue)
 admin.site.register(Label)
 admin.site.register(Sprint)
 admin.site.register(Comment)
+admin.site.register(ProjectIssueCount)
+admin.site.register(SprintIssueCount)
 
 
 
+admin.site.register(ImportCheckpoint)
+admin.site.register(Job)
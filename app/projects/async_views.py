@@ -0,0 +1,119 @@
+'''
+Async read endpoints, served natively by the ASGI application in
+myproject/asgi.py and mounted under async/ with the same paths as their
+synchronous counterparts.
+
+Django 4.0 has no async QuerySet methods yet, so each ORM call is awaited
+through sync_to_async, which is what the async ORM interface of later
+releases does. Under ASGI every request gets its own thread for these calls,
+so a slow query only holds up its own request instead of a worker.
+'''
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotFound
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Project, Issue, Comment
+from .pagination import KeysetPagination
+from .rowserializers import getRowSerializer
+from .search import SearchError, compileSearch, facetCounts, parseFacets
+from .serializers import IssueSerializer, CommentSerializer
+from .views import safeGet
+
+
+def asyncGet(view):
+    # django.views.decorators.http does not support async views before 5.0
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@asyncGet
+async def issueList(request):
+    return await paginatedIssues(request, Issue.objects.all())
+
+
+@asyncGet
+async def projectIssues(request, pk):
+    # check if project exists
+    project = await sync_to_async(safeGet)(pk, Project)
+    if type(project) == HttpResponseNotFound:
+        return project
+
+    return await paginatedIssues(request, Issue.objects.filter(project=pk))
+
+
+@asyncGet
+async def userIssues(request, pk):
+    return await paginatedIssues(request, Issue.objects.filter(assignee=pk))
+
+
+@asyncGet
+async def issueDetail(request, pk):
+    rows = await sync_to_async(getRowSerializer(IssueSerializer).serialize)(Issue.objects.filter(pk=pk))
+    if not rows:
+        return renderJson({"detail": "Not found."}, status=404)
+    return renderJson(rows[0])
+
+
+@asyncGet
+async def issueComments(request, pid, iid):
+    # check if project exists
+    project = await sync_to_async(safeGet)(pid, Project)
+    if type(project) == HttpResponseNotFound:
+        return project
+
+    # check if issue exists
+    issue = await sync_to_async(safeGet)(iid, Issue)
+    if type(issue) == HttpResponseNotFound:
+        return issue
+
+    comments = Comment.objects.filter(issue=iid)
+    rows = await sync_to_async(getRowSerializer(CommentSerializer).serialize)(comments)
+    return renderJson(rows)
+
+
+@asyncGet
+async def searchIssues(request):
+    params = asRestRequest(request).query_params
+    try:
+        predicate = compileSearch(params)
+        facets = parseFacets(params)
+    except SearchError as error:
+        return HttpResponseBadRequest(str(error))
+
+    return await paginatedIssues(request, Issue.objects.filter(predicate), facets)
+
+
+'''
+helper functions
+'''
+async def paginatedIssues(request, issues, facets=None):
+    paginator = KeysetPagination()
+    try:
+        page = paginator.paginate_queryset(issues, asRestRequest(request))
+    except NotFound as error:
+        return renderJson({"detail": error.detail}, status=404)
+
+    rows = await sync_to_async(getRowSerializer(IssueSerializer).serialize)(page)
+    data = paginator.getPaginatedData(rows)
+    if facets and facets[0]:
+        data["facets"] = await sync_to_async(facetCounts)(issues, *facets)
+    return renderJson(data)
+
+
+def asRestRequest(request):
+    # gives access to query_params and parsed bodies, as in the DRF views
+    parsers = [parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]
+    return Request(request, parsers=parsers)
+
+
+def renderJson(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type=JSONRenderer.media_type, status=status)
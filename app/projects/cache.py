@@ -0,0 +1,132 @@
+import hashlib
+import time
+from functools import wraps
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from .streaming import wantsStream
+
+
+class ResponseCache:
+    """
+    Caches serialized response data under a per-scope version number.
+
+    A scope is either one project ("project:<pk>") or a global list such as
+    "sprints" or "labels". Writes bump the version of every scope they touch
+    instead of deleting entries: entries stored under an old version are never
+    read again and age out of the backend (LRU for local memory, timeout for
+    the file backend), which is configured under CACHES[RESPONSE_CACHE_ALIAS].
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def getVersion(self, scope):
+        key = 'version:{}'.format(scope)
+        version = self.backend.get(key)
+        if version is None:
+            # versions start from the clock, so a version that was evicted can
+            # never come back as a number old entries were stored under
+            self.backend.add(key, time.time_ns(), timeout=None)
+            version = self.backend.get(key)
+        return version
+
+    def bump(self, scope):
+        key = 'version:{}'.format(scope)
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.add(key, time.time_ns(), timeout=None)
+
+    def bumpOnWrite(self, *scopes):
+        """
+        Bumps now, so later reads in this transaction miss, and again once the
+        transaction commits, so nothing read before the commit stays cached.
+        """
+        scopes = set(scope for scope in scopes if scope)
+
+        def bumpAll():
+            for scope in scopes:
+                self.bump(scope)
+
+        bumpAll()
+        transaction.on_commit(bumpAll)
+
+    def makeKey(self, scope, request):
+        # the version is read before the response is built, so a write that
+        # lands meanwhile leaves the entry under a version nobody reads
+        url = request.build_absolute_uri()
+        digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+        return 'response:{}:{}:{}'.format(scope, self.getVersion(scope), digest)
+
+    def get(self, key):
+        data = self.backend.get(key)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.backend.set(key, data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+            }
+
+
+responseCache = ResponseCache(settings.RESPONSE_CACHE_ALIAS)
+
+
+def projectScope(project_id):
+    if project_id is None:
+        return None
+    return 'project:{}'.format(project_id)
+
+
+def cachedResponse(getScope):
+    """
+    Decorates a read-only view method so its response data is served from
+    responseCache while the scope returned by getScope(view, request, **kwargs)
+    is unchanged. A scope of None skips the cache.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            scope = None
+            if not wantsStream(request):
+                scope = getScope(view, request, *args, **kwargs)
+            if scope is None:
+                return method(view, request, *args, **kwargs)
+
+            key = responseCache.makeKey(scope, request)
+            data = responseCache.get(key)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = method(view, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                responseCache.set(key, response.data)
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,148 @@
+'''
+The append-only change log clients sync from.
+
+Every write of a project, user, label, sprint, issue or comment adds Change
+entries in its own transaction: through the model signals (see signals.py)
+for save(), delete() and many-to-many add, remove and clear, and explicitly
+from the set-based UPDATEs and bulk inserts that bypass them (transitions.py,
+the bulk views, importer.py). An entry names the row and holds the values
+the write set, by column name:
+
+  created   every column of the new row
+  updated   the columns whose value changed
+  deleted   nothing
+  added     ids linked to the row, e.g. {"labels": [3]}
+  removed   ids unlinked from it
+
+The log is read in (txid, id) order past a cursor, so a sync reads only what
+was written since the last one, however large the project. On Postgres ids
+are drawn before commit, so an entry with a lower id can commit after a
+reader went past it; txid is the writing transaction's id instead, and only
+entries of transactions older than every one still running are read, which
+makes sure each entry is read exactly once. Other databases serialize
+writers, and txid stays 0.
+'''
+from django.db import connection
+from django.db.models import BigIntegerField, Func
+from django.db.models.expressions import RawSQL
+
+from .models import Project, Sprint, Issue, Comment, Change
+from .notifications import notifyWatchers
+
+
+class CurrentTransaction(Func):
+    template = '0'
+    output_field = BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='txid_current()', **extra_context)
+
+
+def entry(model, pk, project_id, action, data=None):
+    return Change(
+        project_id=project_id,
+        entity=model._meta.model_name,
+        entity_id=pk,
+        action=action,
+        data=data or {},
+        txid=CurrentTransaction(),
+    )
+
+
+def logChanges(entries, notify=True):
+    # one INSERT however many rows a write touched, and one for the job
+    # notifying the watchers of the issues among them
+    if entries:
+        Change.objects.bulk_create(entries)
+        if notify:
+            notifyWatchers(entries)
+
+
+def rowData(instance, fields=None):
+    # the values of the columns written, all of them unless fields says otherwise
+    data = {}
+    for field in instance._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if fields is None or field.name in fields or field.attname in fields:
+            data[field.attname] = field.value_from_object(instance)
+    return data
+
+
+def changedData(instance, fields=None):
+    """
+    The values of the columns a save wrote, limited to fields if given, that
+    differ from the ones last loaded or saved; empty if only auto_now columns
+    did. Every column written counts for instances never loaded.
+    """
+    data = rowData(instance, fields)
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return data
+    changed = dict((name, value) for name, value in data.items() if name not in loaded or loaded[name] != value)
+    touched = set(field.attname for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False))
+    if set(changed) <= touched:
+        return {}
+    return changed
+
+
+def projectOf(instance):
+    if isinstance(instance, Project):
+        return instance.pk
+    if isinstance(instance, (Sprint, Issue)):
+        return instance.project_id
+    if isinstance(instance, Comment):
+        if Comment.issue.is_cached(instance):
+            return instance.issue.project_id
+        return Issue.objects.filter(pk=instance.issue_id).values_list('project_id', flat=True).first()
+    # users and labels belong to no project
+    return None
+
+
+def linkChanges(field, action, pairs, project_ids=None):
+    """
+    Entries for links of a many-to-many field added or removed, one per row
+    on the field's side; pairs are (row id, linked id). project_ids maps the
+    row ids to their projects, and is looked up for issues if not given.
+    """
+    linked = {}
+    for pk, linked_id in pairs:
+        linked.setdefault(pk, []).append(linked_id)
+    if project_ids is None:
+        project_ids = {}
+        if field.model is Issue:
+            project_ids = dict(Issue.objects.filter(id__in=list(linked)).values_list('id', 'project_id'))
+    return [
+        entry(field.model, pk, project_ids.get(pk), action, {field.name: sorted(ids)})
+        for pk, ids in sorted(linked.items())
+    ]
+
+
+def changesAfter(position, limit, project_id=None):
+    """
+    Up to limit entries past position, a (txid, id) pair or None for the
+    start of the log, in the order they were written.
+    """
+    changes = Change.objects.order_by('txid', 'id')
+    if project_id is not None:
+        changes = changes.filter(project_id=project_id)
+    if position is not None:
+        txid, pk = position
+        changes = changes.filter(txid__gte=txid).exclude(txid=txid, id__lte=pk)
+    if connection.vendor == 'postgresql':
+        # entries of transactions still running, or started after them, may
+        # be joined by entries that sort before them; wait for those
+        changes = changes.filter(txid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+    return list(changes[:limit])
+
+
+def changeRow(change):
+    return {
+        "id": change.id,
+        "project": change.project_id,
+        "entity": change.entity,
+        "entity_id": change.entity_id,
+        "action": change.action,
+        "data": change.data,
+        "created_at": change.created_at,
+    }
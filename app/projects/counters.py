@@ -0,0 +1,119 @@
+import collections
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Issue, ProjectIssueCount, SprintIssueCount
+
+
+def moveIssueCounts(issue_ids, source_sprint_id, target_sprint_id):
+    """
+    Shifts the sprint counters for issues that a set-based UPDATE moves from
+    one sprint to another; one adjustment per (status, type) group.
+    """
+    if source_sprint_id == target_sprint_id:
+        return
+    groups = (Issue.objects
+                .filter(id__in=issue_ids)
+                .values_list('status', 'type')
+                .annotate(total=Count('id'))
+                .order_by())
+    for status, type, total in groups:
+        SprintIssueCount.adjust(source_sprint_id, status, type, -total)
+        SprintIssueCount.adjust(target_sprint_id, status, type, total)
+
+
+def statusChangeCounts(rows, old_status, new_status):
+    """
+    Shifts the counters for issues that a set-based UPDATE moved from
+    old_status to new_status; rows are their (project_id, sprint_id, type).
+    """
+    for index, Counter in ((0, ProjectIssueCount), (1, SprintIssueCount)):
+        groups = collections.Counter((row[index], row[2]) for row in rows)
+        for (owner_id, type), total in groups.items():
+            Counter.adjust(owner_id, old_status, type, -total)
+            Counter.adjust(owner_id, new_status, type, total)
+
+
+def addIssueCounts(rows):
+    """
+    Counts issues inserted without Issue.save(), as bulk_create does; rows are
+    their Issue.countKey() tuples. One adjustment per counter row touched.
+    """
+    for index, Counter in ((0, ProjectIssueCount), (1, SprintIssueCount)):
+        groups = collections.Counter((row[index], row[2], row[3]) for row in rows)
+        for (owner_id, status, type), total in groups.items():
+            Counter.adjust(owner_id, status, type, total)
+
+
+def projectSummary(project_id):
+    """
+    Issue counts of a project and each of its sprints, read from the counter
+    tables: the cost depends on the number of statuses and types, not issues.
+    """
+    summary = summarize(ProjectIssueCount.objects.filter(project=project_id).values_list('status', 'type', 'count'))
+    summary["sprints"] = []
+
+    counts = (SprintIssueCount.objects
+                .filter(sprint__project=project_id)
+                .order_by('sprint_id')
+                .values_list('sprint_id', 'status', 'type', 'count'))
+    sprints = {}
+    for sprint_id, status, type, count in counts:
+        sprints.setdefault(sprint_id, []).append((status, type, count))
+    for sprint_id, rows in sprints.items():
+        sprint = summarize(rows)
+        if sprint["total"]:
+            summary["sprints"].append(dict(sprint=sprint_id, **sprint))
+    return summary
+
+
+def summarize(rows):
+    by_status = dict.fromkeys(Issue.statusList, 0)
+    by_type = {}
+    total = 0
+    for status, type, count in rows:
+        if not count:
+            continue
+        by_status[status] = by_status.get(status, 0) + count
+        by_type[type] = by_type.get(type, 0) + count
+        total += count
+    return {"total": total, "status": by_status, "type": by_type}
+
+
+def rebuildCounts(project_ids=None):
+    """
+    Recomputes the counters of the given projects (all by default) from the
+    issues table and returns how many counter rows were wrong or missing.
+    """
+    issues = Issue.objects.all()
+    project_counters = ProjectIssueCount.objects.all()
+    sprint_counters = SprintIssueCount.objects.all()
+    if project_ids is not None:
+        issues = issues.filter(project__in=project_ids)
+        project_counters = project_counters.filter(project__in=project_ids)
+        sprint_counters = sprint_counters.filter(sprint__project__in=project_ids)
+
+    corrected = 0
+    with transaction.atomic():
+        for owner, Counter, counters in (('project_id', ProjectIssueCount, project_counters),
+                                         ('sprint_id', SprintIssueCount, sprint_counters)):
+            actual = {}
+            for owner_id, status, type, total in (issues
+                                                    .values_list(owner, 'status', 'type')
+                                                    .annotate(total=Count('id'))
+                                                    .order_by()):
+                actual[(owner_id, status, type)] = total
+
+            stored = {}
+            for owner_id, status, type, count in counters.values_list(owner, 'status', 'type', 'count'):
+                stored[(owner_id, status, type)] = count
+
+            corrected += sum(1 for key in set(actual) | set(stored) if actual.get(key, 0) != stored.get(key, 0))
+
+            counters.delete()
+            Counter.objects.bulk_create([
+                Counter(**{owner: owner_id, 'status': status, 'type': type, 'count': total})
+                for (owner_id, status, type), total in actual.items()
+            ])
+    return corrected
@@ -0,0 +1,63 @@
+import hashlib
+
+from django.db.models import Count, Max
+
+from .models import Project, Issue, Sprint
+
+
+'''
+ETag functions for django.views.decorators.http.condition
+
+Each one derives the ETag from a cheap aggregate over updated_at instead of
+the serialized body, so an unchanged resource is answered with a 304 before
+the view runs its query. None means the resource does not exist and the view
+should run (and return its 404) as usual.
+'''
+def makeEtag(request, *state):
+    # the full path keeps pages, page sizes and stream mode apart
+    token = "|".join([request.get_full_path()] + [str(part) for part in state])
+    return hashlib.md5(token.encode('utf-8')).hexdigest()
+
+
+def projectEtag(request, pk, **kwargs):
+    updated = Project.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated is None:
+        return None
+    return makeEtag(request, updated)
+
+
+def projectIssuesEtag(request, pk, **kwargs):
+    # deleted issues lower the count, any other issue write raises the max
+    state = (Project.objects
+                .filter(pk=pk)
+                .annotate(last=Max('issue__updated_at'), count=Count('issue'))
+                .values_list('last', 'count')
+                .first())
+    if state is None:
+        return None
+    return makeEtag(request, *state)
+
+
+def issueEtag(request, pk, **kwargs):
+    updated = Issue.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated is None:
+        return None
+    return makeEtag(request, updated)
+
+
+def issueCommentsEtag(request, pid, iid, **kwargs):
+    state = (Issue.objects
+                .filter(pk=iid)
+                .annotate(last=Max('comment__updated_at'), count=Count('comment'))
+                .values_list('last', 'count')
+                .first())
+    if state is None:
+        return None
+    return makeEtag(request, *state)
+
+
+def sprintEtag(request, pk, **kwargs):
+    updated = Sprint.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated is None:
+        return None
+    return makeEtag(request, updated)
@@ -0,0 +1,103 @@
+'''
+Bulk export of a project's issues, with their labels, watchers and comments
+inlined, as newline-delimited JSON or CSV.
+
+Issues are read through a chunked (server-side on Postgres) cursor; labels,
+watchers and comments are fetched with one query each per chunk, so an export
+issues a fixed number of queries per STREAM_CHUNK_SIZE issues and holds at
+most one chunk in memory however large the project is.
+'''
+import csv
+
+from django.conf import settings
+
+from .models import Issue, Comment
+from .rowserializers import getRowSerializer
+from .serializers import IssueSerializer, CommentSerializer
+from .streaming import jsonEncoder
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def exportRows(project_id, chunk_size=None):
+    """
+    Yields the issues of a project, oldest first, as IssueSerializer rows with
+    a "comments" list of CommentSerializer rows added.
+    """
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    issues = Issue.objects.filter(project=project_id).order_by('id')
+    chunk = []
+    for row in getRowSerializer(IssueSerializer).iterate(issues, chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from withComments(chunk)
+            chunk = []
+    if chunk:
+        yield from withComments(chunk)
+
+
+def withComments(rows):
+    comments = {}
+    issue_comments = Comment.objects.filter(issue__in=[row["id"] for row in rows]).order_by('id')
+    for comment in getRowSerializer(CommentSerializer).serialize(issue_comments):
+        comments.setdefault(comment["issue"], []).append(comment)
+    for row in rows:
+        row["comments"] = comments.get(row["id"], [])
+    return rows
+
+
+def exportColumns():
+    return [name for name, _, _ in getRowSerializer(IssueSerializer).fields] + ["comments"]
+
+
+def renderExport(rows, output, chunk_size=None):
+    """
+    Renders rows in the given output format, yielding one bytes chunk per
+    chunk_size rows.
+    """
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    render = renderCsvLines if output == 'csv' else renderJsonLines
+    lines = []
+    for line in render(rows):
+        lines.append(line)
+        if len(lines) == chunk_size:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def renderJsonLines(rows):
+    encoder = jsonEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class LineBuffer:
+    # csv.writer only writes to files; this one hands the line back instead
+    def write(self, line):
+        return line
+
+
+def renderCsvLines(rows):
+    # relations become ';'-separated ids, comments a JSON list
+    columns = exportColumns()
+    encoder = jsonEncoder()
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(columns)
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row[column]
+            if column == "comments":
+                value = encoder.encode(value)
+            elif isinstance(value, list):
+                value = ';'.join(str(item) for item in value)
+            elif value is None:
+                value = ''
+            values.append(value)
+        yield writer.writerow(values)
@@ -0,0 +1,180 @@
+'''
+Full-text search over issue summaries, descriptions and comment text.
+
+Each issue has an IssueDocument holding the three texts, rewritten by
+indexIssues() whenever one of them changes (see signals.py). On Postgres the
+document also carries a weighted tsvector behind a GIN index, and matches are
+ranked by ts_rank. Other databases, used for local and test runs, get a
+pure-Python inverted index instead: the same tokens are stored as IssueTerm
+postings and ranked in Python with the same field weights.
+
+Both backends match issues containing every word of the query and return
+them best first, keyed on (rank, id) for RankPagination. Only the newest
+FULLTEXT_MAX_CANDIDATES matches are ranked, so that a query for a common word
+costs a top-N pass over the matching ids rather than a ranking of every
+document containing it; older matches of such a query are not returned.
+'''
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Round
+
+from .models import Issue, Comment, IssueDocument, IssueTerm
+
+
+SEARCH_CONFIG = 'english'
+
+# document field -> tsvector weight label and the weight ts_rank gives it
+FIELD_WEIGHTS = (
+    ('title', 'A', 1.0),
+    ('body', 'B', 0.4),
+    ('comments', 'C', 0.2),
+)
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were', 'will', 'with',
+))
+
+
+def usesVector():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    tokens = []
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        # fold simple plurals, as the english stemmer does
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word[:64])
+    return tokens
+
+
+'''
+indexing
+'''
+def indexIssues(issue_ids):
+    """
+    Rewrites the documents of the given issues from their current summary,
+    description and comments; ids of deleted issues are dropped.
+    """
+    issue_ids = list(set(issue_ids))
+    if not issue_ids:
+        return
+
+    comments = defaultdict(list)
+    for issue_id, text in (Comment.objects
+                            .filter(issue_id__in=issue_ids)
+                            .order_by('id')
+                            .values_list('issue_id', 'text')):
+        comments[issue_id].append(text)
+    documents = [
+        IssueDocument(issue_id=pk, title=summary, body=desc, comments="\n".join(comments[pk]))
+        for pk, summary, desc in Issue.objects.filter(id__in=issue_ids).values_list('id', 'summary', 'desc')
+    ]
+
+    with transaction.atomic():
+        IssueDocument.objects.filter(issue_id__in=issue_ids).delete()
+        IssueDocument.objects.bulk_create(documents)
+        if usesVector():
+            vector = None
+            for field, label, _ in FIELD_WEIGHTS:
+                part = SearchVector(field, weight=label, config=SEARCH_CONFIG)
+                vector = part if vector is None else vector + part
+            IssueDocument.objects.filter(issue_id__in=issue_ids).update(vector=vector)
+        else:
+            IssueTerm.objects.filter(issue_id__in=issue_ids).delete()
+            IssueTerm.objects.bulk_create([
+                IssueTerm(issue_id=document.issue_id, term=term, weight=weight)
+                for document in documents
+                for term, weight in termWeights(document).items()
+            ])
+
+
+def termWeights(document):
+    weights = defaultdict(float)
+    for field, _, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(document, field)):
+            weights[term] += weight
+    return weights
+
+
+def rebuildIndex(batch_size=5000, issues=None):
+    """
+    Indexes every issue (or those of the given queryset) in batches; returns
+    the number indexed.
+    """
+    issues = Issue.objects.all() if issues is None else issues
+    issue_ids = list(issues.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(issue_ids), batch_size):
+        indexIssues(issue_ids[start:start + batch_size])
+    return len(issue_ids)
+
+
+'''
+querying
+'''
+def rankedMatches(text, position=None, limit=50, project=None):
+    """
+    Returns up to limit (issue id, rank) pairs matching every word of text,
+    best first, starting after position, a (rank, id) pair from the cursor.
+    """
+    if usesVector():
+        return vectorMatches(text, position, limit, project)
+    return termMatches(text, position, limit, project)
+
+
+def vectorMatches(text, position, limit, project):
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    # ts_rank is a float4, which the cursor's float would not compare equal
+    # to; rounded in SQL as termMatches() rounds, a rank read back from a
+    # cursor finds its own row again
+    rank = Cast(Round(SearchRank(F('vector'), query), 6), FloatField())
+    candidates = IssueDocument.objects.filter(vector=query)
+    if project is not None:
+        candidates = candidates.filter(issue__project=project)
+    # ts_rank reads each document's whole vector, so it only sees the newest
+    # matches; picking them needs nothing but the GIN index and the ids
+    candidates = candidates.order_by('-issue_id').values('issue_id')[:settings.FULLTEXT_MAX_CANDIDATES]
+    documents = IssueDocument.objects.filter(issue_id__in=candidates).annotate(rank=rank)
+    if position is not None:
+        rank, pk = position
+        documents = documents.filter(Q(rank__lt=rank) | Q(rank=rank, issue_id__lt=pk))
+    return list(documents.order_by('-rank', '-issue_id').values_list('issue_id', 'rank')[:limit])
+
+
+def termMatches(text, position, limit, project):
+    terms = list(dict.fromkeys(tokenize(text)))
+    if not terms:
+        return []
+
+    postings = IssueTerm.objects.filter(term__in=terms)
+    if project is not None:
+        postings = postings.filter(issue__project=project)
+    postings = list(postings.values_list('term', 'issue_id', 'weight'))
+
+    # weight every occurrence by how rare its term is across documents
+    documents = IssueDocument.objects.count() or 1
+    frequency = Counter(term for term, _, _ in postings)
+    scores = defaultdict(float)
+    matched = Counter()
+    for term, issue_id, weight in postings:
+        scores[issue_id] += weight * math.log(1 + documents / frequency[term])
+        matched[issue_id] += 1
+
+    # the newest matches only, as vectorMatches() ranks
+    candidates = sorted((issue_id for issue_id in scores if matched[issue_id] == len(terms)), reverse=True)
+    ranked = sorted(
+        ((round(scores[issue_id], 6), issue_id) for issue_id in candidates[:settings.FULLTEXT_MAX_CANDIDATES]),
+        reverse=True)
+    if position is not None:
+        ranked = [match for match in ranked if match < tuple(position)]
+    return [(issue_id, rank) for rank, issue_id in ranked[:limit]]
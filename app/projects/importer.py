@@ -0,0 +1,340 @@
+'''
+Bulk import of projects, users, labels, sprints, issues and comments from
+another tracker, used by the importissues command.
+
+Records are read from NDJSON or CSV, each naming its kind and the id it had
+in the old tracker; references between records use those ids. A batch of
+records is written in one transaction: rows of each kind with one bulk
+insert, in dependency order, then the many-to-many links straight into the
+through tables. The legacy id -> row id maps are kept in memory, backed by
+ImportMapping so a resumed import can still resolve what it imported before,
+and the ImportCheckpoint row commits with the batch, so a rerun picks up
+right after the last committed batch.
+
+bulk_create() skips Issue.save() and the model signals, so issue counters,
+full-text documents, cached responses and the change log are updated here
+per batch.
+'''
+import csv
+import json
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import projectScope, responseCache
+from .changes import entry, linkChanges, logChanges, rowData
+from .counters import addIssueCounts
+from .fulltext import indexIssues
+from .membership import membershipCache
+from .models import Project, User, Label, Sprint, Issue, Comment, ImportMapping
+
+
+# kinds in the order a batch inserts them, so references resolve within it
+IMPORT_ORDER = ('project', 'user', 'label', 'sprint', 'issue', 'comment')
+
+# kinds other records refer to, whose legacy ids are mapped
+MAPPED_KINDS = ('project', 'user', 'label', 'sprint', 'issue')
+
+# record fields holding legacy ids of each mapped kind
+REFERENCES = {
+    'project': ('project', 'projects'),
+    'user': ('assignee', 'watchers', 'user'),
+    'label': ('labels',),
+    'sprint': ('sprint',),
+    'issue': ('issue',),
+}
+
+# ids looked up in ImportMapping per query
+LOOKUP_SIZE = 500
+
+
+class ImportDataError(Exception):
+    pass
+
+
+def readRecords(path, output, kind=None):
+    """
+    Yields the records of an NDJSON or CSV file as dicts. In CSV files
+    many-to-many columns hold ';'-separated ids and, if the file has no kind
+    column, every record is of the given kind.
+    """
+    with open(path, newline='') as file:
+        if output == 'csv':
+            for record in csv.DictReader(file):
+                if kind and not record.get('kind'):
+                    record['kind'] = kind
+                yield record
+            return
+
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise ImportDataError("Line {}: {}".format(number, error))
+            if kind and not record.get('kind'):
+                record['kind'] = kind
+            yield record
+
+
+class Importer:
+
+    def __init__(self, source, batch_size=5000, index=True):
+        self.source = source
+        self.batch_size = batch_size
+        self.index = index
+        self.maps = dict((kind, {}) for kind in MAPPED_KINDS)
+        self.imported = Counter()
+        self.truncated = 0
+
+    def run(self, records, checkpoint, progress=None):
+        """
+        Imports the records after the first checkpoint.records, one batch
+        per transaction; progress(checkpoint) is called after every batch.
+        """
+        batch = []
+        for number, record in enumerate(records, 1):
+            if number <= checkpoint.records:
+                continue
+            batch.append((number, record))
+            if len(batch) == self.batch_size:
+                self.importBatch(batch, checkpoint)
+                batch = []
+                if progress:
+                    progress(checkpoint)
+        if batch:
+            self.importBatch(batch, checkpoint)
+            if progress:
+                progress(checkpoint)
+
+    def importBatch(self, batch, checkpoint):
+        kinds = dict((kind, []) for kind in IMPORT_ORDER)
+        for number, record in batch:
+            kind = record.get('kind')
+            if kind not in kinds:
+                raise ImportDataError("Record {}: unknown kind '{}'".format(number, kind))
+            kinds[kind].append((number, record))
+
+        self.preload(batch)
+        try:
+            with transaction.atomic():
+                self.scopes = set()
+                self.written = set()
+                self.changes = []
+                for kind in IMPORT_ORDER:
+                    if kinds[kind]:
+                        getattr(self, 'import' + kind.capitalize() + 's')(kinds[kind])
+                # issues written or commented on in this batch, indexed once
+                if self.index:
+                    indexIssues(self.written)
+                # imported history is not news to anyone watching
+                logChanges(self.changes, notify=False)
+                responseCache.bumpOnWrite(*self.scopes)
+
+                checkpoint.records = batch[-1][0]
+                checkpoint.save()
+        except IntegrityError as error:
+            raise ImportDataError("Records {}-{}: {}".format(batch[0][0], batch[-1][0], error))
+
+    '''
+    one method per kind
+    '''
+    def importProjects(self, records):
+        projects = [
+            Project(name=self.text(record, Project, 'name'), desc=self.text(record, Project, 'desc'))
+            for _, record in records
+        ]
+        self.insert('project', records, projects)
+        self.logCreated(projects, dict((project.pk, project.pk) for project in projects))
+
+    def importUsers(self, records):
+        users = [
+            User(name=self.text(record, User, 'name'), active=boolValue(record.get('active', True)))
+            for _, record in records
+        ]
+        self.insert('user', records, users)
+        self.logCreated(users)
+
+        links = []
+        for (number, record), user in zip(records, users):
+            for project_id in self.resolve(number, 'project', listValue(record.get('projects'))):
+                links.append(User.projects.through(user_id=user.pk, project_id=project_id))
+        User.projects.through.objects.bulk_create(links, ignore_conflicts=True)
+        self.changes.extend(linkChanges(User.projects.field, 'added', [(link.user_id, link.project_id) for link in links], {}))
+        membershipCache.invalidateOnWrite(*[user.pk for user in users])
+
+    def importLabels(self, records):
+        labels = [Label(value=self.text(record, Label, 'value')) for _, record in records]
+        self.insert('label', records, labels)
+        self.logCreated(labels)
+        self.scopes.add('labels')
+
+    def importSprints(self, records):
+        sprints = []
+        for number, record in records:
+            sprints.append(Sprint(
+                name=self.text(record, Sprint, 'name'),
+                project_id=self.resolveOne(number, 'project', record.get('project')),
+                start_date=dateValue(number, record.get('start_date')),
+                end_date=dateValue(number, record.get('end_date')),
+            ))
+        self.insert('sprint', records, sprints)
+        self.logCreated(sprints, dict((sprint.pk, sprint.project_id) for sprint in sprints))
+        self.scopes.add('sprints')
+        self.scopes.update(projectScope(sprint.project_id) for sprint in sprints)
+
+    def importIssues(self, records):
+        issues = []
+        for number, record in records:
+            status = record.get('status') or 'open'
+            if status not in Issue.statusList:
+                raise ImportDataError("Record {}: status must be one of {}, got '{}'".format(
+                    number, ", ".join(Issue.statusList), status))
+            assignee = record.get('assignee')
+            issues.append(Issue(
+                summary=self.text(record, Issue, 'summary'),
+                desc=self.text(record, Issue, 'desc'),
+                type=self.text(record, Issue, 'type'),
+                status=status,
+                project_id=self.resolveOne(number, 'project', record.get('project')),
+                sprint_id=self.resolveOne(number, 'sprint', record.get('sprint')),
+                assignee_id=self.resolveOne(number, 'user', assignee) if assignee not in (None, '') else None,
+            ))
+        self.insert('issue', records, issues)
+
+        # auto_now_add overwrites creation dates on insert; restore the old ones
+        created = []
+        for (number, record), issue in zip(records, issues):
+            date = dateValue(number, record.get('creation_date'))
+            if date is not None:
+                created.append(When(id=issue.pk, then=Value(date)))
+                issue.creation_date = date
+        if created:
+            Issue.objects.filter(id__in=[issue.pk for issue in issues]).update(
+                creation_date=Case(*created, default='creation_date'))
+        project_ids = dict((issue.pk, issue.project_id) for issue in issues)
+        self.logCreated(issues, project_ids)
+
+        labels = []
+        watchers = []
+        for (number, record), issue in zip(records, issues):
+            for label_id in self.resolve(number, 'label', listValue(record.get('labels'))):
+                labels.append(Issue.labels.through(issue_id=issue.pk, label_id=label_id))
+            for user_id in self.resolve(number, 'user', listValue(record.get('watchers'))):
+                watchers.append(Issue.watchers.through(issue_id=issue.pk, user_id=user_id))
+        Issue.labels.through.objects.bulk_create(labels, ignore_conflicts=True)
+        Issue.watchers.through.objects.bulk_create(watchers, ignore_conflicts=True)
+        self.changes.extend(linkChanges(Issue.labels.field, 'added', [(link.issue_id, link.label_id) for link in labels], project_ids))
+        self.changes.extend(linkChanges(Issue.watchers.field, 'added', [(link.issue_id, link.user_id) for link in watchers], project_ids))
+
+        addIssueCounts([issue.countKey() for issue in issues])
+        self.written.update(issue.pk for issue in issues)
+        self.scopes.update(projectScope(issue.project_id) for issue in issues)
+
+    def importComments(self, records):
+        comments = []
+        for number, record in records:
+            comments.append(Comment(
+                text=self.text(record, Comment, 'text'),
+                user_id=self.resolveOne(number, 'user', record.get('user')),
+                issue_id=self.resolveOne(number, 'issue', record.get('issue')),
+            ))
+        Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+        self.imported['comment'] += len(comments)
+
+        issue_ids = set(comment.issue_id for comment in comments)
+        self.written.update(issue_ids)
+        projects = dict(Issue.objects.filter(id__in=issue_ids).values_list('id', 'project_id'))
+        self.scopes.update(projectScope(project_id) for project_id in set(projects.values()))
+        self.logCreated(comments, dict((comment.pk, projects[comment.issue_id]) for comment in comments))
+
+    '''
+    helper functions
+    '''
+    def insert(self, kind, records, objects):
+        objects[0].__class__.objects.bulk_create(objects, batch_size=self.batch_size)
+        mappings = []
+        for (number, record), obj in zip(records, objects):
+            legacy_id = record.get('id')
+            if legacy_id in (None, ''):
+                raise ImportDataError("Record {}: {} has no id".format(number, kind))
+            mappings.append(ImportMapping(source=self.source, kind=kind, legacy_id=str(legacy_id), object_id=obj.pk))
+            self.maps[kind][str(legacy_id)] = obj.pk
+        ImportMapping.objects.bulk_create(mappings, batch_size=self.batch_size)
+        self.imported[kind] += len(objects)
+
+    def logCreated(self, objects, project_ids=None):
+        # users and labels belong to no project
+        project_ids = project_ids or {}
+        self.changes.extend(entry(obj.__class__, obj.pk, project_ids.get(obj.pk), 'created', rowData(obj)) for obj in objects)
+
+    def preload(self, batch):
+        """
+        Loads the mappings a batch refers to that are not in memory yet, i.e.
+        rows imported by an earlier run of this import, a few queries per kind.
+        """
+        for kind, fields in REFERENCES.items():
+            known = self.maps[kind]
+            missing = set()
+            for _, record in batch:
+                for field in fields:
+                    for legacy_id in listValue(record.get(field)):
+                        if str(legacy_id) not in known:
+                            missing.add(str(legacy_id))
+            missing = list(missing)
+            for start in range(0, len(missing), LOOKUP_SIZE):
+                known.update(ImportMapping.objects
+                                .filter(source=self.source, kind=kind, legacy_id__in=missing[start:start + LOOKUP_SIZE])
+                                .values_list('legacy_id', 'object_id'))
+
+    def resolve(self, number, kind, legacy_ids):
+        legacy_ids = [str(legacy_id) for legacy_id in legacy_ids]
+        known = self.maps[kind]
+        for legacy_id in legacy_ids:
+            if legacy_id not in known:
+                raise ImportDataError("Record {}: unknown {} '{}'".format(number, kind, legacy_id))
+        return [known[legacy_id] for legacy_id in legacy_ids]
+
+    def resolveOne(self, number, kind, legacy_id):
+        if legacy_id in (None, ''):
+            raise ImportDataError("Record {}: {} is required".format(number, kind))
+        return self.resolve(number, kind, [legacy_id])[0]
+
+    def text(self, record, model, field):
+        # longer values than the column holds are cut, and counted
+        value = record.get(field)
+        value = '' if value is None else str(value)
+        max_length = model._meta.get_field(field).max_length
+        if len(value) > max_length:
+            self.truncated += 1
+            value = value[:max_length]
+        return value
+
+
+def listValue(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, list):
+        return value
+    return str(value).split(';')
+
+
+def boolValue(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+
+def dateValue(number, value):
+    if value is None or value == '':
+        return None
+    date = parse_datetime(str(value))
+    if date is None:
+        raise ImportDataError("Record {}: invalid date '{}'".format(number, value))
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
@@ -0,0 +1,176 @@
+'''
+A job queue kept in the database, run by the runjobs command.
+
+enqueue() adds a Job row in the caller's transaction, so a job exists if and
+only if the write that asked for it commits, and needs no broker. A worker
+claims due jobs in one transaction (FOR UPDATE SKIP LOCKED on Postgres, so
+workers never wait on each other's rows), marking them running and due again
+visibility_timeout seconds later, and runs them on a thread pool in batches
+of one kind: the handler registered for the kind gets every payload of the
+batch at once.
+
+A batch commits together with the deletion of its jobs, and only if they are
+still claimed by the worker running it; a batch that fails is rolled back and
+its jobs retried with exponential backoff, up to max_attempts attempts. If a
+worker dies, or takes longer than the visibility timeout, its jobs come due
+again and another worker takes them over; a claim going stale this way
+counts as an attempt, so a job that keeps crashing its worker still fails in
+the end. Handlers should expect to see a payload more than once.
+'''
+import os
+import socket
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+jobHandlers = {}
+
+
+def jobHandler(kind):
+    # registers the function run for jobs of a kind, given a list of payloads
+    def register(function):
+        jobHandlers[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, payload, delay=0):
+    return Job.objects.create(
+        kind=kind,
+        payload=payload,
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def retryDelay(attempts):
+    return min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_MAX_RETRY_DELAY)
+
+
+class ClaimLost(Exception):
+    pass
+
+
+class Worker:
+
+    def __init__(self, name=None, threads=None, batch_size=None, visibility_timeout=None):
+        self.name = name or '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.threads = threads or settings.JOBS_THREADS
+        self.batch_size = batch_size or settings.JOBS_BATCH_SIZE
+        self.visibility_timeout = visibility_timeout or settings.JOBS_VISIBILITY_TIMEOUT
+        self.executor = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+        # SQLite runs one write transaction at a time, and fails one that read
+        # before another wrote instead of waiting, so batches take turns there
+        if connection.features.has_select_for_update_skip_locked:
+            self.transactionLock = nullcontext()
+        else:
+            self.transactionLock = Lock()
+
+    def runOnce(self):
+        """
+        Claims up to one batch of due jobs per thread and runs them; returns
+        how many of them were done, retried and failed. Jobs whose claim was
+        lost meanwhile are in none of the counts.
+        """
+        token, jobs = self.claim(self.threads * self.batch_size)
+        batches = []
+        for kind in sorted(set(job.kind for job in jobs)):
+            kind_jobs = [job for job in jobs if job.kind == kind]
+            for start in range(0, len(kind_jobs), self.batch_size):
+                batches.append(kind_jobs[start:start + self.batch_size])
+
+        if self.executor is None:
+            # with one thread, jobs run in the calling one
+            outcomes = [self.runBatch(token, batch) for batch in batches]
+        else:
+            outcomes = list(self.executor.map(lambda batch: self.runInThread(token, batch), batches))
+
+        counts = {'done': 0, 'retried': 0, 'failed': 0}
+        for outcome in outcomes:
+            for key in counts:
+                counts[key] += outcome.get(key, 0)
+        return counts
+
+    def run(self, poll_interval, stop):
+        # until stop (a threading.Event) is set, sleeping while nothing is due
+        while not stop.is_set():
+            counts = self.runOnce()
+            if not any(counts.values()):
+                stop.wait(poll_interval)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def claim(self, limit):
+        # a token per claim, so a batch can tell whether its jobs are still its own
+        token = '{}:{}'.format(self.name, uuid.uuid4().hex)[-64:]
+        now = timezone.now()
+        with transaction.atomic():
+            # claims that went stale on the last attempt are not retried
+            (Job.objects
+                .filter(status=Job.RUNNING, run_after__lte=now, attempts__gte=F('max_attempts'))
+                .update(status=Job.FAILED, locked_by='', last_error='Visibility timeout expired on the last attempt'))
+
+            due = Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING], run_after__lte=now)
+            ids = list(due
+                        .select_for_update(skip_locked=True)
+                        .order_by('run_after', 'id')
+                        .values_list('id', flat=True)[:limit])
+            if not ids:
+                return token, []
+            # the same conditions again, as without row locks another worker may have got there first
+            (due
+                .filter(id__in=ids)
+                .update(status=Job.RUNNING, locked_by=token, attempts=F('attempts') + 1,
+                        run_after=now + timedelta(seconds=self.visibility_timeout)))
+        return token, list(Job.objects.filter(locked_by=token).order_by('id'))
+
+    def runInThread(self, token, batch):
+        close_old_connections()
+        try:
+            return self.runBatch(token, batch)
+        finally:
+            close_old_connections()
+
+    def runBatch(self, token, batch):
+        ids = [job.id for job in batch]
+        try:
+            with self.transactionLock, transaction.atomic():
+                handler = jobHandlers.get(batch[0].kind)
+                if handler is None:
+                    raise LookupError("No handler for jobs of kind '{}'".format(batch[0].kind))
+                handler([job.payload for job in batch])
+                done, _ = Job.objects.filter(id__in=ids, locked_by=token).delete()
+                if done != len(batch):
+                    raise ClaimLost()
+        except ClaimLost:
+            # another worker took the jobs over and runs them again; the ones
+            # still claimed here come due once their claim expires
+            return {}
+        except Exception:
+            return self.retry(token, batch, traceback.format_exc())
+        return {'done': len(batch)}
+
+    def retry(self, token, batch, error):
+        now = timezone.now()
+        counts = {'retried': 0, 'failed': 0}
+        for job in batch:
+            claimed = Job.objects.filter(id=job.id, locked_by=token)
+            if job.attempts >= job.max_attempts:
+                counts['failed'] += claimed.update(status=Job.FAILED, locked_by='', last_error=error)
+            else:
+                counts['retried'] += claimed.update(status=Job.QUEUED, locked_by='', last_error=error,
+                                                    run_after=now + timedelta(seconds=retryDelay(job.attempts)))
+        return counts
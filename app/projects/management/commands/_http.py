@@ -0,0 +1,25 @@
+from io import BytesIO
+
+
+def wsgiGet(application, path):
+    """
+    Calls a WSGI application the way a WSGI server does, firing the request
+    started/finished signals that open and recycle database connections.
+    Raises if the response is not a 200.
+    """
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+    }
+    statuses = []
+    body = application(environ, lambda status, headers: statuses.append(status))
+    b"".join(body)
+    body.close()
+    if not statuses[0].startswith("200"):
+        raise RuntimeError("WSGI request failed: {}".format(statuses[0]))
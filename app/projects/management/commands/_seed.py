@@ -0,0 +1,211 @@
+import itertools
+import random
+import uuid
+
+from projects.cache import responseCache
+from projects.counters import rebuildCounts
+from projects.fulltext import rebuildIndex
+from projects.models import Project, User, Issue, Label, Sprint, Comment
+
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "zi", "pe", "su", "do", "fa", "gu", "hi", "jo", "be"]
+
+# how issues of a tracker are typically spread over statuses and types
+STATUS_WEIGHTS = {"open": 30, "assigned": 15, "inprogress": 20, "under review": 10, "done": 15, "close": 10}
+TYPE_WEIGHTS = {"bug": 40, "task": 60}
+
+
+def seedIssues(count, batch_size=5000, labels_per_issue=2, watchers_per_issue=2, describe=None):
+    """
+    Bulk-creates a throwaway project holding `count` issues, each with a few
+    labels and watchers, for the benchmark commands. describe(n), if given,
+    returns the description of the n-th issue. Returns the project.
+    """
+    tag = uuid.uuid4().hex[:8]
+    project = Project.objects.create(name="Bench {}".format(tag))
+    sprint = Sprint.objects.create(name="Bench Sprint", project=project)
+    users = User.objects.bulk_create([
+        User(name="Bench User {}".format(i), active=True) for i in range(10)
+    ])
+    labels = Label.objects.bulk_create([
+        Label(value="Bench Label {}".format(i)) for i in range(5)
+    ])
+
+    LabelLink = Issue.labels.through
+    WatcherLink = Issue.watchers.through
+    for start in range(0, count, batch_size):
+        issues = Issue.objects.bulk_create([
+            Issue(
+                summary="Bench Issue {}".format(n),
+                desc=describe(n) if describe else "",
+                type=["bug", "task"][n % 2],
+                status=Issue.statusList[n % len(Issue.statusList)],
+                project=project,
+                sprint=sprint,
+                assignee=users[n % len(users)],
+            )
+            for n in range(start, min(count, start + batch_size))
+        ])
+        LabelLink.objects.bulk_create([
+            LabelLink(issue_id=issue.id, label_id=labels[(issue.id + k) % len(labels)].id)
+            for issue in issues for k in range(labels_per_issue)
+        ])
+        WatcherLink.objects.bulk_create([
+            WatcherLink(issue_id=issue.id, user_id=users[(issue.id + k + 1) % len(users)].id)
+            for issue in issues for k in range(watchers_per_issue)
+        ])
+    # bulk_create skips Issue.save(), which keeps the counters
+    rebuildCounts([project.id])
+    return project
+
+
+def dropSeed(project):
+    """
+    Deletes a project made by seedIssues() along with its users and labels,
+    for benchmarks that have to commit their data.
+    """
+    user_ids = set(Issue.objects.filter(project=project).values_list('assignee_id', flat=True))
+    label_ids = set(Issue.labels.through.objects
+                        .filter(issue__project=project)
+                        .values_list('label_id', flat=True))
+    project.delete()
+    User.objects.filter(id__in=user_ids).delete()
+    Label.objects.filter(id__in=label_ids).delete()
+
+
+def seedDataset(projects=10, users_per_project=20, sprints_per_project=4, issues=10000, labels=30,
+                watchers=2, comments=1, skew=1.0, seed=0, batch_size=5000, index=True):
+    """
+    Bulk-creates a dataset skewed the way real trackers are: issues per
+    project, assignees, labels and commenters follow Zipf weights with the
+    given exponent (0 spreads them evenly), statuses and types follow
+    STATUS_WEIGHTS and TYPE_WEIGHTS, and every issue gets a random number of
+    watchers and comments around the given means. Every row created is named
+    after a random tag, which is returned for dropDataset().
+    """
+    rng = random.Random(seed)
+    tag = uuid.uuid4().hex[:8]
+
+    project_rows = Project.objects.bulk_create([
+        Project(name="Seed {} Project {}".format(tag, i)) for i in range(projects)
+    ])
+    sprints = {}
+    members = {}
+    for project in project_rows:
+        sprints[project.id] = [sprint.id for sprint in Sprint.objects.bulk_create([
+            Sprint(name="Sprint {}".format(i), project=project) for i in range(sprints_per_project)
+        ])]
+        users = User.objects.bulk_create([
+            User(name="Seed {} User {}-{}".format(tag, project.id, i), active=rng.random() < 0.9)
+            for i in range(users_per_project)
+        ])
+        User.projects.through.objects.bulk_create([
+            User.projects.through(user_id=user.id, project_id=project.id) for user in users
+        ])
+        members[project.id] = [user.id for user in users]
+    label_ids = [label.id for label in Label.objects.bulk_create([
+        Label(value="seed-{}-{}".format(tag, i)) for i in range(labels)
+    ])]
+
+    words = vocabulary(2000)
+    pickProject = zipfChooser(rng, [project.id for project in project_rows], skew)
+    pickStatus = weightedChooser(rng, STATUS_WEIGHTS)
+    pickType = weightedChooser(rng, TYPE_WEIGHTS)
+    pickWord = zipfChooser(rng, words, skew)
+    pickLabel = zipfChooser(rng, label_ids, skew) if label_ids else None
+    # member lists are the same length, so one chooser serves every project
+    pickMember = zipfChooser(rng, range(users_per_project), skew) if users_per_project else None
+
+    LabelLink = Issue.labels.through
+    WatcherLink = Issue.watchers.through
+    for start in range(0, issues, batch_size):
+        rows = []
+        for n in range(start, min(issues, start + batch_size)):
+            project_id = pickProject()
+            assignee = None
+            if pickMember and rng.random() < 0.8:
+                assignee = members[project_id][pickMember()]
+            rows.append(Issue(
+                summary="Issue {}".format(n),
+                desc=" ".join(pickWord() for _ in range(rng.randint(0, 12)))[:100],
+                type=pickType(),
+                status=pickStatus(),
+                project_id=project_id,
+                sprint_id=rng.choice(sprints[project_id]),
+                assignee_id=assignee,
+            ))
+        rows = Issue.objects.bulk_create(rows)
+
+        label_links = []
+        watcher_links = []
+        comment_rows = []
+        for issue in rows:
+            if pickLabel:
+                for label_id in set(pickLabel() for _ in range(rng.randint(0, 3))):
+                    label_links.append(LabelLink(issue_id=issue.id, label_id=label_id))
+            if not pickMember:
+                continue
+            project_members = members[issue.project_id]
+            for user_id in set(project_members[pickMember()] for _ in range(rng.randint(0, 2 * watchers))):
+                watcher_links.append(WatcherLink(issue_id=issue.id, user_id=user_id))
+            # most issues get few comments and some get many
+            if comments:
+                for _ in range(int(rng.expovariate(1 / comments) + 0.5)):
+                    comment_rows.append(Comment(
+                        text=" ".join(pickWord() for _ in range(3))[:32],
+                        user_id=project_members[pickMember()],
+                        issue_id=issue.id,
+                    ))
+        LabelLink.objects.bulk_create(label_links)
+        WatcherLink.objects.bulk_create(watcher_links)
+        Comment.objects.bulk_create(comment_rows, batch_size=batch_size)
+
+    # bulk_create skips Issue.save() and the signals that keep these
+    project_ids = [project.id for project in project_rows]
+    rebuildCounts(project_ids)
+    if index:
+        rebuildIndex(batch_size, Issue.objects.filter(project__in=project_ids))
+    responseCache.bump('sprints')
+    responseCache.bump('labels')
+    return tag
+
+
+def dropDataset(tag):
+    """
+    Deletes everything seedDataset() created under the given tag.
+    """
+    Project.objects.filter(name__startswith="Seed {} ".format(tag)).delete()
+    User.objects.filter(name__startswith="Seed {} ".format(tag)).delete()
+    Label.objects.filter(value__startswith="seed-{}-".format(tag)).delete()
+    responseCache.bump('sprints')
+    responseCache.bump('labels')
+
+
+def zipfChooser(rng, population, skew):
+    # the k-th item is picked with weight 1 / k^skew
+    population = list(population)
+    weights = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, len(population) + 1)))
+    return lambda: rng.choices(population, cum_weights=weights)[0]
+
+
+def weightedChooser(rng, weights):
+    population = list(weights)
+    cumulative = list(itertools.accumulate(weights.values()))
+    return lambda: rng.choices(population, cum_weights=cumulative)[0]
+
+
+def vocabulary(size):
+    # pronounceable made-up words, so no stopword or stemming rule applies
+    words = []
+    length = 2
+    while len(words) < size:
+        for n in range(len(SYLLABLES) ** length):
+            word = ""
+            for _ in range(length):
+                word += SYLLABLES[n % len(SYLLABLES)]
+                n //= len(SYLLABLES)
+            words.append(word)
+            if len(words) == size:
+                break
+        length += 1
+    return words
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from projects.models import Issue
+from ._http import wsgiGet
+from ._seed import seedIssues, dropSeed
+
+
+class Command(BaseCommand):
+
+    help = "Compares concurrent read throughput of the WSGI and ASGI applications."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per run")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight (WSGI threads / ASGI tasks)")
+        parser.add_argument('--issues', type=int, default=200, help="Issues in the seeded project")
+        parser.add_argument('--db-latency', type=float, default=0.01, help="Seconds of latency added to every query")
+
+    def handle(self, *args, **kwargs):
+        requests = kwargs.get("requests")
+        concurrency = kwargs.get("concurrency")
+        latency = kwargs.get("db_latency")
+
+        # the seed is committed so every worker thread's connection can see it
+        project = seedIssues(kwargs.get("issues"))
+        try:
+            slowDatabase(latency)
+            # user issue lists are neither cached nor ETag-checked, so both
+            # applications do the same database work per request
+            user_id = Issue.objects.filter(project=project).values_list('assignee_id', flat=True).first()
+            path = "/users/{}/issues".format(user_id)
+
+            wsgi = runWsgi(path, requests, concurrency)
+            asgi = runAsgi("/async" + path, requests, concurrency)
+        finally:
+            connection_created.disconnect(addLatency)
+            del connection.execute_wrappers[:]
+            dropSeed(project)
+
+        print("{} requests, {} in flight, {:.0f} ms added per query".format(requests, concurrency, latency * 1000))
+        print("{:>6} {:>12} {:>12}".format("app", "seconds", "req/s"))
+        for name, elapsed in (("wsgi", wsgi), ("asgi", asgi)):
+            print("{:>6} {:>12.3f} {:>12.1f}".format(name, elapsed, requests / elapsed))
+
+
+'''
+simulated slow database
+'''
+latencySeconds = 0
+
+
+def slowDatabase(latency):
+    global latencySeconds
+    latencySeconds = latency
+    # new connections are opened per thread, so hook each one as it is made
+    connection_created.connect(addLatency)
+    connection.execute_wrappers.append(sleepBeforeQuery)
+
+
+def addLatency(sender, connection, **kwargs):
+    connection.execute_wrappers.append(sleepBeforeQuery)
+
+
+def sleepBeforeQuery(execute, sql, params, many, context):
+    time.sleep(latencySeconds)
+    return execute(sql, params, many, context)
+
+
+'''
+drivers
+'''
+def runWsgi(path, requests, concurrency):
+    application = get_wsgi_application()
+
+    def call(_):
+        wsgiGet(application, path)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    return time.perf_counter() - start
+
+
+def runAsgi(path, requests, concurrency):
+    application = get_asgi_application()
+
+    async def call(limit):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'root_path': '',
+            'query_string': b'',
+            'headers': [(b'host', b'localhost')],
+            'server': ('localhost', 80),
+            'client': ('127.0.0.1', 0),
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with limit:
+            await application(scope, receive, send)
+        if statuses[0] != 200:
+            raise RuntimeError("ASGI request failed: {}".format(statuses[0]))
+
+    async def run():
+        limit = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*[call(limit) for _ in range(requests)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+from projects.models import Issue
+from ._http import wsgiGet
+from ._seed import seedIssues, dropSeed
+
+
+class Command(BaseCommand):
+
+    help = "Compares per-request and persistent database connections under the WSGI application."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per run")
+        parser.add_argument('--concurrency', type=int, default=4, help="Worker threads, as in GUNICORN_THREADS")
+        parser.add_argument('--issues', type=int, default=50, help="Issues in the seeded project")
+        parser.add_argument('--connect-latency', type=float, default=0.0,
+                            help="Seconds added to opening every connection, to stand in for a remote server")
+
+    def handle(self, *args, **kwargs):
+        requests = kwargs.get("requests")
+        concurrency = kwargs.get("concurrency")
+        global connectLatency
+        connectLatency = kwargs.get("connect_latency")
+
+        # the seed is committed so every worker thread's connection can see it
+        project = seedIssues(kwargs.get("issues"))
+        user_id = Issue.objects.filter(project=project).values_list('assignee_id', flat=True).first()
+        path = "/users/{}/issues".format(user_id)
+
+        results = []
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection_created.connect(countConnection)
+        try:
+            for name, age in (("per-request", 0), ("persistent", 600)):
+                # every thread's wrapper shares this settings dict
+                connection.settings_dict['CONN_MAX_AGE'] = age
+                connections.close_all()
+                results.append((name,) + runWsgi(path, requests, concurrency))
+        finally:
+            connection_created.disconnect(countConnection)
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            dropSeed(project)
+
+        print("{} requests on {} threads, {:.0f} ms added per connection".format(
+            requests, concurrency, connectLatency * 1000))
+        print("{:>12} {:>12} {:>12} {:>14}".format("mode", "connections", "req/s", "ms/request"))
+        for name, opened, elapsed, latency in results:
+            print("{:>12} {:>12} {:>12.1f} {:>14.2f}".format(name, opened, requests / elapsed, latency * 1000))
+
+
+'''
+connection accounting
+'''
+connectLatency = 0
+opened = 0
+openedLock = Lock()
+
+
+def countConnection(sender, connection, **kwargs):
+    global opened
+    with openedLock:
+        opened += 1
+    time.sleep(connectLatency)
+
+
+'''
+driver
+'''
+def runWsgi(path, requests, concurrency):
+    global opened
+    application = get_wsgi_application()
+    opened = 0
+
+    def call(_):
+        start = time.perf_counter()
+        wsgiGet(application, path)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    return opened, elapsed, sum(latencies) / len(latencies)
@@ -0,0 +1,286 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from projects import urls
+from projects.models import Project, User, Issue, Label, Sprint, Comment
+from ._seed import seedDataset, dropDataset
+from .seeddata import addDatasetArguments, datasetOptions
+
+
+class Command(BaseCommand):
+
+    help = "Measures latency, query counts and peak memory of every route in projects/urls.py over a seeded dataset."
+
+    def add_arguments(self, parser):
+        addDatasetArguments(parser)
+        parser.add_argument('--tag', help="Benchmark a dataset already seeded by seeddata instead of seeding one")
+        parser.add_argument('--repeat', type=int, default=50, help="Timed requests per route and method")
+        parser.add_argument('--route', nargs='+', help="Only benchmark these routes, e.g. 'issues/search'")
+        parser.add_argument('--output', default='bench-endpoints.json', help="File the JSON results are written to, - for stdout")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare p50 latencies with")
+
+    def handle(self, *args, **kwargs):
+        repeat = kwargs.get("repeat")
+        tag = kwargs.get("tag")
+        seeded = tag is None
+        if seeded:
+            tag = seedDataset(**datasetOptions(kwargs))
+
+        try:
+            context = benchContext(tag)
+            scenarios = [scenario for scenario in buildScenarios(context)
+                         if not kwargs.get("route") or scenario["route"] in kwargs.get("route")]
+            missing = uncoveredRoutes(buildScenarios(context))
+            if missing:
+                raise CommandError("No benchmark scenario for routes: {}".format(", ".join(missing)))
+
+            client = Client(HTTP_HOST='localhost')
+            results = [runScenario(client, scenario, repeat) for scenario in scenarios]
+            dataset = datasetSummary(tag)
+        finally:
+            if seeded:
+                dropDataset(tag)
+
+        report = {
+            "commit": gitCommit(),
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "repeat": repeat,
+            "dataset": dataset,
+            "results": results,
+        }
+        if kwargs.get("output") == '-':
+            print(json.dumps(report, indent=2))
+            return
+        with open(kwargs.get("output"), 'w') as file:
+            json.dump(report, file, indent=2)
+
+        previous = {}
+        if kwargs.get("compare"):
+            with open(kwargs.get("compare")) as file:
+                previous = dict(((result["method"], result["route"]), result) for result in json.load(file)["results"])
+
+        print("{:>7} {:<52} {:>6} {:>9} {:>9} {:>9} {:>8} {:>10} {:>9}".format(
+            "method", "route", "status", "p50 (ms)", "p95 (ms)", "p99 (ms)", "queries", "peak (KiB)", "p50 diff"))
+        for result in results:
+            diff = ""
+            before = previous.get((result["method"], result["route"]))
+            if before and before["p50_ms"]:
+                diff = "{:+.0f}%".format((result["p50_ms"] / before["p50_ms"] - 1) * 100)
+            print("{:>7} {:<52} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>8} {:>10.1f} {:>9}".format(
+                result["method"], result["route"], result["status"], result["p50_ms"], result["p95_ms"],
+                result["p99_ms"], result["queries"], result["peak_memory_kib"], diff))
+        print("Results written to {}".format(kwargs.get("output")))
+
+
+'''
+scenarios
+'''
+def benchContext(tag):
+    """
+    Picks the rows requests are made against: the largest project of the
+    dataset, so list endpoints see its skewed worst case, and its smallest
+    for the project delete.
+    """
+    projects = list(Project.objects.filter(name__startswith="Seed {} ".format(tag)))
+    if not projects:
+        raise CommandError("No dataset seeded under tag {}".format(tag))
+    sizes = dict((project.id, Issue.objects.filter(project=project).count()) for project in projects)
+    project = max(projects, key=lambda project: sizes[project.id])
+    smallest = min(projects, key=lambda project: sizes[project.id])
+
+    sprints = list(Sprint.objects.filter(project=project).order_by('id'))
+    members = list(User.objects.filter(projects=project, active=True).order_by('id'))
+    open_issues = list(Issue.objects.filter(project=project, status="open").order_by('id')[:20])
+    if len(sprints) < 2 or len(members) < 2 or not open_issues:
+        raise CommandError("The largest project needs two sprints, two active members and an open issue")
+
+    issue = open_issues[0]
+    watcher = next(user for user in members if user.id != issue.assignee_id)
+    return {
+        "tag": tag,
+        "project": project,
+        "smallest": smallest,
+        "sprints": sprints,
+        "members": members,
+        "issue": issue,
+        "open_issues": open_issues,
+        "watcher": watcher,
+        "label": Label.objects.filter(value__startswith="seed-{}-".format(tag)).order_by('id').first(),
+        "word": (Issue.objects.filter(project=project).exclude(desc="").values_list('desc', flat=True).first() or "issue").split()[0],
+    }
+
+
+def buildScenarios(context):
+    """
+    One request per route and method. Writes run in a transaction that is
+    rolled back, so every repetition sees the same rows.
+    """
+    project = context["project"].id
+    issue = context["issue"]
+    source, target = context["sprints"][0].id, context["sprints"][1].id
+    open_ids = [row.id for row in context["open_issues"]]
+    member = context["members"][0].id
+    watcher = context["watcher"].id
+    label = context["label"].id if context["label"] else None
+
+    def scenario(route, method, path, body=None):
+        return {"route": route, "method": method, "path": path, "body": body}
+
+    return [
+        scenario("projects/", "get", "/projects/"),
+        scenario("projects/", "post", "/projects/", {"name": "Bench Project"}),
+        scenario("projects/<int:pk>", "get", "/projects/{}".format(project)),
+        scenario("projects/<int:pk>", "put", "/projects/{}".format(project), {"name": "Renamed Project"}),
+        scenario("projects/<int:pk>", "patch", "/projects/{}".format(project), {"desc": "Patched"}),
+        scenario("projects/<int:pk>", "delete", "/projects/{}".format(context["smallest"].id)),
+        scenario("projects/<int:pk>/issues", "get", "/projects/{}/issues".format(project)),
+        scenario("projects/<int:pk>/issues", "post", "/projects/{}/issues".format(project),
+            {"summary": "Bench Issue", "type": "bug", "project": project, "sprint": source}),
+        scenario("projects/<int:pk>/issues", "patch", "/projects/{}/issues".format(project),
+            {"issues": open_ids, "source_sprint": source, "target_sprint": target}),
+        scenario("projects/<int:pk>/summary", "get", "/projects/{}/summary".format(project)),
+        scenario("projects/<int:pk>/export", "get", "/projects/{}/export".format(project)),
+        scenario("issues/", "get", "/issues/"),
+        scenario("issues/search", "get", "/issues/search?project={}&status=open&facets=status,type".format(project)),
+        scenario("issues/fulltext", "get", "/issues/fulltext?q={}".format(context["word"])),
+        scenario("issues/status", "patch", "/issues/status", {"issues": open_ids, "status": "assigned"}),
+        scenario("issues/<int:pk>", "get", "/issues/{}".format(issue.id)),
+        scenario("projects/<int:pid>/issues/<int:iid>/assignee", "patch",
+            "/projects/{}/issues/{}/assignee".format(project, issue.id), {"assignee": watcher}),
+        scenario("projects/<int:pid>/issues/assignees", "patch", "/projects/{}/issues/assignees".format(project),
+            {"assignments": [{"issue": pk, "assignee": member} for pk in open_ids]}),
+        scenario("projects/<int:pid>/issues/watchers", "patch", "/projects/{}/issues/watchers".format(project),
+            {"action": "add", "issues": open_ids, "watchers": [watcher]}),
+        scenario("projects/<int:pid>/issues/<int:iid>/watcher", "patch",
+            "/projects/{}/issues/{}/watcher".format(project, issue.id), {"watcher": watcher, "action": "add"}),
+        scenario("issues/<int:iid>/label", "patch", "/issues/{}/label".format(issue.id), {"label": label}),
+        scenario("issues/<int:iid>/status", "patch", "/issues/{}/status".format(issue.id), {"status": "assigned"}),
+        scenario("projects/<int:pid>/issues/<int:iid>/comments", "get",
+            "/projects/{}/issues/{}/comments".format(project, issue.id)),
+        scenario("projects/<int:pid>/issues/<int:iid>/comments", "post",
+            "/projects/{}/issues/{}/comments".format(project, issue.id), {"text": "Bench comment", "user": member}),
+        scenario("users/", "get", "/users/"),
+        scenario("users/", "post", "/users/", {"name": "Bench User", "active": True}),
+        scenario("users/<int:pk>", "get", "/users/{}".format(member)),
+        scenario("users/<int:pk>", "patch", "/users/{}".format(member), {"name": "Renamed User"}),
+        scenario("users/<int:pk>/issues", "get", "/users/{}/issues".format(member)),
+        scenario("users/<int:pk>/notifications", "get", "/users/{}/notifications".format(member)),
+        scenario("labels/", "get", "/labels/"),
+        scenario("labels/", "post", "/labels/", {"value": "bench"}),
+        scenario("sprints/", "get", "/sprints/"),
+        scenario("sprints/", "post", "/sprints/", {"name": "Bench Sprint", "project": project}),
+        scenario("sprints/<int:pk>", "get", "/sprints/{}".format(source)),
+        scenario("comments/", "get", "/comments/"),
+        scenario("comments/", "post", "/comments/", {"text": "Bench comment", "user": member, "issue": issue.id}),
+        scenario("changes", "get", "/changes?project={}".format(project)),
+        scenario("stats/caches", "get", "/stats/caches"),
+        scenario("metrics", "get", "/metrics"),
+        scenario("async/issues/", "get", "/async/issues/"),
+        scenario("async/issues/search", "get", "/async/issues/search?project={}&status=open".format(project)),
+        scenario("async/issues/<int:pk>", "get", "/async/issues/{}".format(issue.id)),
+        scenario("async/projects/<int:pk>/issues", "get", "/async/projects/{}/issues".format(project)),
+        scenario("async/projects/<int:pid>/issues/<int:iid>/comments", "get",
+            "/async/projects/{}/issues/{}/comments".format(project, issue.id)),
+        scenario("async/users/<int:pk>/issues", "get", "/async/users/{}/issues".format(member)),
+    ]
+
+
+def uncoveredRoutes(scenarios):
+    covered = set(scenario["route"] for scenario in scenarios)
+    return [str(pattern.pattern) for pattern in urls.urlpatterns if str(pattern.pattern) not in covered]
+
+
+'''
+measurement
+'''
+def runScenario(client, scenario, repeat):
+    # the first request warms caches and connections and is not timed
+    request(client, scenario)
+
+    timings = []
+    cache_hits = 0
+    for _ in range(repeat):
+        elapsed, response = request(client, scenario)
+        timings.append(elapsed * 1000)
+        cache_hits += response.get('X-Cache') == 'HIT'
+
+    # counting queries and tracing allocations slow requests down, so both
+    # are measured on one extra request rather than the timed ones
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        _, response = request(client, scenario)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "route": scenario["route"],
+        "method": scenario["method"].upper(),
+        "path": scenario["path"],
+        "status": response.status_code,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "queries": len(queries.captured_queries),
+        "peak_memory_kib": round(peak / 1024, 1),
+        "cache_hits": cache_hits,
+    }
+
+
+def request(client, scenario):
+    method = getattr(client, scenario["method"])
+    kwargs = {}
+    if scenario["body"] is not None:
+        kwargs = {"data": json.dumps(scenario["body"]), "content_type": "application/json"}
+
+    if scenario["method"] == "get":
+        start = time.perf_counter()
+        response = method(scenario["path"], **kwargs)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return time.perf_counter() - start, response
+
+    with transaction.atomic():
+        start = time.perf_counter()
+        response = method(scenario["path"], **kwargs)
+        elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return elapsed, response
+
+
+def percentile(timings, percent):
+    # nearest-rank percentile of sorted timings
+    rank = max(1, -(-len(timings) * percent // 100))
+    return timings[int(rank) - 1]
+
+
+def datasetSummary(tag):
+    projects = Project.objects.filter(name__startswith="Seed {} ".format(tag))
+    issues = Issue.objects.filter(project__in=projects)
+    return {
+        "tag": tag,
+        "projects": projects.count(),
+        "users": User.objects.filter(name__startswith="Seed {} ".format(tag)).count(),
+        "issues": issues.count(),
+        "comments": Comment.objects.filter(issue__project__in=projects).count(),
+        "largest_project_issues": max([issues.filter(project=project).count() for project in projects] or [0]),
+    }
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from projects.fulltext import rankedMatches, rebuildIndex
+from projects.models import Issue
+from projects.rowserializers import getRowSerializer
+from projects.serializers import IssueSerializer
+from ._seed import seedIssues, vocabulary
+
+
+class Command(BaseCommand):
+
+    help = "Times ranked full-text queries over a seeded corpus of issues."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=int, default=1000000, help="Issues in the corpus")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs of every query")
+        parser.add_argument('--page-size', type=int, default=50, help="Matches fetched per query")
+        parser.add_argument('--vocabulary', type=int, default=20000, help="Distinct words in descriptions")
+
+    def handle(self, *args, **kwargs):
+        count = kwargs.get("issues")
+        page_size = kwargs.get("page_size")
+        words = vocabulary(kwargs.get("vocabulary"))
+        # word frequencies follow Zipf's law, as in natural text
+        weights = [1 / rank for rank in range(1, len(words) + 1)]
+
+        def describe(n):
+            chooser = random.Random(n)
+            desc = ""
+            for word in chooser.choices(words, weights=weights, k=12):
+                if len(desc) + len(word) + 1 > 100:
+                    break
+                desc = (desc + " " + word).strip()
+            return desc
+
+        queries = [
+            ("common word", words[2]),
+            ("frequent word", words[50]),
+            ("rare word", words[5000 % len(words)]),
+            ("two words", "{} {}".format(words[2], words[50])),
+            ("no match", "zzzz"),
+        ]
+
+        # seeded rows are rolled back once the measurement is done
+        with transaction.atomic():
+            start = time.perf_counter()
+            project = seedIssues(count, labels_per_issue=0, watchers_per_issue=0, describe=describe)
+            seeded = time.perf_counter() - start
+
+            start = time.perf_counter()
+            rebuildIndex(issues=Issue.objects.filter(project=project))
+            indexed = time.perf_counter() - start
+
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE projects_issuedocument")
+
+            results = []
+            for name, text in queries:
+                timings = []
+                for _ in range(kwargs.get("repeat")):
+                    start = time.perf_counter()
+                    matches = rankedMatches(text, limit=page_size)
+                    getRowSerializer(IssueSerializer).serialize(Issue.objects.filter(id__in=[pk for pk, _ in matches]))
+                    timings.append(time.perf_counter() - start)
+                results.append((name, text, len(matches), timings))
+            transaction.set_rollback(True)
+
+        print("{} issues on {}: seeded in {:.1f} s, indexed in {:.1f} s".format(count, connection.vendor, seeded, indexed))
+        print("{:>14} {:>18} {:>8} {:>10} {:>10} {:>10}".format("query", "text", "matches", "p50 (ms)", "p95 (ms)", "max (ms)"))
+        for name, text, matched, timings in results:
+            timings = sorted(timing * 1000 for timing in timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print("{:>14} {:>18} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                name, text, matched, statistics.median(timings), p95, timings[-1]))
+
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from projects.models import Issue
+from projects.rowserializers import getRowSerializer
+from projects.serializers import IssueSerializer
+from projects.views import ISSUE_PREFETCH
+from ._seed import seedIssues
+
+
+class Command(BaseCommand):
+
+    help = "Compares list serialization through IssueSerializer and RowSerializer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help="Issue counts to benchmark")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, best is reported")
+
+    def handle(self, *args, **kwargs):
+        repeat = kwargs.get("repeat")
+
+        print("{:>10} {:>16} {:>16} {:>9}".format("rows", "serializer (s)", "row path (s)", "speedup"))
+        for rows in kwargs.get("rows"):
+            # seeded rows are rolled back once the measurement is done
+            with transaction.atomic():
+                project = seedIssues(rows)
+                issues = (Issue.objects
+                            .prefetch_related(*ISSUE_PREFETCH)
+                            .filter(project=project)
+                            .order_by('-creation_date', '-id'))
+
+                def currentPath():
+                    return JSONRenderer().render(IssueSerializer(issues.all(), many=True).data)
+
+                def rowPath():
+                    return JSONRenderer().render(getRowSerializer(IssueSerializer).serialize(issues.all()))
+
+                if currentPath() != rowPath():
+                    print("Warning: outputs differ for {} rows".format(rows))
+
+                current = bestOf(repeat, currentPath)
+                fast = bestOf(repeat, rowPath)
+                transaction.set_rollback(True)
+
+            print("{:>10} {:>16.3f} {:>16.3f} {:>8.1f}x".format(rows, current, fast, current / fast))
+
+
+def bestOf(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
@@ -0,0 +1,55 @@
+import sys
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.export import EXPORT_FORMATS, exportRows, renderExport
+from projects.models import Project
+
+
+class Command(BaseCommand):
+
+    help = "Exports a project's issues, with labels, watchers and comments, as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help="Id of the project to export")
+        parser.add_argument('--output', choices=list(EXPORT_FORMATS), default='ndjson', help="Export format")
+        parser.add_argument('--file', default='-', help="File to write to, - for standard output")
+        parser.add_argument('--chunk-size', type=int, help="Issues read per chunk, STREAM_CHUNK_SIZE by default")
+        parser.add_argument('--trace-memory', action='store_true', help="Also report peak Python memory (slower)")
+
+    def handle(self, *args, **kwargs):
+        project = kwargs.get("project")
+        if not Project.objects.filter(pk=project).exists():
+            raise CommandError("Project {} does not exist".format(project))
+
+        # counts rows as they go by, without holding on to them
+        exported = 0
+
+        def counted(rows):
+            nonlocal exported
+            for row in rows:
+                exported += 1
+                yield row
+
+        if kwargs.get("trace_memory"):
+            tracemalloc.start()
+        start = time.perf_counter()
+        out = sys.stdout.buffer if kwargs.get("file") == '-' else open(kwargs.get("file"), 'wb')
+        try:
+            rows = counted(exportRows(project, kwargs.get("chunk_size")))
+            for chunk in renderExport(rows, kwargs.get("output"), kwargs.get("chunk_size")):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        elapsed = time.perf_counter() - start
+
+        # the report goes to stderr so it never mixes with exported rows
+        report = "Exported {} issues in {:.2f} s ({:.0f} rows/s)".format(
+            exported, elapsed, exported / elapsed if elapsed else 0)
+        if kwargs.get("trace_memory"):
+            report += ", peak memory {:.1f} MiB".format(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.stop()
+        print(report, file=sys.stderr)
@@ -0,0 +1,53 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.importer import IMPORT_ORDER, ImportDataError, Importer, readRecords
+from projects.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+
+    help = "Imports projects, users, labels, sprints, issues and comments from another tracker's NDJSON or CSV export."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON or CSV file to import")
+        parser.add_argument('--source', help="Name of the tracker the ids in the file belong to, the file name by default")
+        parser.add_argument('--output', choices=['ndjson', 'csv'], help="File format, guessed from the extension by default")
+        parser.add_argument('--kind', choices=IMPORT_ORDER, help="Kind of every record in a file without a kind field")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Records written per transaction")
+        parser.add_argument('--no-index', action='store_true', help="Skip full-text indexing; run rebuildsearchindex afterwards")
+
+    def handle(self, *args, **kwargs):
+        path = os.path.abspath(kwargs.get("path"))
+        if not os.path.exists(path):
+            raise CommandError("File {} does not exist".format(path))
+        source = kwargs.get("source") or os.path.splitext(os.path.basename(path))[0]
+        output = kwargs.get("output") or ('csv' if path.endswith('.csv') else 'ndjson')
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source, path=path)
+        if checkpoint.records:
+            print("Resuming after record {}".format(checkpoint.records))
+
+        importer = Importer(source, kwargs.get("batch_size"), index=not kwargs.get("no_index"))
+        resumed_at = checkpoint.records
+        start = time.perf_counter()
+
+        def progress(checkpoint):
+            done = checkpoint.records - resumed_at
+            elapsed = time.perf_counter() - start
+            print("{} records imported ({:.0f} rows/s)".format(checkpoint.records, done / elapsed if elapsed else 0))
+
+        try:
+            importer.run(readRecords(path, output, kwargs.get("kind")), checkpoint, progress)
+        except ImportDataError as error:
+            raise CommandError("{} (records up to {} are committed; rerun to resume)".format(error, checkpoint.records))
+
+        elapsed = time.perf_counter() - start
+        imported = sum(importer.imported.values())
+        print("Imported {} records in {:.1f} s ({:.0f} rows/s): {}".format(
+            imported, elapsed, imported / elapsed if elapsed else 0,
+            ", ".join("{} {}s".format(importer.imported[kind], kind) for kind in IMPORT_ORDER if importer.imported[kind])))
+        if importer.truncated:
+            print("Warning: {} values were longer than their column and were cut".format(importer.truncated))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from projects.counters import rebuildCounts
+
+
+class Command(BaseCommand):
+
+    help = "Recomputes the per-project and per-sprint issue counters from the issues table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, nargs='+', help="Only rebuild these project ids")
+
+    def handle(self, *args, **kwargs):
+        corrected = rebuildCounts(kwargs.get("project"))
+        print("Issue counters rebuilt, {} counter rows corrected".format(corrected))
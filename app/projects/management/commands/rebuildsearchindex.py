@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from projects.fulltext import rebuildIndex
+from projects.models import Issue
+
+
+class Command(BaseCommand):
+
+    help = "Rebuilds the full-text search documents of every issue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, nargs='+', help="Only rebuild the issues of these project ids")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Issues indexed per statement")
+
+    def handle(self, *args, **kwargs):
+        issues = Issue.objects.all()
+        if kwargs.get("project"):
+            issues = issues.filter(project__in=kwargs.get("project"))
+        indexed = rebuildIndex(kwargs.get("batch_size"), issues)
+        print("Search index rebuilt for {} issues".format(indexed))
@@ -0,0 +1,47 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from projects.jobs import Worker
+# registers the job handlers
+import projects.notifications
+
+
+class Command(BaseCommand):
+
+    help = "Runs queued background jobs, such as watcher notifications, on a thread pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOBS_THREADS, help="Batches run at the same time")
+        parser.add_argument('--batch-size', type=int, default=settings.JOBS_BATCH_SIZE, help="Jobs of a kind run together")
+        parser.add_argument('--visibility-timeout', type=int, default=settings.JOBS_VISIBILITY_TIMEOUT,
+                            help="Seconds before jobs claimed by an unresponsive worker are run by another")
+        parser.add_argument('--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+                            help="Seconds to wait when no job is due")
+        parser.add_argument('--name', help="Name the worker's claims carry, host and pid by default")
+        parser.add_argument('--once', action='store_true', help="Run the jobs due now and exit")
+
+    def handle(self, *args, **kwargs):
+        worker = Worker(kwargs.get("name"), kwargs.get("threads"), kwargs.get("batch_size"), kwargs.get("visibility_timeout"))
+        try:
+            if kwargs.get("once"):
+                totals = {'done': 0, 'retried': 0, 'failed': 0}
+                while True:
+                    counts = worker.runOnce()
+                    if not any(counts.values()):
+                        break
+                    for key in totals:
+                        totals[key] += counts[key]
+                print("Jobs done: {done}, retried: {retried}, failed: {failed}".format(**totals))
+                return
+
+            # finish the batches running, then stop
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+            signal.signal(signal.SIGINT, lambda *args: stop.set())
+            print("Worker {} running jobs on {} threads".format(worker.name, worker.threads))
+            worker.run(kwargs.get("poll_interval"), stop)
+        finally:
+            worker.shutdown()
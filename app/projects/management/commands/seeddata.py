@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ._seed import seedDataset, dropDataset
+
+
+def addDatasetArguments(parser):
+    parser.add_argument('--projects', type=int, default=10, help="Projects to create")
+    parser.add_argument('--users-per-project', type=int, default=20, help="Members of every project")
+    parser.add_argument('--sprints-per-project', type=int, default=4, help="Sprints of every project")
+    parser.add_argument('--issues', type=int, default=10000, help="Issues spread over the projects")
+    parser.add_argument('--labels', type=int, default=30, help="Labels shared by all issues")
+    parser.add_argument('--watchers', type=float, default=2, help="Mean watchers per issue")
+    parser.add_argument('--comments', type=float, default=1, help="Mean comments per issue")
+    parser.add_argument('--skew', type=float, default=1.0, help="Zipf exponent of project sizes, assignees, labels and words; 0 is uniform")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed, for repeatable datasets")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Issues inserted per statement")
+    parser.add_argument('--no-index', action='store_true', help="Skip building the full-text index")
+
+
+def datasetOptions(kwargs):
+    if kwargs.get("projects") < 1 or kwargs.get("sprints_per_project") < 1:
+        raise CommandError("At least one project with one sprint is needed")
+    return dict(
+        projects=kwargs.get("projects"),
+        users_per_project=kwargs.get("users_per_project"),
+        sprints_per_project=kwargs.get("sprints_per_project"),
+        issues=kwargs.get("issues"),
+        labels=kwargs.get("labels"),
+        watchers=kwargs.get("watchers"),
+        comments=kwargs.get("comments"),
+        skew=kwargs.get("skew"),
+        seed=kwargs.get("seed"),
+        batch_size=kwargs.get("batch_size"),
+        index=not kwargs.get("no_index"),
+    )
+
+
+class Command(BaseCommand):
+
+    help = "Seeds a synthetic, realistically skewed dataset of projects, users, sprints, issues, labels and comments."
+
+    def add_arguments(self, parser):
+        addDatasetArguments(parser)
+        parser.add_argument('--drop', metavar='TAG', help="Delete the dataset seeded under this tag instead")
+
+    def handle(self, *args, **kwargs):
+        if kwargs.get("drop"):
+            dropDataset(kwargs.get("drop"))
+            print("Dataset {} deleted".format(kwargs.get("drop")))
+            return
+
+        start = time.perf_counter()
+        tag = seedDataset(**datasetOptions(kwargs))
+        print("Dataset {} seeded in {:.1f} s; delete it with: manage.py seeddata --drop {}".format(
+            tag, time.perf_counter() - start, tag))
@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import User
+
+
+class MembershipCache:
+    """
+    Per-process LRU map of user id -> (active, frozenset of project ids).
+
+    Entries are dropped by the signals in signals.py whenever a user or their
+    project memberships change, both at once and again when the write commits.
+    Other worker processes only learn of a change once their entry is older
+    than MEMBERSHIP_CACHE_TIMEOUT seconds, which bounds how stale they can be.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        # bumped by every invalidation, so a load that raced one is not stored
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        """
+        Returns (active, project ids) for the user, or None if it does not exist.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            epoch = self.epoch
+
+        membership = self.load(user_id)
+        with self.lock:
+            if membership is not None and epoch == self.epoch:
+                self.entries[user_id] = (now + self.timeout, membership)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return membership
+
+    def load(self, user_id):
+        # one LEFT JOIN from the user to its project links
+        rows = list(User.objects.filter(pk=user_id).values_list('active', 'projects'))
+        if not rows:
+            return None
+        active = rows[0][0]
+        return active, frozenset(project_id for _, project_id in rows if project_id is not None)
+
+    def isMember(self, user_id, project_id):
+        membership = self.get(user_id)
+        return membership is not None and project_id in membership[1]
+
+    def invalidate(self, *user_ids):
+        with self.lock:
+            self.epoch += 1
+            for user_id in user_ids:
+                self.entries.pop(user_id, None)
+
+    def invalidateOnWrite(self, *user_ids):
+        """
+        Drops the users now, so later reads in this transaction reload them,
+        and again once the transaction commits, so nothing loaded before the
+        commit stays cached.
+        """
+        user_ids = set(user_ids)
+        self.invalidate(*user_ids)
+        transaction.on_commit(lambda: self.invalidate(*user_ids))
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "size": len(self.entries),
+                "max_size": self.size,
+            }
+
+
+membershipCache = MembershipCache(settings.MEMBERSHIP_CACHE_SIZE, settings.MEMBERSHIP_CACHE_TIMEOUT)
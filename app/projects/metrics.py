@@ -0,0 +1,415 @@
+'''
+Per-request latency and SQL instrumentation.
+
+metricsMiddleware times every request and, through an execute wrapper
+installed on each database connection, the number and duration of the
+queries it runs; connection.queries is never read, so this works the same
+with DEBUG off. Every response carries the numbers in a Server-Timing header,
+and requestMetrics aggregates them per route and method into the histograms
+served in the Prometheus text format by the metrics endpoint.
+
+The per-request state lives in a context variable, which asgiref copies into
+the threads sync_to_async runs ORM calls in, so queries of async views are
+counted too.
+
+Each worker process counts its own requests. With METRICS_DIR set, as
+gunicorn.conf.py does, a thread of every process also writes its counts and
+cache stats to a file of its own in that directory, every
+METRICS_FLUSH_INTERVAL seconds it has served requests in and when it exits,
+and the metrics endpoint serves the sum over all of them, whichever worker
+answers the scrape. The files of workers that have exited are folded into
+one, so counters keep growing as workers are recycled, while cache sizes,
+being gauges, only count workers still running. gunicorn.conf.py empties
+the directory when the server starts.
+'''
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+from .cache import responseCache
+from .membership import membershipCache
+
+
+class RequestTimer:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+currentTimer = ContextVar('currentTimer', default=None)
+
+
+def timeQuery(execute, sql, params, many, context):
+    timer = currentTimer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.queries += 1
+        timer.query_seconds += time.perf_counter() - start
+
+
+def instrumentConnection(connection, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper
+    if timeQuery not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timeQuery)
+
+
+connection_created.connect(instrumentConnection)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of one labelled series.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """
+    Request counts and latency, SQL time and SQL count histograms, labelled by
+    route pattern and method.
+    """
+
+    def __init__(self, latency_buckets, query_buckets):
+        self.latency_buckets = tuple(latency_buckets)
+        self.query_buckets = tuple(query_buckets)
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.requests = {}
+            self.durations = {}
+            self.query_durations = {}
+            self.query_counts = {}
+
+    def series(self):
+        return (
+            ('durations', self.durations, self.latency_buckets),
+            ('query_durations', self.query_durations, self.latency_buckets),
+            ('query_counts', self.query_counts, self.query_buckets),
+        )
+
+    def state(self):
+        # the counts as JSON-friendly lists, for merge() in another process
+        with self.lock:
+            state = {'requests': [[route, method, status, count] for (route, method, status), count in self.requests.items()]}
+            for name, series, buckets in self.series():
+                state[name] = [[route, method, histogram.counts, histogram.sum, histogram.count]
+                               for (route, method), histogram in series.items()]
+        return state
+
+    def merge(self, state):
+        with self.lock:
+            for route, method, status, count in state['requests']:
+                key = (route, method, status)
+                self.requests[key] = self.requests.get(key, 0) + count
+            for name, series, buckets in self.series():
+                for route, method, counts, total, count in state.get(name, []):
+                    if len(counts) != len(buckets) + 1:
+                        # written with other bucket bounds, before a settings change
+                        continue
+                    histogram = series.setdefault((route, method), Histogram(buckets))
+                    histogram.counts = [mine + theirs for mine, theirs in zip(histogram.counts, counts)]
+                    histogram.sum += total
+                    histogram.count += count
+
+    def observe(self, route, method, status, seconds, query_seconds, queries):
+        key = (route, method)
+        with self.lock:
+            status_key = (route, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            for series, buckets, value in (
+                (self.durations, self.latency_buckets, seconds),
+                (self.query_durations, self.latency_buckets, query_seconds),
+                (self.query_counts, self.query_buckets, queries),
+            ):
+                if key not in series:
+                    series[key] = Histogram(buckets)
+                series[key].observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# HELP http_requests_total Requests served, by route, method and status.')
+            lines.append('# TYPE http_requests_total counter')
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append('http_requests_total{{{}}} {}'.format(
+                    labels(route=route, method=method, status=status), count))
+            for name, help, series in (
+                ('http_request_duration_seconds', 'Time to build the response.', self.durations),
+                ('http_request_db_seconds', 'Time spent in SQL queries.', self.query_durations),
+                ('http_request_queries', 'SQL queries run.', self.query_counts),
+            ):
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} histogram'.format(name))
+                for (route, method), histogram in sorted(series.items()):
+                    lines.extend(renderHistogram(name, labels(route=route, method=method), histogram))
+        return lines
+
+
+def renderHistogram(name, label_text, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+        cumulative += count
+        lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label_text, bound, cumulative))
+    lines.append('{}_sum{{{}}} {}'.format(name, label_text, repr(float(histogram.sum))))
+    lines.append('{}_count{{{}}} {}'.format(name, label_text, histogram.count))
+    return lines
+
+
+def labels(**values):
+    return ','.join('{}="{}"'.format(key, escapeLabel(value)) for key, value in values.items())
+
+
+def escapeLabel(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def renderCacheStats(caches):
+    """
+    Renders the stats() of the caches named in caches as counters and gauges.
+    """
+    lines = []
+    for name, key, kind, help in (
+        ('cache_hits_total', 'hits', 'counter', 'Cache lookups answered from the cache.'),
+        ('cache_misses_total', 'misses', 'counter', 'Cache lookups that missed.'),
+        ('cache_evictions_total', 'evictions', 'counter', 'Entries evicted to make room.'),
+        ('cache_entries', 'size', 'gauge', 'Entries held.'),
+    ):
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for cache, stats in sorted(caches.items()):
+            if key in stats:
+                lines.append('{}{{{}}} {}'.format(name, labels(cache=cache), stats[key]))
+    return lines
+
+
+requestMetrics = RequestMetrics(settings.METRICS_LATENCY_BUCKETS, settings.METRICS_QUERY_BUCKETS)
+
+
+def cacheStats():
+    return {
+        "responses": responseCache.stats(),
+        "membership": membershipCache.stats(),
+    }
+
+
+'''
+metrics of all worker processes
+'''
+CACHE_COUNTERS = ('hits', 'misses', 'evictions')
+
+ARCHIVE_FILE = 'metrics-exited.json'
+
+flushLock = Lock()
+flushState = {'pid': None, 'dirty': False, 'exited': False}
+
+
+def processFile():
+    # one file per process; pids are reused, so the start time tells them apart
+    if getattr(processFile, 'pid', None) != os.getpid():
+        processFile.pid = os.getpid()
+        processFile.name = 'metrics-{}-{}.json'.format(os.getpid(), int(time.time() * 1000))
+    return os.path.join(settings.METRICS_DIR, processFile.name)
+
+
+def writeState(path, state):
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp, 'w') as file:
+        json.dump(state, file)
+    # readers see the old file or the new one, never a partial write
+    os.replace(temp, path)
+
+
+def readState(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def writeProcessState(exiting):
+    # once folded into the archive, a file written again would count twice
+    if flushState['exited']:
+        return
+    flushState['exited'] = exiting
+    writeState(processFile(), {
+        'pid': os.getpid(),
+        'exited': exiting,
+        'requests': requestMetrics.state(),
+        'caches': cacheStats(),
+    })
+
+
+def flushMetrics(exiting=False):
+    """
+    Writes this process's metrics to its file in METRICS_DIR, if set; exiting
+    marks them as the last, of a process that serves no more requests.
+    """
+    if settings.METRICS_DIR:
+        with flushLock:
+            writeProcessState(exiting)
+
+
+def metricsChanged():
+    # a thread of each process writes its file every flush interval, so no
+    # request waits on it, and the counts of workers gone idle show too
+    if settings.METRICS_DIR:
+        flushState['dirty'] = True
+        if flushState['pid'] != os.getpid():
+            flushState['pid'] = os.getpid()
+            Thread(target=flushLoop, daemon=True).start()
+
+
+def flushLoop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        if flushState['dirty']:
+            flushState['dirty'] = False
+            try:
+                flushMetrics()
+            except OSError:
+                # METRICS_DIR missing; allMetrics() creates it
+                flushState['dirty'] = True
+
+
+def processRunning(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def addCacheStats(total, caches, running):
+    for cache, stats in caches.items():
+        merged = total.setdefault(cache, {})
+        for key in CACHE_COUNTERS:
+            if key in stats:
+                merged[key] = merged.get(key, 0) + stats[key]
+        if 'size' in stats:
+            merged['size'] = merged.get('size', 0) + (stats['size'] if running else 0)
+
+
+def foldExited(directory):
+    """
+    Adds the files of processes that have exited, or were killed, into the
+    archive file and removes them, so the directory does not grow with every
+    worker restart.
+    """
+    archive = RequestMetrics(requestMetrics.latency_buckets, requestMetrics.query_buckets)
+    caches = {}
+    folded = []
+    for path in glob.glob(os.path.join(directory, 'metrics-*-*.json')):
+        state = readState(path)
+        if state is not None and (state['exited'] or not processRunning(state['pid'])):
+            archive.merge(state['requests'])
+            addCacheStats(caches, state['caches'], False)
+            folded.append(path)
+    if not folded:
+        return
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    previous = readState(archive_path)
+    if previous is not None:
+        archive.merge(previous['requests'])
+        addCacheStats(caches, previous['caches'], False)
+    writeState(archive_path, {'pid': 0, 'exited': True, 'requests': archive.state(), 'caches': caches})
+    for path in folded:
+        os.remove(path)
+
+
+def allMetrics():
+    """
+    The lines the metrics endpoint serves: this process's metrics, or with
+    METRICS_DIR set, the sum of every process's.
+    """
+    if not settings.METRICS_DIR:
+        return requestMetrics.render() + renderCacheStats(cacheStats())
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    flushMetrics()
+    total = RequestMetrics(requestMetrics.latency_buckets, requestMetrics.query_buckets)
+    caches = {}
+    # processes scraping at once take turns, so none reads a file another
+    # is folding into the archive
+    with open(os.path.join(settings.METRICS_DIR, 'metrics.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        foldExited(settings.METRICS_DIR)
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            state = readState(path)
+            if state is not None:
+                total.merge(state['requests'])
+                addCacheStats(caches, state['caches'], not state['exited'])
+    return total.render() + renderCacheStats(caches)
+
+
+'''
+middleware
+'''
+@sync_and_async_middleware
+def metricsMiddleware(get_response):
+    # connections opened before this point never fire connection_created
+    for connection in connections.all():
+        instrumentConnection(connection)
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            timer = RequestTimer()
+            token = currentTimer.set(timer)
+            try:
+                response = await get_response(request)
+            finally:
+                currentTimer.reset(token)
+            return recordRequest(request, response, timer)
+    else:
+        def middleware(request):
+            timer = RequestTimer()
+            token = currentTimer.set(timer)
+            try:
+                response = get_response(request)
+            finally:
+                currentTimer.reset(token)
+            return recordRequest(request, response, timer)
+    return middleware
+
+
+def recordRequest(request, response, timer):
+    # streamed bodies are produced after this, so only their setup is timed
+    seconds = time.perf_counter() - timer.start
+    match = request.resolver_match
+    route = match.route if match is not None else 'unmatched'
+    requestMetrics.observe(route, request.method, response.status_code, seconds, timer.query_seconds, timer.queries)
+    metricsChanged()
+    response['Server-Timing'] = 'app;dur={:.2f}, db;dur={:.2f};desc="{} queries"'.format(
+        seconds * 1000, timer.query_seconds * 1000, timer.queries)
+    return response
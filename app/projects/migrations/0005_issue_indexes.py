@@ -0,0 +1,37 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_alter_issue_desc'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', '-creation_date', '-id'], name='issue_project_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['assignee', '-creation_date', '-id'], name='issue_assignee_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['status', '-creation_date', '-id'], name='issue_status_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['type', '-creation_date', '-id'], name='issue_type_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['-creation_date', '-id'], name='issue_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'sprint'], name='issue_project_sprint_idx'),
+        ),
+    ]
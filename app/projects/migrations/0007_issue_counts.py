@@ -0,0 +1,53 @@
+# Generated by Django 4.0.2 on 2026-10-18 21:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def countIssues(apps, schema_editor):
+    Issue = apps.get_model('projects', 'Issue')
+    for owner, name in (('project_id', 'ProjectIssueCount'), ('sprint_id', 'SprintIssueCount')):
+        Counter = apps.get_model('projects', name)
+        groups = Issue.objects.values_list(owner, 'status', 'type').annotate(total=Count('id')).order_by()
+        Counter.objects.bulk_create([
+            Counter(**{owner: owner_id, 'status': status, 'type': type, 'count': total})
+            for owner_id, status, type, total in groups
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SprintIssueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=32)),
+                ('type', models.CharField(max_length=32)),
+                ('count', models.IntegerField(default=0)),
+                ('sprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issue_counts', to='projects.sprint')),
+            ],
+            options={
+                'unique_together': {('sprint', 'status', 'type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectIssueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=32)),
+                ('type', models.CharField(max_length=32)),
+                ('count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issue_counts', to='projects.project')),
+            ],
+            options={
+                'unique_together': {('project', 'status', 'type')},
+            },
+        ),
+        migrations.RunPython(countIssues, migrations.RunPython.noop),
+    ]
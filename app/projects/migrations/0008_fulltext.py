@@ -0,0 +1,50 @@
+# Generated by Django 4.0.2 on 2026-10-18 22:05
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# a GIN index only exists on Postgres; other databases search IssueTerm
+def createVectorIndex(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX issuedocument_vector_idx ON projects_issuedocument USING gin (vector)')
+
+
+def dropVectorIndex(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS issuedocument_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_issue_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueDocument',
+            fields=[
+                ('issue', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='projects.issue')),
+                ('title', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('comments', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IssueTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='projects.issue')),
+            ],
+            options={
+                'unique_together': {('term', 'issue')},
+            },
+        ),
+        migrations.RunPython(createVectorIndex, dropVectorIndex),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.0.2 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64)),
+                ('kind', models.CharField(max_length=16)),
+                ('legacy_id', models.CharField(max_length=64)),
+                ('object_id', models.IntegerField()),
+            ],
+            options={
+                'unique_together': {('source', 'kind', 'legacy_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64)),
+                ('path', models.CharField(max_length=255)),
+                ('records', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('source', 'path')},
+            },
+        ),
+    ]
@@ -1,12 +1,51 @@
 from statistics import mode
 from xml.etree.ElementTree import TreeBuilder
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
 
-class Project(models.Model):
+class LoggedModel(models.Model):
+    """
+    Saves in a transaction, so the change log entry the post_save signal
+    writes (see changes.py) commits or rolls back with the row itself.
+
+    Keeps the column values last loaded or saved in _loaded_values, which
+    the entry is computed against, so it holds only the columns that changed.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.snapshot()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self.snapshot()
+
+    def snapshot(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = dict(
+            (field.attname, field.value_from_object(self))
+            for field in self._meta.concrete_fields if field.attname not in deferred
+        )
+
+
+class Project(LoggedModel):
     name = models.CharField(max_length=32)
     desc = models.CharField(max_length=100, blank=True)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -15,7 +54,7 @@ class Project(models.Model):
         ordering = ['name']
 
 
-class User(models.Model):
+class User(LoggedModel):
     name = models.CharField(max_length=32)
     active = models.BooleanField()
     projects = models.ManyToManyField(Project, blank=True)
@@ -39,11 +78,12 @@ class User(models.Model):
         return "User name: {}".format(self.name)
 
 
-class Sprint(models.Model):
+class Sprint(LoggedModel):
     name = models.CharField(max_length=32)
     start_date = models.DateTimeField(null=True)
     end_date = models.DateTimeField(null=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -52,14 +92,14 @@ class Sprint(models.Model):
         unique_together = (('name', 'project'))
 
 
-class Label(models.Model):
+class Label(LoggedModel):
     value = models.CharField(max_length=32)
 
     def __str__(self):
         return self.value
 
 
-class Issue(models.Model):
+class Issue(LoggedModel):
     summary = models.CharField(max_length=32)
     creation_date = models.DateTimeField(auto_now_add=True)
     desc = models.CharField(max_length=100, blank=True)
@@ -71,18 +111,59 @@ class Issue(models.Model):
     # open -> assigned -> inprogress -> under review -> done -> close
     status = models.CharField(max_length=32, default="open", blank=True)
     statusList = ["open", "assigned", "inprogress", "under review", "done", "close"]
+    # transition tables: the only status each one moves to, and back
+    nextStatus = dict(zip(statusList, statusList[1:]))
+    previousStatus = dict(zip(statusList[1:], statusList))
 
     labels = models.ManyToManyField(Label, blank=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     assignee = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="assignee")
     sprint = models.ForeignKey(Sprint, on_delete=models.CASCADE)
     watchers = models.ManyToManyField(User, blank=True, related_name="watchers")
+    # also touched by set-based updates and label/watcher changes, so it can
+    # stand in for the issue's whole representation when computing ETags
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.summary
 
     class Meta:
         unique_together = (('summary', 'project'))
+        # composite indexes for the hot list and search filters; the trailing
+        # (creation_date, id) columns match the order lists are paginated in
+        indexes = [
+            models.Index(fields=['project', '-creation_date', '-id'], name='issue_project_recent_idx'),
+            models.Index(fields=['assignee', '-creation_date', '-id'], name='issue_assignee_recent_idx'),
+            models.Index(fields=['status', '-creation_date', '-id'], name='issue_status_recent_idx'),
+            models.Index(fields=['type', '-creation_date', '-id'], name='issue_type_recent_idx'),
+            models.Index(fields=['-creation_date', '-id'], name='issue_recent_idx'),
+            models.Index(fields=['project', 'sprint'], name='issue_project_sprint_idx'),
+            models.Index(fields=['project', 'updated_at'], name='issue_project_updated_idx'),
+        ]
+
+    # the columns issue counters are keyed on
+    countedFields = ('project_id', 'sprint_id', 'status', 'type')
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        counted = update_fields is None or bool(set(update_fields) & {'project', 'sprint', 'status', 'type'})
+
+        # counters change in the same transaction as the issue row; the old
+        # row is locked so concurrent saves cannot count the same change twice
+        with transaction.atomic():
+            old = None
+            if counted and self.pk is not None:
+                old = (Issue.objects
+                        .select_for_update()
+                        .filter(pk=self.pk)
+                        .values_list(*self.countedFields)
+                        .first())
+            super().save(*args, **kwargs)
+            if counted:
+                recountIssue(old, self.countKey())
+
+    def countKey(self):
+        return tuple(getattr(self, field) for field in self.countedFields)
 
     def setAssignee(self, user):
         self.assignee = user
@@ -100,35 +181,25 @@ class Issue(models.Model):
         self.watchers.remove(watcher)
 
     def isWatcher(self, watcher):
-        if watcher in self.watchers.all():
-                return True
-        return False
+        # an indexed lookup on the through table's (issue, user) constraint
+        return self.watchers.filter(pk=watcher.pk).exists()
+
+    def canUpdateStatus(self, updated_status):
+        return self.nextStatus.get(self.status) == updated_status
 
     def updateStatus(self, updated_status):
-        lastStatus = "close"
-        if self.status == lastStatus:
-            print("Issues status = {}, it can no longer be updated".format(self.status))
-        else:
-            statusList = self.statusList
-            for i in range(len(statusList)):
-                if self.status == statusList[i]:
-                    break
-
-            if updated_status == statusList[i + 1]:
-                print(
-                    "Issue status successfully updated from {} to {}"
-                    .format(self.status, updated_status))
-                self.status = updated_status
-            else:
-                print(
-                    "Issue status cannot be updated from {} to {}"
-                    .format(self.status, updated_status))
-
-
-class Comment(models.Model):
+        # in-memory only; see transitions.py for the conditional UPDATE
+        if not self.canUpdateStatus(updated_status):
+            return False
+        self.status = updated_status
+        return True
+
+
+class Comment(LoggedModel):
     text = models.CharField(max_length=32)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     issue = models.ForeignKey(Issue, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def setText(self, newText):
         self.text = newText
@@ -143,9 +214,198 @@ class Comment(models.Model):
         return self.text
 
 
+class IssueCount(models.Model):
+    """
+    Number of issues with one status and type, per project or per sprint.
+
+    Kept up to date in the same transaction as every issue write: Issue.save(),
+    the issue post_delete signal and the bulk move in move_issues. The
+    rebuildcounters command recomputes them from the issues table.
+    """
+    status = models.CharField(max_length=32)
+    type = models.CharField(max_length=32)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def adjust(cls, owner_id, status, type, delta):
+        if owner_id is None or delta == 0:
+            return
+        counter = cls.objects.filter(**{cls.owner_field + '_id': owner_id, 'status': status, 'type': type})
+        if counter.update(count=F('count') + delta) or delta < 0:
+            # a missing row has nothing to take away from
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(count=delta, **{cls.owner_field + '_id': owner_id, 'status': status, 'type': type})
+        except IntegrityError:
+            # created by a concurrent write meanwhile
+            counter.update(count=F('count') + delta)
+
+
+class ProjectIssueCount(IssueCount):
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='issue_counts')
+    owner_field = 'project'
+
+    class Meta:
+        unique_together = (('project', 'status', 'type'))
+
+
+class SprintIssueCount(IssueCount):
+    sprint = models.ForeignKey(Sprint, on_delete=models.CASCADE, related_name='issue_counts')
+    owner_field = 'sprint'
+
+    class Meta:
+        unique_together = (('sprint', 'status', 'type'))
+
+
+def recountIssue(old, new):
+    """
+    Moves one issue between counters; old and new are Issue.countKey() tuples,
+    either of which is None for a created or deleted issue.
+    """
+    if old == new:
+        return
+    for index, Counter in ((0, ProjectIssueCount), (1, SprintIssueCount)):
+        old_key = old and (old[index], old[2], old[3])
+        new_key = new and (new[index], new[2], new[3])
+        if old_key == new_key:
+            continue
+        if old_key:
+            Counter.adjust(*old_key, -1)
+        if new_key:
+            Counter.adjust(*new_key, 1)
+
+
+class IssueDocument(models.Model):
+    """
+    The text full-text search matches an issue on: its summary, description
+    and the text of its comments, refreshed by fulltext.indexIssues() whenever
+    one of them is written. On Postgres, vector holds the weighted tsvector
+    of the three and is covered by a GIN index (see migration 0008).
+    """
+    issue = models.OneToOneField(Issue, on_delete=models.CASCADE, primary_key=True, related_name='document')
+    title = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    comments = models.TextField(blank=True)
+    vector = SearchVectorField(null=True)
+
+
+class IssueTerm(models.Model):
+    """
+    Postings of the pure-Python inverted index used instead of the tsvector
+    on other databases: one row per issue and term, weighted by where and how
+    often the term occurs.
+    """
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    class Meta:
+        unique_together = (('term', 'issue'))
 
 
 
+class ImportMapping(models.Model):
+    """
+    The row an imported record became, keyed on the id it had in the tracker
+    it came from; later records, and resumed imports, resolve references to
+    it through this table (see importer.py).
+    """
+    source = models.CharField(max_length=64)
+    kind = models.CharField(max_length=16)
+    legacy_id = models.CharField(max_length=64)
+    object_id = models.IntegerField()
 
+    class Meta:
+        unique_together = (('source', 'kind', 'legacy_id'))
 
 
+class ImportCheckpoint(models.Model):
+    """
+    How many records of an import file have been committed; a rerun of the
+    import skips that many and carries on from there.
+    """
+    source = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    records = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('source', 'path'))
+
+
+class Change(models.Model):
+    """
+    One entry of the append-only change log the changes endpoint syncs from:
+    a row created, updated or deleted, or links of it added or removed. data
+    holds the values written (see changes.py). Entries are written in the
+    same transaction as the change and never updated; project_id and
+    entity_id are plain columns so they outlive the rows they name.
+
+    txid is the id of the writing transaction on Postgres (0 elsewhere), and
+    the log is read in (txid, id) order, see changes.changesAfter().
+    """
+    project_id = models.IntegerField(null=True)
+    entity = models.CharField(max_length=16)
+    entity_id = models.IntegerField()
+    action = models.CharField(max_length=16)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    txid = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project_id', 'txid', 'id'], name='change_project_idx'),
+            models.Index(fields=['txid', 'id'], name='change_log_idx'),
+        ]
+
+
+class Job(models.Model):
+    """
+    A unit of background work, such as notifying watchers, queued in the
+    same transaction as the write that calls for it and run by the runjobs
+    command (see jobs.py). run_after is when a queued job is due, or for a
+    running one when its claim expires and another worker may take it over.
+    Jobs that are done are deleted; failed ones are kept with their error.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=16, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField()
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_due_idx'),
+            models.Index(fields=['locked_by'], name='job_claim_idx'),
+        ]
+
+
+class Notification(models.Model):
+    """
+    An issue change told to one of its watchers; one per watcher and change
+    log entry, so a job that runs twice notifies once.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE)
+    change = models.ForeignKey(Change, on_delete=models.CASCADE)
+    text = models.CharField(max_length=100)
+    read = models.BooleanField(default=False)
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('change', 'user'))
+        indexes = [
+            models.Index(fields=['user', '-creation_date', '-id'], name='notification_user_recent_idx'),
+        ]
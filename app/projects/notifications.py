@@ -0,0 +1,71 @@
+'''
+Watcher notifications, sent in the background.
+
+A write that changes an issue or comments on it queues one notify_watchers
+job naming its change log entries (see changes.logChanges()), so the request
+pays for one INSERT however many watchers there are. The job's handler turns
+a batch of such jobs into Notification rows for the issues' watchers with a
+few queries for the whole batch; (change, user) is unique, so a job run
+twice does not notify twice.
+'''
+from .jobs import enqueue, jobHandler
+from .models import Issue, Change, Notification
+
+
+NOTIFY_WATCHERS = 'notify_watchers'
+
+
+def notifies(change):
+    # a created issue has no watchers yet, and a deleted one none left
+    if change.entity == 'issue':
+        if change.action == 'updated':
+            # updated_at alone is touched by writes that say nothing new
+            return bool(set(change.data) - {'updated_at'})
+        return change.action not in ('created', 'deleted')
+    return change.entity == 'comment' and change.action == 'created'
+
+
+def notifyWatchers(changes):
+    change_ids = [change.id for change in changes if notifies(change)]
+    if change_ids:
+        enqueue(NOTIFY_WATCHERS, {"changes": change_ids})
+
+
+@jobHandler(NOTIFY_WATCHERS)
+def sendNotifications(payloads):
+    change_ids = [change_id for payload in payloads for change_id in payload["changes"]]
+    changes = list(Change.objects.filter(id__in=change_ids).order_by('id'))
+    issue_ids = set(issueOf(change) for change in changes)
+
+    summaries = dict(Issue.objects.filter(id__in=issue_ids).values_list('id', 'summary'))
+    watchers = {}
+    for issue_id, user_id in (Issue.watchers.through.objects
+                                .filter(issue_id__in=list(summaries))
+                                .values_list('issue_id', 'user_id')):
+        watchers.setdefault(issue_id, []).append(user_id)
+
+    notifications = []
+    for change in changes:
+        issue_id = issueOf(change)
+        text = describe(change, summaries.get(issue_id))
+        for user_id in watchers.get(issue_id, []):
+            notifications.append(Notification(user_id=user_id, issue_id=issue_id, change_id=change.id, text=text))
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+
+
+def issueOf(change):
+    if change.entity == 'comment':
+        return change.data.get("issue_id")
+    return change.entity_id
+
+
+def describe(change, summary):
+    if change.entity == 'comment':
+        text = "New comment on {}: {}".format(summary, change.data.get("text", ""))
+    elif change.action in ('added', 'removed'):
+        text = "{} {} on {}".format(", ".join(sorted(change.data)).capitalize(), change.action, summary)
+    else:
+        fields = sorted(name[:-3] if name.endswith('_id') else name for name in change.data if name != 'updated_at')
+        text = "{} changed: {}".format(summary, ", ".join(fields))
+    max_length = Notification._meta.get_field('text').max_length
+    return text[:max_length]
@@ -0,0 +1,150 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .changes import changeRow
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination keyed on (creation_date, id), newest first.
+
+    A page is selected by filtering past the last row of the previous page
+    rather than by OFFSET, so every page costs the same and no COUNT(*) is
+    ever issued. One extra row is fetched to know whether a next page exists.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = settings.ISSUE_PAGE_SIZE
+    max_page_size = settings.ISSUE_MAX_PAGE_SIZE
+    ordering = ('-creation_date', '-id')
+    # the row fields a cursor is made of
+    cursor_fields = ('creation_date', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.getPageSize(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decodeCursor(request)
+        if position is not None:
+            created, pk = position
+            queryset = (queryset
+                        .filter(creation_date__lte=created)
+                        .exclude(creation_date=created, id__gte=pk))
+
+        # the page is evaluated by whoever serializes it
+        return queryset[:self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        return Response(self.getPaginatedData(data))
+
+    def getPaginatedData(self, data):
+        results = list(data)
+        next_link = None
+        if len(results) > self.page_size:
+            results = results[:self.page_size]
+            last = results[-1]
+            next_link = self.getNextLink(*[last[field] for field in self.cursor_fields])
+        return OrderedDict([
+            ('next', next_link),
+            ('results', results),
+        ])
+
+    def getPageSize(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def getNextLink(self, created, pk):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encodeCursor(created, pk))
+
+    def encodeCursor(self, created, pk):
+        token = "{}|{}".format(created, pk)
+        return urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+
+    def decodeCursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            token = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            position, pk = token.rsplit('|', 1)
+            position = self.parsePosition(position)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if position is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position, pk
+
+    def parsePosition(self, value):
+        return parse_datetime(value)
+
+
+class RankPagination(KeysetPagination):
+    """
+    Pages through ranked full-text matches, best first, keyed on (rank, id).
+    The matches of a page are looked up by fulltext.rankedMatches(), which
+    takes the decoded cursor and the page size from this paginator.
+    """
+    cursor_fields = ('rank', 'id')
+
+    def getPosition(self, request):
+        self.request = request
+        self.page_size = self.getPageSize(request)
+        return self.decodeCursor(request)
+
+    def parsePosition(self, value):
+        return float(value)
+
+
+class ChangePagination(KeysetPagination):
+    """
+    Pages through the change log in the order it was written, keyed on
+    (txid, id); see changes.changesAfter(). Unlike the lists, every page links
+    to the next one: once a client has read everything, it polls that link
+    for what is written next, and "more" tells whether to ask again at once.
+    """
+    cursor_query_param = 'since'
+    page_size = settings.CHANGES_PAGE_SIZE
+    max_page_size = settings.CHANGES_MAX_PAGE_SIZE
+    cursor_fields = ('txid', 'id')
+
+    def getPosition(self, request):
+        self.request = request
+        self.page_size = self.getPageSize(request)
+        self.position = self.decodeCursor(request)
+        return self.position
+
+    def getPaginatedData(self, changes):
+        more = len(changes) > self.page_size
+        changes = changes[:self.page_size]
+        if changes:
+            next_link = self.getNextLink(*[getattr(changes[-1], field) for field in self.cursor_fields])
+        elif self.position is not None:
+            next_link = self.getNextLink(*self.position)
+        else:
+            next_link = self.request.build_absolute_uri()
+        return OrderedDict([
+            ('next', next_link),
+            ('more', more),
+            ('results', [changeRow(change) for change in changes]),
+        ])
+
+    def parsePosition(self, value):
+        return int(value)
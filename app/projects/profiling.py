@@ -0,0 +1,177 @@
+'''
+Opt-in profiling of single requests.
+
+With PROFILING_DIR set, profilingMiddleware runs a request under cProfile
+when it carries an X-Profile header equal to PROFILING_TOKEN, or at random
+for a PROFILING_SAMPLE_RATE fraction of requests. For each profiled request
+it writes two files to PROFILING_DIR:
+
+  <name>.prof  the raw profile, for pstats or snakeviz
+  <name>.txt   a summary: wall time, time in SQL queries (measured by the
+               execute wrapper of metrics.py, as in Server-Timing), self time
+               by component (database driver, Django ORM, DRF, this app, the
+               rest) and the top functions by cumulative time
+
+and names the summary in the response's X-Profile header. Without
+PROFILING_DIR the middleware removes itself from the stack.
+
+Only one request is profiled at a time per process; others that ask while
+one is running are served unprofiled. For async views, only the event loop
+thread is profiled; their queries still count towards the SQL time.
+'''
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import RequestTimer, currentTimer
+
+
+PROFILE_HEADER = 'X-Profile'
+
+# path fragments of the code each component's self time is summed over
+COMPONENTS = (
+    ('database driver', ('sqlite3', 'psycopg2')),
+    ('django orm', ('django/db/',)),
+    ('rest framework', ('rest_framework/',)),
+    ('projects', ('/projects/',)),
+)
+
+profileLock = Lock()
+
+
+@sync_and_async_middleware
+def profilingMiddleware(get_response):
+    if not settings.PROFILING_DIR:
+        raise MiddlewareNotUsed()
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not wantsProfile(request):
+                return await get_response(request)
+            if not profileLock.acquire(blocking=False):
+                return markBusy(await get_response(request))
+            try:
+                run = ProfiledRun()
+                try:
+                    response = await get_response(request)
+                finally:
+                    run.stop()
+                return saveProfile(request, response, run)
+            finally:
+                profileLock.release()
+    else:
+        def middleware(request):
+            if not wantsProfile(request):
+                return get_response(request)
+            if not profileLock.acquire(blocking=False):
+                return markBusy(get_response(request))
+            try:
+                run = ProfiledRun()
+                try:
+                    response = get_response(request)
+                finally:
+                    run.stop()
+                return saveProfile(request, response, run)
+            finally:
+                profileLock.release()
+    return middleware
+
+
+def wantsProfile(request):
+    token = request.headers.get(PROFILE_HEADER)
+    if token is not None and settings.PROFILING_TOKEN:
+        return hmac.compare_digest(token.encode(), settings.PROFILING_TOKEN.encode())
+    return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+class ProfiledRun:
+    """
+    A cProfile run plus the SQL time and count of the same stretch, read off
+    the request's timer when metricsMiddleware has set one.
+    """
+
+    def __init__(self):
+        self.timer = currentTimer.get()
+        self.token = None
+        if self.timer is None:
+            self.timer = RequestTimer()
+            self.token = currentTimer.set(self.timer)
+        self.start_queries = self.timer.queries
+        self.start_query_seconds = self.timer.query_seconds
+        self.start = time.perf_counter()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.seconds = time.perf_counter() - self.start
+        self.queries = self.timer.queries - self.start_queries
+        self.query_seconds = self.timer.query_seconds - self.start_query_seconds
+        if self.token is not None:
+            currentTimer.reset(self.token)
+
+
+def markBusy(response):
+    response[PROFILE_HEADER] = 'busy'
+    return response
+
+
+def saveProfile(request, response, run):
+    match = request.resolver_match
+    route = match.route if match is not None else 'unmatched'
+    name = '{}-{}-{}-{}'.format(
+        timezone.now().strftime('%Y%m%dT%H%M%S%f'), request.method.lower(),
+        re.sub(r'[^a-zA-Z0-9]+', '_', route).strip('_') or 'root', os.getpid())
+    path = os.path.join(settings.PROFILING_DIR, name)
+
+    run.profile.dump_stats(path + '.prof')
+    with open(path + '.txt', 'w') as file:
+        file.write(summarize(request, response, run))
+
+    response[PROFILE_HEADER] = name + '.txt'
+    return response
+
+
+def summarize(request, response, run):
+    stats = pstats.Stats(run.profile)
+    components = dict((component, 0.0) for component, _ in COMPONENTS)
+    components['other'] = 0.0
+    for (filename, _, function), (_, _, self_time, _, _) in stats.stats.items():
+        # built-ins such as the driver's execute() have no file of their own
+        location = filename if filename != '~' else function
+        for component, fragments in COMPONENTS:
+            if any(fragment in location for fragment in fragments):
+                components[component] += self_time
+                break
+        else:
+            components['other'] += self_time
+
+    lines = [
+        '{} {} -> {}'.format(request.method, request.get_full_path(), response.status_code),
+        'wall time {:.2f} ms, of which {} SQL queries {:.2f} ms ({:.0f}%)'.format(
+            run.seconds * 1000, run.queries, run.query_seconds * 1000,
+            run.query_seconds / run.seconds * 100 if run.seconds else 0),
+        '',
+        'self time by component (profiled, ms):',
+    ]
+    for component, total in sorted(components.items(), key=lambda item: -item[1]):
+        lines.append('  {:<16} {:>10.2f}'.format(component, total * 1000))
+
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats('cumulative').print_stats(settings.PROFILING_TOP_FUNCTIONS)
+    lines.extend(['', 'top functions by cumulative time:', out.getvalue().strip('\n')])
+    return '\n'.join(lines) + '\n'
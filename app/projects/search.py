@@ -0,0 +1,360 @@
+'''
+Query language for search_issues, read from the query string.
+
+Every field is optional and only supplied fields become predicates:
+
+    ?project=1&status=open,assigned&label=2|3&creation_date=2022-03-01..2022-04-01
+
+A comma or "|" separates the values of an IN-list. creation_date takes a
+half-open range "start..end" where either end may be left out; dates without
+a time start at midnight. assignee=null matches unassigned issues. Top-level
+parameters are ANDed together, and with q, which nests groups:
+
+    ?q=or(and(status:open,type:bug),label:4|5)
+
+Before a predicate is built, terms on the same field are merged (intersected
+inside and(), unioned inside or()) so a group over one field becomes a single
+indexed IN, and a group that can match nothing is pruned without a query.
+Labels are matched with a subquery on the through table, so an issue is
+returned once however many of its labels match.
+
+    ?facets=status,label&facet_limit=5
+
+adds the number of matching issues per status, type, assignee or label (the
+top facet_limit values of each) to the page, see facetCounts().
+'''
+import re
+from datetime import datetime, time
+
+from django.db.models import BigIntegerField, CharField, Count, F, IntegerField, Q, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Issue
+
+
+# query parameters that are not search fields
+RESERVED_PARAMS = ('q', 'cursor', 'page_size', 'stream', 'format', 'facets', 'facet_limit')
+
+# field name -> column; labels are matched through their link table
+SEARCH_FIELDS = {
+    'project': 'project_id',
+    'assignee': 'assignee_id',
+    'status': 'status',
+    'type': 'type',
+    'desc': 'desc',
+    'label': None,
+}
+INTEGER_FIELDS = ('project', 'assignee', 'label')
+RANGE_FIELD = 'creation_date'
+
+# pruned predicates
+MATCH_ALL = ('all',)
+MATCH_NONE = ('none',)
+
+
+class SearchError(ValueError):
+    pass
+
+
+def compileSearch(params):
+    """
+    Returns the Q object selecting the issues that params (a QueryDict)
+    describe, raising SearchError for anything that does not parse.
+    """
+    terms = []
+    for name in params:
+        if name in RESERVED_PARAMS:
+            continue
+        values = [value for raw in params.getlist(name) for value in re.split(r'[,|]', raw)]
+        terms.append(parseTerm(name, values))
+    if params.get('q'):
+        terms.append(Parser(params['q']).parse())
+    return toQ(prune('and', terms))
+
+
+'''
+parsing
+'''
+def parseTerm(name, values):
+    values = [value.strip() for value in values if value.strip()]
+    if not values:
+        raise SearchError("Search Error: No value given for '{}'.".format(name))
+
+    if name == RANGE_FIELD:
+        if len(values) != 1:
+            raise SearchError("Search Error: '{}' takes one range, 'start..end'.".format(name))
+        return parseRange(values[0])
+
+    if name not in SEARCH_FIELDS:
+        raise SearchError("Search Error: Cannot search on '{}'.  Must be one of {}."
+                            .format(name, list(SEARCH_FIELDS) + [RANGE_FIELD]))
+
+    if name in INTEGER_FIELDS:
+        parsed = set()
+        for value in values:
+            if name == 'assignee' and value == 'null':
+                parsed.add(None)
+                continue
+            try:
+                parsed.add(int(value))
+            except ValueError:
+                raise SearchError("Search Error: '{}' values must be integers, got '{}'.".format(name, value))
+        return ('in', name, frozenset(parsed))
+    return ('in', name, frozenset(values))
+
+
+def parseRange(value):
+    if '..' not in value:
+        raise SearchError("Search Error: '{}' takes a range 'start..end', got '{}'.".format(RANGE_FIELD, value))
+    start, end = value.split('..', 1)
+    start, end = parseMoment(start), parseMoment(end)
+    if start is None and end is None:
+        raise SearchError("Search Error: '{}' range needs a start or an end.".format(RANGE_FIELD))
+    return ('range', start, end)
+
+
+def parseMoment(value):
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise SearchError("Search Error: '{}' is not a date or datetime.".format(value))
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Parser:
+    """
+    Recursive descent over q:  expr := ('and' | 'or') '(' expr (',' expr)* ')'
+                                     | field ':' value ('|' value)*
+    """
+    token = re.compile(r'\s*(and\(|or\(|\)|,|[^,()]+)')
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = self.token.match(text, position)
+            if match is None:
+                break
+            self.tokens.append(match.group(1).strip())
+            position = match.end()
+        self.position = 0
+
+    def parse(self):
+        expression = self.expression()
+        if self.position != len(self.tokens):
+            raise SearchError("Search Error: Unexpected '{}' in q.".format(self.tokens[self.position]))
+        return expression
+
+    def next(self):
+        if self.position == len(self.tokens):
+            raise SearchError("Search Error: q ends early: '{}'.".format(self.text))
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expression(self):
+        token = self.next()
+        if token in ('and(', 'or('):
+            operator = token[:-1]
+            children = [self.expression()]
+            token = self.next()
+            while token == ',':
+                children.append(self.expression())
+                token = self.next()
+            if token != ')':
+                raise SearchError("Search Error: Expected ')' in q, got '{}'.".format(token))
+            return prune(operator, children)
+
+        if ':' not in token:
+            raise SearchError("Search Error: Expected 'field:value' in q, got '{}'.".format(token))
+        name, values = token.split(':', 1)
+        return parseTerm(name.strip(), values.split('|'))
+
+
+'''
+pruning
+'''
+def prune(operator, children):
+    """
+    Merges the terms of an and/or group that share a field and drops the
+    members that cannot change its result.
+    """
+    identity, absorbing = (MATCH_ALL, MATCH_NONE) if operator == 'and' else (MATCH_NONE, MATCH_ALL)
+    fields = {}
+    ranges = []
+    groups = []
+    for child in children:
+        if child == absorbing:
+            return absorbing
+        if child == identity:
+            continue
+        if child[0] == 'in':
+            _, name, values = child
+            if name not in fields:
+                fields[name] = values
+            elif operator == 'and':
+                fields[name] = fields[name] & values
+            else:
+                fields[name] = fields[name] | values
+        elif child[0] == 'range':
+            ranges.append(child)
+        else:
+            groups.append(child)
+
+    terms = []
+    for name, values in fields.items():
+        if not values:
+            # and() over disjoint value lists
+            return MATCH_NONE
+        terms.append(('in', name, values))
+
+    if operator == 'and' and ranges:
+        starts = [start for _, start, _ in ranges if start is not None]
+        ends = [end for _, _, end in ranges if end is not None]
+        start = max(starts) if starts else None
+        end = min(ends) if ends else None
+        if start is not None and end is not None and start >= end:
+            return MATCH_NONE
+        ranges = [('range', start, end)]
+
+    members = terms + ranges + groups
+    if not members:
+        return identity
+    if len(members) == 1:
+        return members[0]
+    return (operator, tuple(members))
+
+
+def toQ(node):
+    kind = node[0]
+    if kind == 'all':
+        return Q()
+    if kind == 'none':
+        return Q(pk__in=[])
+
+    if kind == 'in':
+        _, name, values = node
+        if name == 'label':
+            links = Issue.labels.through.objects.filter(label_id__in=values).values('issue_id')
+            return Q(id__in=links)
+        column = SEARCH_FIELDS[name]
+        known = sorted(value for value in values if value is not None)
+        predicate = Q()
+        if len(known) == 1:
+            predicate = Q(**{column: known[0]})
+        elif known:
+            predicate = Q(**{column + '__in': known})
+        if None in values:
+            predicate |= Q(**{column + '__isnull': True})
+        return predicate
+
+    if kind == 'range':
+        _, start, end = node
+        predicate = Q()
+        if start is not None:
+            predicate &= Q(creation_date__gte=start)
+        if end is not None:
+            predicate &= Q(creation_date__lt=end)
+        return predicate
+
+    _, members = node
+    predicate = toQ(members[0])
+    for member in members[1:]:
+        predicate = predicate & toQ(member) if kind == 'and' else predicate | toQ(member)
+    return predicate
+
+
+'''
+facets
+'''
+# facet name -> (issue column, output field of its placeholder)
+FACETS = {
+    'status': ('status', CharField()),
+    'type': ('type', CharField()),
+    'assignee': ('assignee_id', BigIntegerField()),
+    'label': (None, BigIntegerField()),
+}
+
+
+def parseFacets(params):
+    """
+    Returns the facet names requested in params and the top-K limit (None for
+    every value), raising SearchError if either does not parse.
+    """
+    names = []
+    for raw in params.getlist('facets'):
+        for name in re.split(r'[,|]', raw):
+            name = name.strip()
+            if not name or name in names:
+                continue
+            if name not in FACETS:
+                raise SearchError("Search Error: No facet '{}'.  Must be one of {}.".format(name, list(FACETS)))
+            names.append(name)
+
+    limit = params.get('facet_limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            raise SearchError("Search Error: 'facet_limit' must be a positive integer.")
+    return names, limit
+
+
+def facetCounts(issues, names, limit=None):
+    """
+    Counts the issues in the queryset per value of each named facet with one
+    statement, however many facets are asked for: a single GROUP BY over the
+    matching issues covers every column facet, and labels, which live in the
+    link table, are grouped in a second branch of the same UNION ALL.
+    Returns {facet: [{"value": ..., "count": ...}, ...]}, largest count first.
+    """
+    issues = issues.prefetch_related(None).order_by()
+    keys = ['facet_branch'] + ['facet_' + name for name in FACETS]
+
+    def branch(queryset, number, real):
+        # every branch selects every facet column, as NULL where not grouped
+        columns = {'facet_branch': Value(number, output_field=IntegerField())}
+        for name, (column, output) in FACETS.items():
+            columns['facet_' + name] = real[name] if name in real else Value(None, output_field=output)
+        return queryset.annotate(**columns).values(*keys).annotate(total=Count('id'))
+
+    branches = []
+    grouped = [name for name in names if FACETS[name][0] is not None]
+    if grouped:
+        branches.append(branch(issues, 0, {name: F(FACETS[name][0]) for name in grouped}))
+    if 'label' in names:
+        links = Issue.labels.through.objects.filter(issue_id__in=issues.values('id'))
+        branches.append(branch(links, 1, {'label': F('label_id')}))
+
+    counts = {name: {} for name in names}
+    if branches:
+        query = branches[0].union(*branches[1:], all=True) if len(branches) > 1 else branches[0]
+        for row in query.values_list(*keys, 'total'):
+            number, values, total = row[0], dict(zip(FACETS, row[1:])), row[-1]
+            if number == 1:
+                counts['label'][values['label']] = total
+                continue
+            for name in grouped:
+                counts[name][values[name]] = counts[name].get(values[name], 0) + total
+
+    facets = {}
+    for name in names:
+        ranked = sorted(counts[name].items(), key=lambda item: (-item[1], str(item[0])))
+        if limit is not None:
+            ranked = ranked[:limit]
+        facets[name] = [{"value": value, "count": total} for value, total in ranked]
+    return facets
+
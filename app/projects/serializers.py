@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Project, User, Issue, Label, Sprint, Comment
+from .models import Project, User, Issue, Label, Sprint, Comment, Notification
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -34,4 +34,7 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = "__all__"
 
-
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = "__all__"
@@ -0,0 +1,203 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import projectScope, responseCache
+from .changes import changedData, entry, linkChanges, logChanges, projectOf, rowData
+from .fulltext import indexIssues
+from .membership import membershipCache
+from .models import Project, User, Issue, Label, Sprint, Comment, recountIssue
+
+
+'''
+response cache invalidation
+'''
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def bumpProject(sender, instance, **kwargs):
+    responseCache.bumpOnWrite(projectScope(instance.pk))
+
+
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Issue)
+def bumpIssueProject(sender, instance, **kwargs):
+    responseCache.bumpOnWrite(projectScope(instance.project_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bumpCommentProject(sender, instance, **kwargs):
+    project_id = Issue.objects.filter(pk=instance.issue_id).values_list('project_id', flat=True).first()
+    responseCache.bumpOnWrite(projectScope(project_id))
+
+
+@receiver(post_save, sender=Sprint)
+@receiver(post_delete, sender=Sprint)
+def bumpSprint(sender, instance, **kwargs):
+    responseCache.bumpOnWrite('sprints', projectScope(instance.project_id))
+
+
+@receiver(post_save, sender=Label)
+@receiver(post_delete, sender=Label)
+def bumpLabels(sender, instance, **kwargs):
+    responseCache.bumpOnWrite('labels')
+
+
+'''
+issue counters
+'''
+@receiver(post_delete, sender=Issue)
+def uncountIssue(sender, instance, **kwargs):
+    # deletes run in a transaction, cascades from a project or sprint included
+    recountIssue(instance.countKey(), None)
+
+
+'''
+label and watcher links
+
+Issue representations list their label and watcher ids, so any change to
+those links touches the issues' updated_at (which ETags are computed from)
+and bumps their projects' cache versions.
+'''
+@receiver(pre_delete, sender=Label)
+@receiver(pre_delete, sender=User)
+def linkedIssuesDeleted(sender, instance, **kwargs):
+    # deleting a label or user drops its issue links without m2m_changed
+    if sender is Label:
+        issues = Issue.objects.filter(labels=instance)
+    else:
+        issues = Issue.objects.filter(watchers=instance)
+    touchIssues(issues)
+
+
+@receiver(m2m_changed, sender=Issue.labels.through)
+@receiver(m2m_changed, sender=Issue.watchers.through)
+def issueLinksChanged(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        issues = Issue.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        field = 'labels' if sender is Issue.labels.through else 'watchers'
+        issues = Issue.objects.filter(**{field: instance})
+    else:
+        issues = Issue.objects.filter(pk__in=pk_set)
+    touchIssues(issues)
+
+
+def touchIssues(issues):
+    issue_ids = list(issues.values_list('id', flat=True))
+    if not issue_ids:
+        return
+    project_ids = (Issue.objects
+                    .filter(id__in=issue_ids)
+                    .values_list('project_id', flat=True)
+                    .distinct())
+    responseCache.bumpOnWrite(*[projectScope(project_id) for project_id in project_ids])
+    Issue.objects.filter(id__in=issue_ids).update(updated_at=timezone.now())
+
+
+'''
+membership cache invalidation
+'''
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def userChanged(sender, instance, **kwargs):
+    membershipCache.invalidateOnWrite(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.projects.through)
+def membershipChanged(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+
+    if not reverse:
+        membershipCache.invalidateOnWrite(instance.pk)
+    elif action == 'pre_clear':
+        # the project's members are only known before the clear
+        membershipCache.invalidateOnWrite(*instance.user_set.values_list('id', flat=True))
+    elif pk_set:
+        membershipCache.invalidateOnWrite(*pk_set)
+
+
+@receiver(pre_delete, sender=Project)
+def projectMembersDeleted(sender, instance, **kwargs):
+    # deleting a project drops its memberships without m2m_changed
+    membershipCache.invalidateOnWrite(*instance.user_set.values_list('id', flat=True))
+
+
+'''
+full-text index maintenance
+'''
+@receiver(post_save, sender=Issue)
+def reindexIssue(sender, instance, created, update_fields=None, **kwargs):
+    # most saves change the assignee, status or sprint, not the text
+    if created or {'summary', 'desc'} & set(changedData(instance, update_fields)):
+        indexIssues([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+def reindexCommentIssue(sender, instance, **kwargs):
+    indexIssues([instance.issue_id])
+
+
+@receiver(post_delete, sender=Comment)
+def reindexAfterCommentDelete(sender, instance, **kwargs):
+    # comments are also deleted as part of deleting their issue, whose
+    # document must not be written again, so wait for the commit
+    transaction.on_commit(lambda: indexIssues([instance.issue_id]))
+
+
+'''
+change log
+
+Each entry is written before the save, delete or link change it records
+commits: saves run in a transaction (see LoggedModel), deletes and link
+changes always do.
+'''
+LOGGED_MODELS = (Project, User, Label, Sprint, Issue, Comment)
+LINK_FIELDS = dict((field.remote_field.through, field)
+                    for field in (Issue.labels.field, Issue.watchers.field, User.projects.field))
+
+
+def logSave(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        logChanges([entry(sender, instance.pk, projectOf(instance), 'created', rowData(instance, update_fields))])
+        return
+    # saves that change nothing, like the ones after a label or watcher change, are not logged
+    data = changedData(instance, update_fields)
+    if data:
+        logChanges([entry(sender, instance.pk, projectOf(instance), 'updated', data)])
+
+
+def logDelete(sender, instance, **kwargs):
+    logChanges([entry(sender, instance.pk, projectOf(instance), 'deleted')])
+
+
+for model in LOGGED_MODELS:
+    post_save.connect(logSave, sender=model, dispatch_uid='logSave.' + model.__name__)
+    post_delete.connect(logDelete, sender=model, dispatch_uid='logDelete.' + model.__name__)
+
+
+@receiver(m2m_changed, sender=Issue.labels.through)
+@receiver(m2m_changed, sender=Issue.watchers.through)
+@receiver(m2m_changed, sender=User.projects.through)
+def logLinks(sender, instance, action, reverse, pk_set, **kwargs):
+    field = LINK_FIELDS[sender]
+    if action == 'pre_clear':
+        # the links are only known before the clear
+        column = field.m2m_reverse_name() if reverse else field.m2m_column_name()
+        pairs = list(sender.objects
+                        .filter(**{column: instance.pk})
+                        .values_list(field.m2m_column_name(), field.m2m_reverse_name()))
+        logChanges(linkChanges(field, 'removed', pairs))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        project_ids = None
+        if reverse:
+            pairs = [(pk, instance.pk) for pk in pk_set]
+        else:
+            pairs = [(instance.pk, pk) for pk in pk_set]
+            project_ids = {instance.pk: projectOf(instance)}
+        logChanges(linkChanges(field, 'added' if action == 'post_add' else 'removed', pairs, project_ids))
@@ -0,0 +1,58 @@
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .rowserializers import getRowSerializer
+
+
+def wantsStream(request):
+    return request.query_params.get('stream', '').lower() in ('1', 'true')
+
+
+def streamList(queryset, serializer_class):
+    """
+    Streams a list response as JSON array fragments, one chunk of rows at a
+    time, instead of rendering the whole list in memory first. The bytes are
+    the same as the non-streamed JSONRenderer output.
+    """
+    chunk_size = settings.STREAM_CHUNK_SIZE
+    rows = getRowSerializer(serializer_class).iterate(queryset, chunk_size)
+    return StreamingHttpResponse(
+        renderJsonArray(rows, chunk_size),
+        content_type=JSONRenderer.media_type
+    )
+
+
+def jsonEncoder():
+    # encodes single rows the way JSONRenderer renders them
+    return JSONEncoder(
+        ensure_ascii=JSONRenderer.ensure_ascii,
+        allow_nan=not JSONRenderer.strict,
+        separators=(',', ':') if JSONRenderer.compact else (', ', ': ')
+    )
+
+
+def renderJsonArray(rows, chunk_size):
+    encoder = jsonEncoder()
+
+    yield b'['
+    fragments = []
+    separator = ''
+    for row in rows:
+        fragments.append(separator + encoder.encode(row))
+        separator = ','
+        if len(fragments) == chunk_size:
+            yield encodeFragments(fragments)
+            fragments = []
+    if fragments:
+        yield encodeFragments(fragments)
+    yield b']'
+
+
+def encodeFragments(fragments):
+    # JSONRenderer always escapes these two so the output stays valid javascript
+    text = ''.join(fragments).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    return text.encode()
@@ -1,9 +1,38 @@
+import csv
+import gc
+import io
+import os
+import pstats
 import re
 import json
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.http import QueryDict
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
+from myproject.db.persistent import PersistentConnectionMixin
 from projects.models import *
-from rest_framework.test import APITestCase
+from projects.cache import responseCache
+from projects.counters import rebuildCounts
+from projects.export import exportRows
+from projects.jobs import Worker, enqueue, jobHandlers, retryDelay
+from projects.management.commands._seed import seedDataset, dropDataset
+from projects.urls import urlpatterns
+from projects.membership import MembershipCache, membershipCache
+from projects.metrics import RequestMetrics, requestMetrics, writeState
+from projects.pagination import KeysetPagination
+from projects.search import compileSearch
+from projects.rowserializers import RowSerializer
+from projects.serializers import *
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
 
 class TestPersons(APITestCase):
 
@@ -126,6 +155,7 @@ class TestPersons(APITestCase):
     result_json = response.json()
     result_json.pop("id")
     result_json.pop("creation_date")
+    result_json.pop("updated_at")
 
     expected_json = {
       'summary': name,
@@ -145,7 +175,7 @@ class TestPersons(APITestCase):
     url = "/projects/{}/issues".format(self.p1.id)
     response = self.client.get(url)
     self.assertEqual(response.status_code, 200)
-    p1_issues_json = response.json()
+    p1_issues_json = response.json()["results"]
 
     # expected issues, sorted from most recently created to least
     p1_issues = [self.p1_i3, self.p1_i2,self.p1_i1]
@@ -154,6 +184,71 @@ class TestPersons(APITestCase):
       result_issue = p1_issues_json[i]
       self.checkIssueEqual(expected_issue, result_issue)
 
+  def test_paginate_issues_of_project(self):
+    url = "/projects/{}/issues".format(self.p1.id)
+
+    # first page holds the two newest issues and links to the next page
+    response = self.client.get(url, {"page_size": 2})
+    self.assertEqual(response.status_code, 200)
+    page_json = response.json()
+    self.assertEqual([self.p1_i3.id, self.p1_i2.id], [issue["id"] for issue in page_json["results"]])
+    self.assertIsNotNone(page_json["next"])
+
+    # following the cursor returns the remaining issue and no further link
+    response = self.client.get(page_json["next"])
+    self.assertEqual(response.status_code, 200)
+    page_json = response.json()
+    self.assertEqual([self.p1_i1.id], [issue["id"] for issue in page_json["results"]])
+    self.assertIsNone(page_json["next"])
+
+  def test_paginate_issues_with_equal_creation_dates(self):
+    # issues created at the same instant are ordered by id
+    Issue.objects.filter(project=self.p1).update(creation_date="2022-03-04T19:06:21Z")
+    url = "/issues/"
+
+    seen = []
+    response = self.client.get(url, {"page_size": 1})
+    while True:
+      page_json = response.json()
+      seen.extend(issue["id"] for issue in page_json["results"])
+      if page_json["next"] is None:
+        break
+      response = self.client.get(page_json["next"])
+
+    expected = [self.p2_i1.id, self.p1_i3.id, self.p1_i2.id, self.p1_i1.id]
+    self.assertEqual(expected, seen)
+
+  def test_paginate_invalid_cursor(self):
+    url = "/users/{}/issues".format(self.u1.id)
+    response = self.client.get(url, {"cursor": "not-a-cursor"})
+    self.assertEqual(response.status_code, 404)
+
+  @override_settings(STREAM_CHUNK_SIZE=2)
+  def test_stream_issues_of_project(self):
+    url = "/projects/{}/issues".format(self.p1.id)
+    paged = self.client.get(url).json()["results"]
+
+    # the streamed body holds every issue, in page order, as one JSON array
+    response = self.client.get(url, {"stream": "true"})
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    streamed = json.loads(b"".join(response.streaming_content))
+    self.assertEqual(paged, streamed)
+
+  @override_settings(STREAM_CHUNK_SIZE=1)
+  def test_stream_users_and_comments(self):
+    Comment.objects.create(text="Comment 1", user=self.u1, issue=self.p1_i1)
+    Comment.objects.create(text="Comment 2", user=self.u2, issue=self.p1_i1)
+    urls = [
+      "/users/",
+      "/comments/",
+      "/projects/{}/issues/{}/comments".format(self.p1.id, self.p1_i1.id),
+    ]
+    for url in urls:
+      expected = self.client.get(url).content
+      response = self.client.get(url, {"stream": "1"})
+      self.assertEqual(expected, b"".join(response.streaming_content))
+
   def test_assign_issue(self):
     assignee = self.u1.id
     url = "/projects/{}/issues/{}/assignee".format(self.p1.id, self.p1_i1.id)
@@ -178,7 +273,7 @@ class TestPersons(APITestCase):
 
     # User 1 should be assigned to Issues 2, 3
     user_issues = [self.p1_i3, self.p1_i2]
-    result_issues = response.json()
+    result_issues = response.json()["results"]
     for i in range(len(result_issues)):
       expected_issue = user_issues[i]
       result_issue = result_issues[i]
@@ -201,21 +296,113 @@ class TestPersons(APITestCase):
     # Label 1 now added to Issue 1
     self.checkLabelsEqual(expected_labels, result_labels)
 
-  # TO DO: need to refactor search, get() doesn't take in a request body
-  # # search issues - search based on project id only
-  # def test_search_issues(self):
+  # search issues - search based on project id only
+  def test_search_issues(self):
+    url = "/issues/search?project={}".format(self.p1.id)
+    response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+
+    # search should return all issues in p1, newest first
+    result_ids = [issue["id"] for issue in response.json()["results"]]
+    self.assertEqual(result_ids, [self.p1_i3.id, self.p1_i2.id, self.p1_i1.id])
+
+  def test_search_issues_or_uses_supplied_fields_only(self):
+    url = "/issues/search?q=or(type:task,assignee:{})".format(self.u1.id)
+    result_ids = [issue["id"] for issue in self.client.get(url).json()["results"]]
+    self.assertEqual(sorted(result_ids), sorted([self.p1_i1.id, self.p1_i2.id, self.p1_i3.id, self.p2_i1.id]))
+
+    url = "/issues/search?q=or(and(type:task,project:{}),status:done)".format(self.p2.id)
+    result_ids = [issue["id"] for issue in self.client.get(url).json()["results"]]
+    self.assertEqual(result_ids, [self.p2_i1.id])
+
+  def test_search_issues_in_lists_and_ranges(self):
+    l2 = Label.objects.create(value="Label 2")
+    self.p1_i1.labels.add(self.l1, l2)
+    self.p1_i2.labels.add(l2)
+
+    # an issue matching several labels is returned once
+    url = "/issues/search?label={},{}".format(self.l1.id, l2.id)
+    result_ids = [issue["id"] for issue in self.client.get(url).json()["results"]]
+    self.assertEqual(result_ids, [self.p1_i2.id, self.p1_i1.id])
 
-  #   url = "/issues/search"
-  #   search_json = {
-  #     "logic": "and",
-  #     "project": self.p1.id,
-  #   }
+    url = "/issues/search?assignee=null&type=task|bug&project={}".format(self.p1.id)
+    result_ids = [issue["id"] for issue in self.client.get(url).json()["results"]]
+    self.assertEqual(result_ids, [self.p1_i1.id])
 
-  #   # NEED TO FIX: json not being recognized as parameter
-  #   response = self.client.get(url, search_json, ACCEPT='application/json')
+    Issue.objects.filter(pk=self.p1_i1.id).update(creation_date="2022-03-01T12:00:00Z")
+    url = "/issues/search?creation_date=2022-03-01..2022-03-02"
+    result_ids = [issue["id"] for issue in self.client.get(url).json()["results"]]
+    self.assertEqual(result_ids, [self.p1_i1.id])
 
-  #   # search should return all issues in p1
+  def test_search_issues_facets(self):
+    l2 = Label.objects.create(value="Label 2")
+    self.p1_i1.labels.add(self.l1, l2)
+    self.p1_i2.labels.add(l2)
 
+    url = "/issues/search?project={}&page_size=1&facets=status,type,assignee,label".format(self.p1.id)
+    with CaptureQueriesContext(connection) as context:
+      response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    result = response.json()
+    self.assertEqual(len(result["results"]), 1)
+
+    # counts cover every match, not just the page, in one extra statement
+    self.assertEqual(result["facets"], {
+      "status": [{"value": "open", "count": 3}],
+      "type": [{"value": "bug", "count": 2}, {"value": "task", "count": 1}],
+      "assignee": [{"value": self.u1.id, "count": 2}, {"value": None, "count": 1}],
+      "label": [{"value": l2.id, "count": 2}, {"value": self.l1.id, "count": 1}],
+    })
+    self.assertEqual(len(context.captured_queries), 4)
+
+    url = "/issues/search?project={}&facets=type&facet_limit=1".format(self.p1.id)
+    self.assertEqual(self.client.get(url).json()["facets"], {"type": [{"value": "bug", "count": 2}]})
+
+    for query in ["facets=priority", "facets=type&facet_limit=0"]:
+      self.assertEqual(self.client.get("/issues/search?" + query).status_code, 400, query)
+
+  def test_search_issues_contradiction_pruned(self):
+    url = "/issues/search?q=and(status:open,status:done)"
+    with self.assertNumQueries(0):
+      response = self.client.get(url)
+    self.assertEqual(response.json()["results"], [])
+
+  def test_search_issues_bad_query(self):
+    for query in ["q=or(status:open", "project=x", "priority=1", "creation_date=yesterday.."]:
+      response = self.client.get("/issues/search?" + query)
+      self.assertEqual(response.status_code, 400, query)
+
+
+  def test_assign_issues_batch(self):
+    inactive = User.objects.create(name="User 3", active=False)
+    inactive.projects.add(self.p1)
+    url = "/projects/{}/issues/assignees".format(self.p1.id)
+    body = {"assignments": [
+      {"issue": self.p1_i1.id, "assignee": self.u1.id},
+      {"issue": self.p1_i2.id, "assignee": self.u2.id},
+      {"issue": self.p1_i3.id, "assignee": inactive.id},
+      {"issue": self.p2_i1.id, "assignee": self.u1.id},
+      {"issue": self.p1_i1.id, "assignee": self.u1.id},
+      {"issue": self.p1_i3.id + 100, "assignee": 0},
+      {"issue": "x"},
+    ]}
+    response = self.client.patch(url, body, format="json")
+    self.assertEqual(response.status_code, 200)
+    result = response.json()
+
+    self.assertEqual(result["assigned"], [self.p1_i1.id])
+    self.assertEqual([issue["assignee"] for issue in result["issues"]], [self.u1.id])
+    errors = [error["error"].split(":")[0] for error in result["errors"]]
+    self.assertEqual(errors, [
+      "Assignment Error",
+      "Assignment Error",
+      "Unqualified User",
+      "Inactive User",
+      "Not Found Error",
+      "Not Found Error",
+    ])
+    self.assertEqual(Issue.objects.get(pk=self.p1_i2.id).assignee_id, self.u1.id)
+    self.assertEqual(Issue.objects.get(pk=self.p2_i1.id).assignee_id, None)
 
   def test_update_issue_status(self):
     url = "/issues/{}/status".format(self.p1_i1.id)
@@ -229,6 +416,107 @@ class TestPersons(APITestCase):
     self.assertEqual(expected_status, result_status)
 
 
+  def test_update_issue_status_invalid_transition(self):
+    url = "/issues/{}/status".format(self.p1_i1.id)
+    with CaptureQueriesContext(connection) as context:
+      response = self.client.patch(url, {"status": "done"})
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.countWrites(context), 0)
+    self.assertEqual(Issue.objects.get(pk=self.p1_i1.id).status, "open")
+
+  def test_update_issue_status_conflict(self):
+    # the issue is read as "open", then changed by another request
+    stale = Issue.objects.get(pk=self.p1_i1.id)
+    Issue.objects.filter(pk=self.p1_i1.id).update(status="assigned")
+    url = "/issues/{}/status".format(self.p1_i1.id)
+    with mock.patch("projects.views.safeGet", return_value=stale):
+      with CaptureQueriesContext(connection) as context:
+        response = self.client.patch(url, {"status": "assigned"})
+    self.assertEqual(response.status_code, 409)
+    self.assertEqual(self.countWrites(context), 0)
+
+  def test_update_issues_status_batch(self):
+    self.p1_i2.status = "assigned"
+    self.p1_i2.save()
+    body = {"issues": [self.p1_i1.id, self.p1_i2.id, self.p1_i3.id], "status": "assigned"}
+    with CaptureQueriesContext(connection) as context:
+      response = self.client.patch("/issues/status", body)
+    self.assertEqual(response.status_code, 200)
+    result = response.json()
+    self.assertEqual(result["updated"], sorted([self.p1_i1.id, self.p1_i3.id]))
+    self.assertEqual(result["rejected"], [self.p1_i2.id])
+
+    # one statement moves every issue
+    issue_updates = [query for query in context.captured_queries
+                      if re.match(r'UPDATE "projects_issue" SET', query["sql"])]
+    self.assertEqual(len(issue_updates), 1)
+    statuses = Issue.objects.filter(project=self.p1).values_list("status", flat=True)
+    self.assertEqual(set(statuses), {"assigned"})
+    self.assertEqual(self.client.get("/projects/{}/summary".format(self.p1.id)).json()["status"]["assigned"], 3)
+
+  def test_update_issues_status_batch_rejects_everything(self):
+    body = {"issues": [self.p1_i1.id, self.p1_i2.id], "status": "done"}
+    with CaptureQueriesContext(connection) as context:
+      response = self.client.patch("/issues/status", body)
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json()["updated"], [])
+    self.assertEqual(self.countWrites(context), 0)
+
+    response = self.client.patch("/issues/status", {"issues": [self.p1_i1.id], "status": "open"})
+    self.assertEqual(response.status_code, 400)
+
+  def test_update_watchers_add_and_mute(self):
+    u3 = User.objects.create(name="User 3", active=True)
+    u3.projects.add(self.p1)
+    inactive = User.objects.create(name="User 4", active=False)
+    inactive.projects.add(self.p1)
+    self.p1_i1.watchers.add(u3)
+    url = "/projects/{}/issues/watchers".format(self.p1.id)
+
+    body = {
+      "action": "add",
+      "issues": [self.p1_i1.id, self.p1_i2.id, self.p2_i1.id],
+      "watchers": [self.u1.id, u3.id, inactive.id, self.u2.id]
+    }
+    response = self.client.patch(url, body, format="json")
+    self.assertEqual(response.status_code, 200)
+    result = response.json()
+    # u3 already watches issue 1, and u1 is assigned to issue 2
+    self.assertEqual(result["changed"], 2)
+    self.assertEqual(result["issues"], sorted([self.p1_i1.id, self.p1_i2.id]))
+    self.assertEqual(len(result["errors"]), 4)
+    self.assertEqual(set(self.p1_i1.watchers.values_list("id", flat=True)), {self.u1.id, u3.id})
+    self.assertEqual(set(self.p1_i2.watchers.values_list("id", flat=True)), {u3.id})
+
+    body = {"action": "mute", "issues": [self.p1_i1.id, self.p1_i2.id], "watchers": [u3.id]}
+    response = self.client.patch(url, body, format="json")
+    self.assertEqual(response.json()["changed"], 2)
+    self.assertFalse(self.p1_i1.isWatcher(u3))
+    self.assertTrue(self.p1_i1.isWatcher(self.u1))
+
+  def test_update_watchers_form_encoded(self):
+    u3 = User.objects.create(name="User 3", active=True)
+    u3.projects.add(self.p1)
+    url = "/projects/{}/issues/watchers".format(self.p1.id)
+
+    # repeated form fields are ids, not strings of digits to iterate over
+    body = {"action": "add", "issues": [self.p1_i1.id, self.p1_i3.id], "watchers": [u3.id]}
+    response = self.client.patch(url, body)
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json()["issues"], sorted([self.p1_i1.id, self.p1_i3.id]))
+    self.assertTrue(self.p1_i1.isWatcher(u3))
+    self.assertFalse(self.p1_i2.isWatcher(u3))
+
+    body = {"action": "mute", "issues": str(self.p1_i1.id) + str(self.p1_i3.id), "watchers": [u3.id]}
+    response = self.client.patch(url, body, format="json")
+    self.assertEqual(response.status_code, 400)
+    self.assertTrue(self.p1_i1.isWatcher(u3))
+
+  def test_update_watchers_unknown_action(self):
+    url = "/projects/{}/issues/watchers".format(self.p1.id)
+    response = self.client.patch(url, {"action": "follow", "issues": [], "watchers": []}, format="json")
+    self.assertEqual(response.status_code, 404)
+
   def test_move_issues(self):
     source_sprint = self.p1_s1.id
     target_sprint = self.p1_s2.id
@@ -248,12 +536,43 @@ class TestPersons(APITestCase):
     response = self.client.patch(url, body)
     self.assertEqual(response.status_code, 200)
     result_json = response.json()
+    self.assertEqual([issue.id for issue in issues], result_json["moved"])
+    self.assertEqual([], result_json["rejected"])
     
     # check issues have moved to Sprint 2
-    for result_issue in result_json:
+    for result_issue in result_json["issues"]:
       result_sprint = int(result_issue["sprint"])
       self.assertEqual(target_sprint, result_sprint)
 
+  def test_move_issues_rejects_issues_outside_source_sprint(self):
+    # Issue 1 is already in Sprint 2, Project 2's issue is in another project
+    Issue.objects.filter(pk=self.p1_i1.id).update(sprint=self.p1_s2)
+    url = "/projects/{}/issues".format(self.p1.id)
+    body = {
+      "issues": [self.p1_i1.id, self.p1_i2.id, self.p2_i1.id],
+      "source_sprint": self.p1_s1.id,
+      "target_sprint": self.p1_s2.id
+    }
+    response = self.client.patch(url, body)
+    self.assertEqual(response.status_code, 200)
+    result_json = response.json()
+    self.assertEqual([self.p1_i2.id], result_json["moved"])
+    self.assertEqual([self.p1_i1.id, self.p2_i1.id], result_json["rejected"])
+
+    # Project 2's issue stays in its own sprint
+    self.assertEqual(self.p2_s1.id, Issue.objects.get(pk=self.p2_i1.id).sprint_id)
+
+  def test_move_issues_to_sprint_of_other_project(self):
+    url = "/projects/{}/issues".format(self.p1.id)
+    body = {
+      "issues": [self.p1_i1.id],
+      "source_sprint": self.p1_s1.id,
+      "target_sprint": self.p2_s1.id
+    }
+    response = self.client.patch(url, body)
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.p1_s1.id, Issue.objects.get(pk=self.p1_i1.id).sprint_id)
+
   def test_add_comments(self):
     
     url = "/projects/{}/issues/{}/comments".format(self.p1.id, self.p1_i1.id)
@@ -316,6 +635,11 @@ class TestPersons(APITestCase):
   """
   TESTING HELPER FUNCTIONS
   """
+  def countWrites(self, context):
+    writes = [query for query in context.captured_queries
+              if re.match(r"(UPDATE|INSERT|DELETE)", query["sql"])]
+    return len(writes)
+
   def checkIssueEqual(self, expected_issue, result_issue):
     self.assertEqual(expected_issue.summary, result_issue['summary'])
     self.assertEqual(expected_issue.desc, result_issue['desc'])
@@ -345,4 +669,1460 @@ class TestPersons(APITestCase):
   def checkCommentEqual(self, expected_comment, result_comment):
     self.assertEqual(expected_comment["text"], result_comment["text"])
     self.assertEqual(expected_comment["user"], result_comment["user"])
-    self.assertEqual(expected_comment["issue"], result_comment["issue"])
\ No newline at end of file
+    self.assertEqual(expected_comment["issue"], result_comment["issue"])
+
+
+class TestIssueCounters(APITestCase):
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Counter Project")
+    self.other = Project.objects.create(name="Other Project")
+    self.s1 = Sprint.objects.create(name="Counter Sprint 1", project=self.project)
+    self.s2 = Sprint.objects.create(name="Counter Sprint 2", project=self.project)
+    self.issues = [
+      Issue.objects.create(summary="Counter Issue {}".format(i), type=["bug", "task"][i % 2],
+        project=self.project, sprint=self.s1)
+      for i in range(4)
+    ]
+
+  def test_summary_counts_by_status_and_type(self):
+    response = self.client.get("/projects/{}/summary".format(self.project.id))
+    self.assertEqual(response.status_code, 200)
+    summary = response.json()
+    self.assertEqual(summary["project"], self.project.id)
+    self.assertEqual(summary["total"], 4)
+    self.assertEqual(summary["status"]["open"], 4)
+    self.assertEqual(summary["status"]["done"], 0)
+    self.assertEqual(summary["type"], {"bug": 2, "task": 2})
+    self.assertEqual(summary["sprints"], [
+      {"sprint": self.s1.id, "total": 4, "status": summary["status"], "type": {"bug": 2, "task": 2}}
+    ])
+
+  def test_summary_of_missing_project(self):
+    response = self.client.get("/projects/0/summary")
+    self.assertEqual(response.status_code, 404)
+
+  def test_status_update_moves_counts(self):
+    url = "/issues/{}/status".format(self.issues[0].id)
+    self.client.patch(url, {"status": "assigned"})
+    summary = self.getSummary()
+    self.assertEqual(summary["status"]["open"], 3)
+    self.assertEqual(summary["status"]["assigned"], 1)
+    self.assertCountersExact()
+
+  def test_create_edit_and_delete_keep_counts(self):
+    issue = self.issues[0]
+    issue.type = "task"
+    issue.project = self.other
+    issue.save()
+    self.issues[1].delete()
+    Issue.objects.create(summary="Counter Issue 9", type="bug", project=self.project, sprint=self.s2)
+
+    summary = self.getSummary()
+    self.assertEqual(summary["total"], 3)
+    self.assertEqual(summary["type"], {"bug": 2, "task": 1})
+    self.assertCountersExact()
+
+  def test_sprint_delete_cascades_into_project_counts(self):
+    self.s1.delete()
+    self.assertEqual(self.getSummary()["total"], 0)
+    self.assertCountersExact()
+
+  def test_move_issues_moves_sprint_counts(self):
+    body = {
+      "issues": [issue.id for issue in self.issues[:3]],
+      "source_sprint": self.s1.id,
+      "target_sprint": self.s2.id
+    }
+    self.client.patch("/projects/{}/issues".format(self.project.id), body)
+    sprints = {sprint["sprint"]: sprint["total"] for sprint in self.getSummary()["sprints"]}
+    self.assertEqual(sprints, {self.s1.id: 1, self.s2.id: 3})
+    self.assertCountersExact()
+
+  def test_rebuild_repairs_drift(self):
+    ProjectIssueCount.objects.filter(project=self.project).update(count=100)
+    SprintIssueCount.objects.filter(sprint=self.s1, type="bug").delete()
+    self.assertEqual(rebuildCounts([self.project.id]), 3)
+    self.assertEqual(self.getSummary()["total"], 4)
+    self.assertCountersExact()
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def getSummary(self):
+    return self.client.get("/projects/{}/summary".format(self.project.id)).json()
+
+  def assertCountersExact(self):
+    counters = {
+      (counter.project_id, counter.status, counter.type): counter.count
+      for counter in ProjectIssueCount.objects.exclude(count=0)
+    }
+    counters.update({
+      ("sprint", counter.sprint_id, counter.status, counter.type): counter.count
+      for counter in SprintIssueCount.objects.exclude(count=0)
+    })
+    expected = {}
+    for issue in Issue.objects.all():
+      for key in ((issue.project_id, issue.status, issue.type), ("sprint", issue.sprint_id, issue.status, issue.type)):
+        expected[key] = expected.get(key, 0) + 1
+    self.assertEqual(counters, expected)
+
+
+class TestMembershipCache(APITestCase):
+
+  def setUp(self):
+    membershipCache.clear()
+    self.p1 = Project.objects.create(name="Member Project 1")
+    self.p2 = Project.objects.create(name="Member Project 2")
+    self.user = User.objects.create(name="Member", active=True)
+    self.user.projects.add(self.p1)
+
+  def test_lookups_served_from_cache(self):
+    self.assertTrue(membershipCache.isMember(self.user.id, self.p1.id))
+    hits = membershipCache.stats()["hits"]
+    with self.assertNumQueries(0):
+      self.assertTrue(membershipCache.isMember(self.user.id, self.p1.id))
+      self.assertFalse(membershipCache.isMember(self.user.id, self.p2.id))
+    self.assertEqual(membershipCache.stats()["hits"], hits + 2)
+
+    response = self.client.get("/stats/caches")
+    self.assertEqual(response.status_code, 200)
+    self.assertGreater(response.json()["membership"]["hit_ratio"], 0)
+
+  def test_never_stale_after_membership_changes(self):
+    changes = [
+      (lambda: self.user.projects.add(self.p2), self.p2, True),
+      (lambda: self.user.projects.remove(self.p2), self.p2, False),
+      (lambda: self.p2.user_set.add(self.user), self.p2, True),
+      (lambda: self.p2.user_set.remove(self.user), self.p2, False),
+      (lambda: self.p2.user_set.set([self.user]), self.p2, True),
+      (lambda: self.p2.user_set.clear(), self.p2, False),
+      (lambda: self.user.projects.clear(), self.p1, False),
+      (lambda: self.user.projects.set([self.p1]), self.p1, True),
+      (lambda: self.p1.delete(), self.p1, False),
+    ]
+    for change, project, expected in changes:
+      # warm the entry, change the membership, then read it back
+      membershipCache.isMember(self.user.id, project.id)
+      change()
+      self.assertEqual(membershipCache.isMember(self.user.id, project.id), expected)
+
+  def test_never_stale_after_user_changes(self):
+    self.assertTrue(membershipCache.get(self.user.id)[0])
+    self.user.active = False
+    self.user.save()
+    self.assertFalse(membershipCache.get(self.user.id)[0])
+
+    self.user.delete()
+    self.assertIsNone(membershipCache.get(self.user.id))
+
+  def test_load_racing_invalidation_not_stored(self):
+    cache = MembershipCache(10, 60)
+    load = cache.load
+
+    def racingLoad(user_id):
+      membership = load(user_id)
+      cache.invalidate(user_id)
+      return membership
+
+    with mock.patch.object(cache, "load", side_effect=racingLoad):
+      cache.get(self.user.id)
+    self.assertEqual(cache.stats()["size"], 0)
+
+  def test_least_recently_used_evicted(self):
+    cache = MembershipCache(2, 60)
+    users = [User.objects.create(name="Member {}".format(i), active=True) for i in range(3)]
+    cache.get(users[0].id)
+    cache.get(users[1].id)
+    cache.get(users[0].id)
+    cache.get(users[2].id)
+
+    stats = cache.stats()
+    self.assertEqual(stats["size"], 2)
+    self.assertEqual(stats["evictions"], 1)
+    self.assertEqual(list(cache.entries), [users[0].id, users[2].id])
+
+
+class TestResponseCache(APITestCase):
+  """
+  Cached reads must be served until a write to the same project, and never
+  after it.
+  """
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Cache Project")
+    self.other = Project.objects.create(name="Other Cache Project")
+    self.sprint = Sprint.objects.create(name="Cache Sprint 1", project=self.project)
+    self.target = Sprint.objects.create(name="Cache Sprint 2", project=self.project)
+    self.user = User.objects.create(name="Cache User", active=True)
+    self.user.projects.add(self.project)
+    self.watcher = User.objects.create(name="Cache Watcher", active=True)
+    self.watcher.projects.add(self.project)
+    self.label = Label.objects.create(value="Cache Label")
+    self.issue = Issue.objects.create(summary="Cache Issue", type="bug", project=self.project, sprint=self.sprint)
+    self.url = "/projects/{}/issues".format(self.project.id)
+
+  def test_cached_reads_hit_until_write(self):
+    hits = responseCache.stats()["hits"]
+    self.assertEqual("MISS", self.client.get(self.url)["X-Cache"])
+    self.assertEqual("HIT", self.client.get(self.url)["X-Cache"])
+    self.assertEqual(hits + 1, responseCache.stats()["hits"])
+
+    # writes to another project leave the cached page alone
+    Issue.objects.create(summary="Other Issue", type="bug", project=self.other,
+      sprint=Sprint.objects.create(name="Other Sprint", project=self.other))
+    self.assertEqual("HIT", self.client.get(self.url)["X-Cache"])
+
+  def test_issue_writes_invalidate_cached_reads(self):
+    pid, iid = self.project.id, self.issue.id
+    writes = [
+      lambda: self.client.patch("/projects/{}/issues/{}/assignee".format(pid, iid), {"assignee": self.user.id}),
+      lambda: self.client.patch("/issues/{}/status".format(iid), {"status": "assigned"}),
+      lambda: self.client.patch("/issues/{}/label".format(iid), {"label": self.label.id}),
+      lambda: self.client.patch("/projects/{}/issues/{}/watcher".format(pid, iid), {"action": "add", "watcher": self.watcher.id}),
+      lambda: self.client.post("/projects/{}/issues/{}/comments".format(pid, iid), {"text": "Comment", "user": self.user.id}),
+      lambda: self.client.patch(self.url, {"issues": [iid], "source_sprint": self.sprint.id, "target_sprint": self.target.id}),
+      lambda: self.client.post(self.url, {"summary": "New Issue", "type": "task", "project": pid, "sprint": self.sprint.id}),
+    ]
+    detail_url = "/issues/{}".format(iid)
+    for write in writes:
+      for url in (self.url, detail_url):
+        self.client.get(url)
+        self.assertEqual("HIT", self.client.get(url)["X-Cache"])
+
+      response = write()
+      self.assertIn(response.status_code, (200, 201))
+
+      for url in (self.url, detail_url):
+        response = self.client.get(url)
+        self.assertEqual("MISS", response["X-Cache"])
+
+    # the cached detail reflects every write
+    issue_json = self.client.get(detail_url).json()
+    self.assertEqual(self.user.id, issue_json["assignee"])
+    self.assertEqual("assigned", issue_json["status"])
+    self.assertEqual([self.label.id], issue_json["labels"])
+    self.assertEqual([self.watcher.id], issue_json["watchers"])
+    self.assertEqual(self.target.id, issue_json["sprint"])
+
+  def test_label_and_sprint_lists_invalidate(self):
+    for url, body in (("/labels/", {"value": "New Label"}), ("/sprints/", {"name": "New Sprint", "project": self.project.id})):
+      before = self.client.get(url).json()
+      self.assertEqual("HIT", self.client.get(url)["X-Cache"])
+      response = self.client.post(url, body)
+      self.assertEqual(response.status_code, 201)
+      after = self.client.get(url).json()
+      self.assertEqual(len(before) + 1, len(after))
+
+  def test_file_based_backend(self):
+    with tempfile.TemporaryDirectory() as location:
+      backend = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": location,
+      }
+      with self.settings(CACHES={"default": backend, "responses": backend}):
+        self.assertEqual("MISS", self.client.get(self.url)["X-Cache"])
+        self.assertEqual("HIT", self.client.get(self.url)["X-Cache"])
+        self.client.patch("/issues/{}/status".format(self.issue.id), {"status": "assigned"})
+        self.assertEqual("assigned", self.client.get(self.url).json()["results"][0]["status"])
+
+
+class TestConditionalGets(APITestCase):
+  """
+  Polling clients sending If-None-Match get a 304 from a single aggregate
+  query until the resource changes.
+  """
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Etag Project")
+    self.sprint = Sprint.objects.create(name="Etag Sprint 1", project=self.project)
+    self.target = Sprint.objects.create(name="Etag Sprint 2", project=self.project)
+    self.user = User.objects.create(name="Etag User", active=True)
+    self.label = Label.objects.create(value="Etag Label")
+    self.issue = Issue.objects.create(summary="Etag Issue", type="bug", project=self.project, sprint=self.sprint)
+
+  def test_not_modified_without_full_query(self):
+    urls = [
+      "/projects/{}".format(self.project.id),
+      "/projects/{}/issues".format(self.project.id),
+      "/issues/{}".format(self.issue.id),
+      "/sprints/{}".format(self.sprint.id),
+      "/projects/{}/issues/{}/comments".format(self.project.id, self.issue.id),
+    ]
+    for url in urls:
+      etag = self.client.get(url)["ETag"]
+      with CaptureQueriesContext(connection) as context:
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+      self.assertEqual(response.status_code, 304)
+      self.assertEqual(1, len(context.captured_queries))
+
+  def test_issue_changes_change_etags(self):
+    urls = ["/projects/{}/issues".format(self.project.id), "/issues/{}".format(self.issue.id)]
+    changes = [
+      lambda: self.client.patch("/issues/{}/status".format(self.issue.id), {"status": "assigned"}),
+      # label links added outside the API still touch the issue
+      lambda: self.issue.labels.add(self.label),
+      lambda: self.client.patch("/projects/{}/issues".format(self.project.id), {
+        "issues": [self.issue.id], "source_sprint": self.sprint.id, "target_sprint": self.target.id}),
+    ]
+    for change in changes:
+      etags = [self.client.get(url)["ETag"] for url in urls]
+      change()
+      for url, etag in zip(urls, etags):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(etag, response["ETag"])
+
+  def test_deleted_issue_changes_project_etag(self):
+    other = Issue.objects.create(summary="Etag Issue 2", type="bug", project=self.project, sprint=self.sprint)
+    url = "/projects/{}/issues".format(self.project.id)
+    etag = self.client.get(url)["ETag"]
+    other.delete()
+    self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+  def test_new_comment_changes_comments_etag(self):
+    url = "/projects/{}/issues/{}/comments".format(self.project.id, self.issue.id)
+    etag = self.client.get(url)["ETag"]
+    Comment.objects.create(text="Etag Comment", user=self.user, issue=self.issue)
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(200, response.status_code)
+    self.assertEqual(1, len(response.json()))
+
+
+class TestAsyncViews(APITestCase):
+  """
+  The async read endpoints must answer exactly like their synchronous
+  counterparts.
+  """
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Async Project")
+    self.sprint = Sprint.objects.create(name="Async Sprint", project=self.project)
+    self.user = User.objects.create(name="Async User", active=True)
+    self.label = Label.objects.create(value="Async Label")
+    self.issues = []
+    for i in range(3):
+      issue = Issue.objects.create(
+        summary="Async Issue {}".format(i), type="bug", project=self.project,
+        sprint=self.sprint, assignee=self.user
+      )
+      issue.labels.add(self.label)
+      self.issues.append(issue)
+    Comment.objects.create(text="Async Comment", user=self.user, issue=self.issues[0])
+
+  async def test_async_reads_match_sync_reads(self):
+    pid, iid, uid = self.project.id, self.issues[0].id, self.user.id
+    paths = [
+      "/issues/?page_size=2",
+      "/issues/{}".format(iid),
+      "/projects/{}/issues".format(pid),
+      "/projects/{}/issues/{}/comments".format(pid, iid),
+      "/users/{}/issues?page_size=1".format(uid),
+    ]
+    client = AsyncClient()
+    for path in paths:
+      expected = await client.get(path)
+      response = await client.get("/async" + path)
+      self.assertEqual(200, response.status_code)
+      # next links differ only by the async/ prefix
+      self.assertEqual(expected.content, response.content.replace(b"/async/", b"/"))
+
+  async def test_async_search(self):
+    query = "?project={}&q=or(status:open,type:bug)&page_size=1&facets=type,label".format(self.project.id)
+    client = AsyncClient()
+    expected = await client.get("/issues/search" + query)
+    response = await client.get("/async/issues/search" + query)
+    self.assertEqual(200, response.status_code)
+    self.assertEqual(expected.content, response.content.replace(b"/async/", b"/"))
+
+  def test_async_not_found_and_methods(self):
+    self.assertEqual(404, self.client.get("/async/projects/0/issues").status_code)
+    self.assertEqual(404, self.client.get("/async/issues/0").status_code)
+    self.assertEqual(404, self.client.get("/async/issues/", {"cursor": "bad"}).status_code)
+    self.assertEqual(405, self.client.post("/async/issues/").status_code)
+
+
+class TestQueryCounts(APITestCase):
+  """
+  The number of queries behind each issue list endpoint must not grow with
+  the number of issues returned.
+  """
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Count Project")
+    self.sprint = Sprint.objects.create(name="Count Sprint 1", project=self.project)
+    self.target = Sprint.objects.create(name="Count Sprint 2", project=self.project)
+    self.user = User.objects.create(name="Count User", active=True)
+    self.user.projects.add(self.project)
+    self.watcher = User.objects.create(name="Count Watcher", active=True)
+    self.labels = [Label.objects.create(value="Label {}".format(i)) for i in range(2)]
+    self.issues = []
+
+  def test_list_endpoints_query_counts(self):
+    urls = [
+      "/issues/",
+      "/projects/{}/issues".format(self.project.id),
+      "/users/{}/issues".format(self.user.id),
+    ]
+    for url in urls:
+      self.assertConstantQueries(lambda: self.client.get(url))
+
+  def test_search_issues_query_count(self):
+    url = "/issues/search?project={}&q=or(label:{},status:open)&facets=status,label".format(self.project.id, self.labels[0].id)
+    self.assertConstantQueries(lambda: self.client.get(url))
+
+  def test_assign_issues_query_count(self):
+    url = "/projects/{}/issues/assignees".format(self.project.id)
+
+    def assign():
+      body = {"assignments": [{"issue": issue.id, "assignee": self.user.id} for issue in self.issues]}
+      return self.client.patch(url, body, format="json")
+
+    self.assertConstantQueries(assign)
+
+  def test_update_watchers_query_count(self):
+    url = "/projects/{}/issues/watchers".format(self.project.id)
+    watchers = [User.objects.create(name="Count Watcher {}".format(i), active=True) for i in range(3)]
+    self.project.user_set.add(*watchers)
+
+    def watch():
+      Issue.watchers.through.objects.filter(user__in=watchers).delete()
+      body = {"action": "add", "issues": [issue.id for issue in self.issues], "watchers": [user.id for user in watchers]}
+      return self.client.patch(url, body, format="json")
+
+    self.assertConstantQueries(watch)
+
+  def test_is_watcher_query_count(self):
+    self.addIssues(1)
+    issue = self.issues[0]
+    issue.watchers.add(*[User.objects.create(name="Watcher {}".format(i), active=True) for i in range(20)])
+    with self.assertNumQueries(1):
+      self.assertTrue(issue.isWatcher(self.watcher))
+
+  def test_project_summary_query_count(self):
+    url = "/projects/{}/summary".format(self.project.id)
+    self.assertConstantQueries(lambda: self.client.get(url))
+
+  def test_move_issues_query_count(self):
+    url = "/projects/{}/issues".format(self.project.id)
+
+    def move():
+      # move everything back and forth so each call moves every issue
+      Issue.objects.filter(project=self.project).update(sprint=self.sprint)
+      rebuildCounts([self.project.id])
+      body = {
+        "issues": [issue.id for issue in self.issues],
+        "source_sprint": self.sprint.id,
+        "target_sprint": self.target.id
+      }
+      return self.client.patch(url, body)
+
+    self.assertConstantQueries(move)
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def addIssues(self, count):
+    for i in range(count):
+      issue = Issue.objects.create(
+        summary="Count Issue {}".format(len(self.issues)),
+        type="bug",
+        project=self.project,
+        sprint=self.sprint,
+        assignee=self.user
+      )
+      issue.labels.add(*self.labels)
+      issue.watchers.add(self.watcher)
+      self.issues.append(issue)
+
+  def countQueries(self, request):
+    with CaptureQueriesContext(connection) as context:
+      response = request()
+    self.assertEqual(response.status_code, 200)
+    return len(context.captured_queries)
+
+  def assertConstantQueries(self, request):
+    self.addIssues(2)
+    few = self.countQueries(request)
+    self.addIssues(8)
+    many = self.countQueries(request)
+    self.assertEqual(few, many)
+
+
+class TestRowSerializers(APITestCase):
+  """
+  RowSerializer output must render to exactly the same JSON as the
+  ModelSerializer it stands in for.
+  """
+
+  def setUp(self):
+    # created out of name order so the user's projects must be sorted
+    self.p2 = Project.objects.create(name="Zeta", desc="last")
+    self.p1 = Project.objects.create(name="Alpha")
+    self.u1 = User.objects.create(name="Row User 1", active=True)
+    self.u1.projects.add(self.p2, self.p1)
+    self.u2 = User.objects.create(name="Row User 2", active=False)
+    self.s1 = Sprint.objects.create(
+      name="Row Sprint 1",
+      start_date="2022-03-04T19:06:21.123456Z",
+      project=self.p1
+    )
+    self.s2 = Sprint.objects.create(name="Row Sprint 2", project=self.p2)
+    self.l1 = Label.objects.create(value="Label 1")
+    self.l2 = Label.objects.create(value="Label 2")
+
+    self.i1 = Issue.objects.create(summary="Row Issue 1", type="bug", project=self.p1, sprint=self.s1)
+    self.i2 = Issue.objects.create(
+      summary="Row Issue 2", desc="desc", type="task", status="assigned",
+      project=self.p1, sprint=self.s1, assignee=self.u1
+    )
+    self.i2.labels.add(self.l2, self.l1)
+    self.i2.watchers.add(self.u2)
+    Comment.objects.create(text="Row Comment", user=self.u1, issue=self.i2)
+
+  def test_row_serializers_match_model_serializers(self):
+    serializer_classes = [
+      ProjectSerializer,
+      UserSerializer,
+      IssueSerializer,
+      LabelSerializer,
+      SprintSerializer,
+      CommentSerializer,
+    ]
+    for serializer_class in serializer_classes:
+      queryset = serializer_class.Meta.model.objects.order_by("id")
+      expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+      result = JSONRenderer().render(RowSerializer(serializer_class).serialize(queryset))
+      self.assertEqual(expected, result)
+
+  def test_row_serializer_empty_queryset(self):
+    queryset = Issue.objects.none()
+    self.assertEqual([], RowSerializer(IssueSerializer).serialize(queryset))
+
+
+class TestQueryPlans(TestCase):
+  """
+  Runs EXPLAIN over the hot Issue queries against a seeded database and fails
+  if any of them falls back to a sequential scan or a sort.
+  """
+
+  @classmethod
+  def setUpTestData(cls):
+    cls.project = Project.objects.create(name="Plan Project")
+    other = Project.objects.create(name="Other Project")
+    cls.user = User.objects.create(name="Plan User", active=True)
+    cls.sprint = Sprint.objects.create(name="Plan Sprint", project=cls.project)
+    other_sprint = Sprint.objects.create(name="Other Sprint", project=other)
+
+    issues = []
+    for i in range(400):
+      project, sprint = (cls.project, cls.sprint) if i % 4 else (other, other_sprint)
+      issues.append(Issue(
+        summary="Issue {}".format(i),
+        type=["bug", "task"][i % 2],
+        status=Issue.statusList[i % len(Issue.statusList)],
+        project=project,
+        sprint=sprint,
+        assignee=cls.user if i % 3 == 0 else None
+      ))
+    Issue.objects.bulk_create(issues)
+    cls.issue_ids = list(Issue.objects.filter(project=cls.project).values_list("id", flat=True)[:20])
+
+  def setUp(self):
+    with connection.cursor() as cursor:
+      cursor.execute("ANALYZE")
+      if connection.vendor == "postgresql":
+        # only let the planner pick a scan or a sort when no index can serve the query
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_bitmapscan = off")
+        cursor.execute("SET LOCAL enable_sort = off")
+
+  def test_project_issues_plan(self):
+    issues = Issue.objects.filter(project=self.project)
+    self.assertIndexedPlan(self.paginate(issues))
+    self.assertIndexedPlan(self.paginate(issues, cursor=self.cursorAfter(issues)))
+
+  def test_assignee_issues_plan(self):
+    issues = Issue.objects.filter(assignee=self.user)
+    self.assertIndexedPlan(self.paginate(issues))
+    self.assertIndexedPlan(self.paginate(issues, cursor=self.cursorAfter(issues)))
+
+  def test_all_issues_plan(self):
+    issues = Issue.objects.all()
+    self.assertIndexedPlan(self.paginate(issues))
+    self.assertIndexedPlan(self.paginate(issues, cursor=self.cursorAfter(issues)))
+
+  def test_search_status_and_type_plans(self):
+    self.assertIndexedPlan(self.paginate(Issue.objects.filter(status="inprogress")))
+    self.assertIndexedPlan(self.paginate(Issue.objects.filter(type="bug")))
+
+  def test_search_filter_plans(self):
+    queries = [
+      "status=open,inprogress",
+      "type=bug",
+      "assignee={},{}".format(self.user.id, self.user.id + 1),
+      "creation_date=2022-01-01..2030-01-01",
+      "project={}&status=open".format(self.project.id),
+      "q=or(status:open,status:done)",
+      "q=and(project:{},or(type:bug,type:task))".format(self.project.id),
+    ]
+    for query in queries:
+      predicate = compileSearch(QueryDict(query))
+      issues = Issue.objects.filter(predicate)
+      self.assertIndexedPlan(self.paginate(issues))
+      self.assertIndexedPlan(self.paginate(issues, cursor=self.cursorAfter(issues)))
+
+  def test_search_label_plan(self):
+    # matches are found through the link table's label index; only they are
+    # sorted, so the sort is allowed here
+    label = Label.objects.create(value="Plan Label")
+    label.issue_set.add(*self.issue_ids)
+    issues = Issue.objects.filter(compileSearch(QueryDict("label={}".format(label.id))))
+    self.assertIndexedPlan(self.paginate(issues), allowSort=True)
+    self.assertIndexedPlan(self.paginate(issues, cursor=self.cursorAfter(issues)), allowSort=True)
+
+  def test_move_issues_plan(self):
+    issues = (Issue.objects
+                .filter(project=self.project)
+                .filter(sprint=self.sprint)
+                .filter(id__in=self.issue_ids))
+    self.assertIndexedPlan(issues)
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def paginate(self, queryset, **params):
+    request = Request(APIRequestFactory().get("/", params))
+    return KeysetPagination().paginate_queryset(queryset, request)
+
+  def cursorAfter(self, queryset):
+    issue = queryset.order_by("-creation_date", "-id")[10]
+    return KeysetPagination().encodeCursor(issue.creation_date.isoformat(), issue.id)
+
+  def assertIndexedPlan(self, queryset, allowSort=False):
+    plan = queryset.explain()
+    if connection.vendor == "postgresql":
+      seq_scan = re.search(r"Seq Scan on projects_issue", plan)
+      sort = re.search(r"\bSort\b", plan)
+    else:
+      seq_scan = re.search(r"SCAN (TABLE )?projects_issue$", plan, re.MULTILINE)
+      sort = re.search(r"USE TEMP B-TREE", plan)
+    self.assertIsNone(seq_scan, "Query falls back to a sequential scan:\n{}".format(plan))
+    if not allowSort:
+      self.assertIsNone(sort, "Query falls back to a sort:\n{}".format(plan))
+
+
+class TestPersistentConnections(TestCase):
+
+  def setUp(self):
+    self.settings = dict(
+      connection.settings_dict,
+      CONN_MAX_AGE=600,
+      CONN_HEALTH_CHECKS=True,
+      CONN_MAX_PER_WORKER=1,
+      CONN_WAIT_TIMEOUT=0.01,
+    )
+    if connection.vendor == "sqlite":
+      # in-memory databases ignore close(), so connect to a file instead
+      directory = tempfile.TemporaryDirectory()
+      self.addCleanup(directory.cleanup)
+      self.settings["NAME"] = directory.name + "/db.sqlite3"
+    # slots are counted per alias, so every test gets its own
+    self.alias = "persistent-{}".format(self._testMethodName)
+    self.wrappers = []
+
+  def tearDown(self):
+    for wrapper in self.wrappers:
+      wrapper.close()
+
+  def test_connections_capped_per_worker(self):
+    first = self.makeWrapper()
+    second = self.makeWrapper()
+    first.ensure_connection()
+    with self.assertRaises(OperationalError):
+      second.ensure_connection()
+
+    first.close()
+    second.ensure_connection()
+    self.assertIsNotNone(second.connection)
+
+  def test_slot_released_when_thread_wrapper_collected(self):
+    first = self.makeWrapper()
+    first.ensure_connection()
+    self.wrappers.remove(first)
+    del first
+    gc.collect()
+
+    second = self.makeWrapper()
+    second.ensure_connection()
+    self.assertIsNotNone(second.connection)
+
+  def test_connection_kept_between_requests(self):
+    wrapper = self.makeWrapper()
+    wrapper.ensure_connection()
+    opened = wrapper.connection
+
+    with mock.patch.object(wrapper, "is_usable", return_value=True) as is_usable:
+      wrapper.close_if_unusable_or_obsolete()
+      wrapper.ensure_connection()
+      wrapper.ensure_connection()
+    # checked once per request, not once per query
+    self.assertEqual(is_usable.call_count, 1)
+    self.assertIs(wrapper.connection, opened)
+
+  def test_dropped_connection_replaced(self):
+    wrapper = self.makeWrapper()
+    wrapper.ensure_connection()
+    opened = wrapper.connection
+
+    with mock.patch.object(wrapper, "is_usable", return_value=False):
+      wrapper.close_if_unusable_or_obsolete()
+      wrapper.ensure_connection()
+    self.assertIsNotNone(wrapper.connection)
+    self.assertIsNot(wrapper.connection, opened)
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def makeWrapper(self):
+    # the production backend mixes the same behaviour into the postgres one
+    wrapper_class = type("DatabaseWrapper", (PersistentConnectionMixin, type(connections["default"])), {})
+    wrapper = wrapper_class(self.settings, self.alias)
+    self.wrappers.append(wrapper)
+    return wrapper
+
+
+class TestFullText(APITestCase):
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Search Project")
+    self.other = Project.objects.create(name="Other Search Project")
+    self.user = User.objects.create(name="Searcher", active=True)
+    self.sprint = Sprint.objects.create(name="Search Sprint", project=self.project)
+    self.other_sprint = Sprint.objects.create(name="Other Search Sprint", project=self.other)
+    self.in_summary = Issue.objects.create(summary="Login button crashes", desc="Seen on the settings page",
+      project=self.project, sprint=self.sprint)
+    self.in_desc = Issue.objects.create(summary="Settings page slow", desc="The login button takes seconds",
+      project=self.project, sprint=self.sprint)
+    self.in_comment = Issue.objects.create(summary="Profile picture", desc="Upload fails",
+      project=self.project, sprint=self.sprint)
+    Comment.objects.create(text="Also happens after login", user=self.user, issue=self.in_comment)
+    self.elsewhere = Issue.objects.create(summary="Login timeout", project=self.other, sprint=self.other_sprint)
+
+  def test_summary_matches_rank_first(self):
+    results = self.search("q=login")["results"]
+    # equal ranks fall back to the newest issue first
+    self.assertEqual([result["id"] for result in results],
+      [self.elsewhere.id, self.in_summary.id, self.in_desc.id, self.in_comment.id])
+    self.assertEqual(results[0]["rank"], results[1]["rank"])
+    self.assertGreater(results[1]["rank"], results[2]["rank"])
+    self.assertGreater(results[2]["rank"], results[3]["rank"])
+    self.checkIssueEqual(self.in_summary, results[1])
+
+  def test_every_word_must_match(self):
+    results = self.search("q=login button")["results"]
+    self.assertEqual([result["id"] for result in results], [self.in_summary.id, self.in_desc.id])
+    self.assertEqual(self.search("q=login nowhere")["results"], [])
+
+  def test_pages_follow_rank(self):
+    first = self.search("q=login&page_size=2")
+    self.assertEqual([result["id"] for result in first["results"]], [self.elsewhere.id, self.in_summary.id])
+    second = self.client.get(first["next"]).json()
+    self.assertEqual([result["id"] for result in second["results"]], [self.in_desc.id, self.in_comment.id])
+    self.assertIsNone(second["next"])
+
+  def test_pages_through_equal_ranks(self):
+    # each cursor names a rank read back from the database, ties included
+    ids, page = [], self.search("q=login&page_size=1")
+    while True:
+      ids.extend(result["id"] for result in page["results"])
+      if page["next"] is None:
+        break
+      page = self.client.get(page["next"]).json()
+    self.assertEqual(ids, [self.elsewhere.id, self.in_summary.id, self.in_desc.id, self.in_comment.id])
+
+  @override_settings(FULLTEXT_MAX_CANDIDATES=2)
+  def test_only_newest_matches_ranked(self):
+    self.assertEqual(self.searchIds("q=login"), [self.elsewhere.id, self.in_comment.id])
+    self.assertEqual(self.searchIds("q=login&project={}".format(self.project.id)), [self.in_desc.id, self.in_comment.id])
+
+  def test_project_filter(self):
+    results = self.search("q=login&project={}".format(self.other.id))["results"]
+    self.assertEqual([result["id"] for result in results], [self.elsewhere.id])
+
+  def test_invalid_queries(self):
+    self.assertEqual(self.client.get("/issues/fulltext").status_code, 400)
+    self.assertEqual(self.client.get("/issues/fulltext?q=login&project=x").status_code, 400)
+    self.assertEqual(self.client.get("/issues/fulltext?q=login&cursor=bad").status_code, 404)
+
+  def test_edits_reindex_issue(self):
+    self.in_comment.summary = "Avatar upload"
+    self.in_comment.save()
+    self.assertEqual(self.searchIds("q=avatar"), [self.in_comment.id])
+    # the comment text is kept in the document
+    self.assertIn(self.in_comment.id, self.searchIds("q=login"))
+
+    Comment.objects.create(text="Avatar cropped badly", user=self.user, issue=self.in_desc)
+    self.assertEqual(self.searchIds("q=cropped"), [self.in_desc.id])
+
+  def test_only_text_edits_reindex_issue(self):
+    with mock.patch("projects.signals.indexIssues") as indexIssues:
+      self.in_desc.status = "assigned"
+      self.in_desc.save()
+      self.in_desc.save()
+      indexIssues.assert_not_called()
+      self.in_desc.desc = "The login button takes minutes"
+      self.in_desc.save()
+      indexIssues.assert_called_once_with([self.in_desc.id])
+
+  def test_comment_delete_reindexes_issue(self):
+    with self.captureOnCommitCallbacks(execute=True):
+      Comment.objects.filter(issue=self.in_comment).delete()
+    self.assertNotIn(self.in_comment.id, self.searchIds("q=login"))
+
+  def test_issue_delete_drops_document(self):
+    with self.captureOnCommitCallbacks(execute=True):
+      self.in_comment.delete()
+    self.assertFalse(IssueDocument.objects.filter(issue_id=self.in_comment.id).exists())
+    self.assertFalse(IssueTerm.objects.filter(issue_id=self.in_comment.id).exists())
+    self.assertNotIn(self.in_comment.id, self.searchIds("q=login"))
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def search(self, query):
+    response = self.client.get("/issues/fulltext?{}".format(query))
+    self.assertEqual(response.status_code, 200)
+    return response.json()
+
+  def searchIds(self, query):
+    return [result["id"] for result in self.search(query)["results"]]
+
+  def checkIssueEqual(self, expected_issue, result_issue):
+    self.assertEqual(expected_issue.summary, result_issue['summary'])
+    self.assertEqual(expected_issue.desc, result_issue['desc'])
+    self.assertEqual(expected_issue.project.id, result_issue['project'])
+
+
+class TestExport(APITestCase):
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Export Project")
+    self.sprint = Sprint.objects.create(name="Export Sprint", project=self.project)
+    self.user = User.objects.create(name="Exporter", active=True)
+    self.label = Label.objects.create(value="export")
+    self.issues = [
+      Issue.objects.create(summary="Export Issue {}".format(i), desc="Line one,\nline \"two\"",
+        project=self.project, sprint=self.sprint)
+      for i in range(5)
+    ]
+    self.issues[0].labels.add(self.label)
+    self.issues[0].watchers.add(self.user)
+    self.comment = Comment.objects.create(text="Exported comment", user=self.user, issue=self.issues[0])
+
+  def test_ndjson_export(self):
+    response = self.client.get("/projects/{}/export".format(self.project.id))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response["Content-Type"], "application/x-ndjson")
+    rows = [json.loads(line) for line in self.readExport(response).splitlines()]
+    self.assertEqual([row["id"] for row in rows], [issue.id for issue in self.issues])
+    self.assertEqual(rows[0]["labels"], [self.label.id])
+    self.assertEqual(rows[0]["watchers"], [self.user.id])
+    self.assertEqual([comment["text"] for comment in rows[0]["comments"]], ["Exported comment"])
+    self.assertEqual(rows[1]["comments"], [])
+
+    # rows match the issue endpoint's
+    issue = self.client.get("/issues/{}".format(self.issues[0].id)).json()
+    del rows[0]["comments"]
+    self.assertEqual(rows[0], issue)
+
+  def test_csv_export(self):
+    response = self.client.get("/projects/{}/export?output=csv".format(self.project.id))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response["Content-Type"], "text/csv")
+    rows = list(csv.DictReader(io.StringIO(self.readExport(response))))
+    self.assertEqual(len(rows), 5)
+    self.assertEqual(rows[0]["summary"], "Export Issue 0")
+    self.assertEqual(rows[0]["desc"], "Line one,\nline \"two\"")
+    self.assertEqual(rows[0]["labels"], str(self.label.id))
+    self.assertEqual(rows[0]["assignee"], "")
+    self.assertEqual(json.loads(rows[0]["comments"])[0]["id"], self.comment.id)
+
+  def test_queries_per_chunk(self):
+    # one query each for issues, labels, watchers and comments per chunk
+    with override_settings(STREAM_CHUNK_SIZE=2):
+      with self.assertNumQueries(1 + 3 * 3):
+        rows = list(exportRows(self.project.id))
+    self.assertEqual(len(rows), 5)
+
+  def test_invalid_exports(self):
+    self.assertEqual(self.client.get("/projects/0/export").status_code, 404)
+    self.assertEqual(self.client.get("/projects/{}/export?output=xml".format(self.project.id)).status_code, 400)
+
+  def test_export_command(self):
+    with tempfile.NamedTemporaryFile(suffix=".ndjson") as out:
+      with mock.patch("sys.stderr", new_callable=io.StringIO) as report:
+        call_command("exportproject", self.project.id, file=out.name)
+      lines = open(out.name).read().splitlines()
+    self.assertEqual(len(lines), 5)
+    self.assertIn("Exported 5 issues", report.getvalue())
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def readExport(self, response):
+    return b"".join(response.streaming_content).decode()
+
+
+class TestImporter(APITestCase):
+
+  def setUp(self):
+    self.records = [
+      {"kind": "project", "id": "P1", "name": "Legacy Project"},
+      {"kind": "user", "id": "U1", "name": "Legacy User", "active": True, "projects": ["P1"]},
+      {"kind": "user", "id": "U2", "name": "Legacy Watcher", "active": False},
+      {"kind": "label", "id": "L1", "value": "legacy"},
+      {"kind": "sprint", "id": "S1", "name": "Legacy Sprint", "project": "P1", "start_date": "2021-01-04T09:00:00Z"},
+      {"kind": "issue", "id": "I1", "summary": "Legacy crash", "desc": "Crashes on start", "type": "bug",
+        "status": "inprogress", "project": "P1", "sprint": "S1", "assignee": "U1", "labels": ["L1"],
+        "watchers": ["U1", "U2"], "creation_date": "2021-01-05T10:00:00Z"},
+      {"kind": "issue", "id": "I2", "summary": "Legacy task", "type": "task", "project": "P1", "sprint": "S1"},
+      {"kind": "comment", "issue": "I1", "user": "U2", "text": "Seen it too"},
+    ]
+
+  def test_import_all_kinds(self):
+    self.runImport(self.records, batch_size=3)
+    project = Project.objects.get(name="Legacy Project")
+    user = User.objects.get(name="Legacy User")
+    issue = Issue.objects.get(summary="Legacy crash")
+    self.assertEqual(issue.project, project)
+    self.assertEqual(issue.sprint.name, "Legacy Sprint")
+    self.assertEqual(issue.assignee, user)
+    self.assertEqual(issue.status, "inprogress")
+    self.assertEqual(issue.creation_date.isoformat(), "2021-01-05T10:00:00+00:00")
+    self.assertEqual([label.value for label in issue.labels.all()], ["legacy"])
+    self.assertEqual(set(issue.watchers.values_list("name", flat=True)), {"Legacy User", "Legacy Watcher"})
+    self.assertEqual(issue.comment_set.get().text, "Seen it too")
+    self.assertTrue(user.inProject(project.id))
+    self.assertTrue(membershipCache.isMember(user.id, project.id))
+
+    # what save() and the signals keep up to date for single writes
+    self.assertEqual(rebuildCounts(), 0)
+    summary = self.client.get("/projects/{}/summary".format(project.id)).json()
+    self.assertEqual(summary["status"]["inprogress"], 1)
+    self.assertEqual(summary["status"]["open"], 1)
+    results = self.client.get("/issues/fulltext?q=seen").json()["results"]
+    self.assertEqual([result["id"] for result in results], [issue.id])
+
+  def test_csv_import_refers_to_earlier_file(self):
+    self.runImport(self.records[:5])
+    rows = [
+      "id,summary,type,status,project,sprint,assignee,labels,watchers",
+      "I9,CSV issue,bug,open,P1,S1,,L1,U1;U2",
+    ]
+    self.runImport(rows, suffix=".csv", kind="issue")
+    issue = Issue.objects.get(summary="CSV issue")
+    self.assertIsNone(issue.assignee)
+    self.assertEqual(issue.sprint.name, "Legacy Sprint")
+    self.assertEqual(issue.watchers.count(), 2)
+
+  def test_resume_after_failure(self):
+    records = list(self.records)
+    records[6] = dict(records[6], sprint="S404")
+    with self.assertRaisesRegex(CommandError, "unknown sprint 'S404'"):
+      self.runImport(records, batch_size=3, path=self.importPath())
+    # the first two batches are committed, the failed one is not
+    self.assertEqual(ImportCheckpoint.objects.get().records, 6)
+    self.assertTrue(Issue.objects.filter(summary="Legacy crash").exists())
+    self.assertFalse(Issue.objects.filter(summary="Legacy task").exists())
+
+    records[6] = self.records[6]
+    self.runImport(records, batch_size=3, path=self.importPath())
+    self.assertEqual(ImportCheckpoint.objects.get().records, 8)
+    self.assertEqual(Project.objects.filter(name="Legacy Project").count(), 1)
+    self.assertEqual(Issue.objects.filter(project__name="Legacy Project").count(), 2)
+    self.assertEqual(Comment.objects.count(), 1)
+
+  def test_invalid_records(self):
+    with self.assertRaisesRegex(CommandError, "unknown kind 'epic'"):
+      self.runImport([{"kind": "epic", "id": "E1"}])
+    with self.assertRaisesRegex(CommandError, "status must be one of"):
+      self.runImport(self.records[:5] + [dict(self.records[6], status="blocked")])
+
+  def test_import_logged_for_sync(self):
+    self.runImport(self.records)
+    issue = Issue.objects.get(summary="Legacy crash")
+    changes = self.client.get("/changes?project={}".format(issue.project_id)).json()["results"]
+    self.assertEqual([(change["entity"], change["action"]) for change in changes], [
+      ("project", "created"),
+      ("sprint", "created"),
+      ("issue", "created"),
+      ("issue", "created"),
+      ("issue", "added"),
+      ("issue", "added"),
+      ("comment", "created"),
+    ])
+    self.assertEqual(changes[2]["data"]["creation_date"], "2021-01-05T10:00:00Z")
+    self.assertEqual(changes[5]["data"]["watchers"], sorted(issue.watchers.values_list("id", flat=True)))
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def importPath(self):
+    if not hasattr(self, "path"):
+      directory = tempfile.TemporaryDirectory()
+      self.addCleanup(directory.cleanup)
+      self.path = directory.name + "/legacy.ndjson"
+    return self.path
+
+  def runImport(self, records, batch_size=5000, suffix=".ndjson", kind=None, path=None):
+    if path is None:
+      handle = tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False)
+      handle.close()
+      self.addCleanup(os.remove, handle.name)
+      path = handle.name
+    with open(path, "w") as file:
+      for record in records:
+        file.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+    with mock.patch("sys.stdout", new_callable=io.StringIO):
+      call_command("importissues", path, source="legacy", batch_size=batch_size, kind=kind)
+
+
+class TestSeedData(APITestCase):
+
+  def test_seeded_dataset_is_skewed_and_consistent(self):
+    tag = seedDataset(projects=4, users_per_project=5, sprints_per_project=2, issues=400, labels=6, skew=1.2)
+    projects = Project.objects.filter(name__startswith="Seed {} ".format(tag))
+    sizes = sorted(Issue.objects.filter(project=project).count() for project in projects)
+    self.assertEqual(sum(sizes), 400)
+    self.assertGreater(sizes[-1], 2 * sizes[0])
+    # issues only go to sprints and members of their own project
+    self.assertFalse(Issue.objects.filter(project__in=projects).exclude(sprint__project=F("project")).exists())
+    self.assertFalse(Issue.objects.filter(project__in=projects, assignee__isnull=False)
+      .exclude(assignee__projects=F("project")).exists())
+    self.assertEqual(rebuildCounts(), 0)
+    self.assertEqual(IssueDocument.objects.filter(issue__project__in=projects).count(), 400)
+
+    dropDataset(tag)
+    self.assertFalse(Project.objects.filter(name__startswith="Seed {} ".format(tag)).exists())
+    self.assertFalse(User.objects.filter(name__startswith="Seed {} ".format(tag)).exists())
+    self.assertFalse(Label.objects.filter(value__startswith="seed-{}-".format(tag)).exists())
+
+  def test_benchmark_covers_every_route(self):
+    with tempfile.TemporaryDirectory() as directory:
+      with mock.patch("sys.stdout", new_callable=io.StringIO):
+        call_command("benchendpoints", projects=2, users_per_project=4, sprints_per_project=2, issues=60,
+          repeat=2, output=directory + "/bench.json")
+      report = json.load(open(directory + "/bench.json"))
+    routes = set(result["route"] for result in report["results"])
+    self.assertEqual(routes, set(str(pattern.pattern) for pattern in urlpatterns))
+    for result in report["results"]:
+      self.assertLess(result["status"], 400, result["path"])
+      self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+    self.assertEqual(report["dataset"]["issues"], 60)
+    # the seeded dataset is dropped afterwards
+    self.assertFalse(Project.objects.filter(name__startswith="Seed ").exists())
+
+
+class TestMetrics(APITestCase):
+
+  def setUp(self):
+    requestMetrics.clear()
+    self.project = Project.objects.create(name="Metrics Project")
+    self.sprint = Sprint.objects.create(name="Metrics Sprint", project=self.project)
+    self.issue = Issue.objects.create(summary="Metrics Issue", type="bug", project=self.project, sprint=self.sprint)
+
+  def test_server_timing_counts_queries(self):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get("/issues/{}".format(self.issue.id))
+    timing = self.parseServerTiming(response)
+    self.assertEqual(timing["queries"], len(queries.captured_queries))
+    self.assertGreater(timing["queries"], 0)
+    self.assertGreaterEqual(timing["app"], timing["db"])
+
+  async def test_async_views_counted(self):
+    response = await AsyncClient().get("/async/issues/{}".format(self.issue.id))
+    self.assertEqual(response.status_code, 200)
+    self.assertGreater(self.parseServerTiming(response)["queries"], 0)
+
+  def test_metrics_endpoint(self):
+    for _ in range(3):
+      self.client.get("/issues/{}".format(self.issue.id))
+    self.client.get("/issues/0")
+    self.client.get("/nowhere")
+
+    response = self.client.get("/metrics")
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+    metrics = response.content.decode()
+    self.assertIn('http_requests_total{route="issues/<int:pk>",method="GET",status="200"} 3', metrics)
+    self.assertIn('http_requests_total{route="issues/<int:pk>",method="GET",status="404"} 1', metrics)
+    self.assertIn('http_requests_total{route="unmatched",method="GET",status="404"} 1', metrics)
+    self.assertIn('http_request_duration_seconds_count{route="issues/<int:pk>",method="GET"} 4', metrics)
+    self.assertIn('http_request_duration_seconds_bucket{route="issues/<int:pk>",method="GET",le="+Inf"} 4', metrics)
+    self.assertIn('cache_hits_total{cache="responses"}', metrics)
+    self.assertIn('cache_entries{cache="membership"}', metrics)
+
+    # buckets are cumulative
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in metrics.splitlines()
+               if line.startswith('http_request_queries_bucket{route="issues/<int:pk>"')]
+    self.assertEqual(buckets, sorted(buckets))
+
+  def test_metrics_summed_across_workers(self):
+    with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+      # another worker still running, and one restarted after serving requests
+      self.writeWorker(directory, "metrics-1-1.json", os.getppid(), False, 2, 5)
+      self.writeWorker(directory, "metrics-2-1.json", os.getpid() + 10 ** 6, True, 4, 100)
+      for _ in range(3):
+        self.client.get("/issues/{}".format(self.issue.id))
+
+      for _ in range(2):
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn('http_requests_total{route="issues/<int:pk>",method="GET",status="200"} 9', metrics)
+        self.assertIn('http_request_duration_seconds_count{route="issues/<int:pk>",method="GET"} 9', metrics)
+        # the restarted worker's hits still count, its cache entries are gone
+        stats = membershipCache.stats()
+        self.assertIn('cache_hits_total{cache="membership"} ' + str(stats["hits"] + 6), metrics)
+        self.assertIn('cache_entries{cache="membership"} ' + str(stats["size"] + 5), metrics)
+
+      # the restarted worker's file was folded into the archive, once
+      files = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+      self.assertNotIn("metrics-2-1.json", files)
+      self.assertIn("metrics-exited.json", files)
+      self.assertIn("metrics-1-1.json", files)
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def writeWorker(self, directory, name, pid, exited, requests, cache_size):
+    metrics = RequestMetrics(requestMetrics.latency_buckets, requestMetrics.query_buckets)
+    for _ in range(requests):
+      metrics.observe("issues/<int:pk>", "GET", 200, 0.01, 0.001, 3)
+    writeState(os.path.join(directory, name), {
+      "pid": pid,
+      "exited": exited,
+      "requests": metrics.state(),
+      "caches": {"membership": {"hits": requests, "misses": 0, "evictions": 0, "size": cache_size}},
+    })
+
+  def parseServerTiming(self, response):
+    app, db = response["Server-Timing"].split(", ")
+    return {
+      "app": float(app.split("dur=")[1]),
+      "db": float(db.split(";")[1].split("=")[1]),
+      "queries": int(re.search(r'desc="(\d+) queries"', db).group(1)),
+    }
+
+
+class TestProfiling(APITestCase):
+
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.directory = directory.name
+    self.project = Project.objects.create(name="Profiled Project")
+    self.sprint = Sprint.objects.create(name="Profiled Sprint", project=self.project)
+    Issue.objects.create(summary="Profiled Issue", type="bug", project=self.project, sprint=self.sprint)
+
+  def test_profile_requested_by_header(self):
+    with self.profilingSettings():
+      response = self.client.get("/issues/search?project={}".format(self.project.id), HTTP_X_PROFILE="secret")
+    self.assertEqual(response.status_code, 200)
+    name = response["X-Profile"]
+    self.assertTrue(name.endswith("-get-issues_search-{}.txt".format(os.getpid())))
+
+    summary = open(os.path.join(self.directory, name)).read()
+    self.assertTrue(summary.startswith("GET /issues/search?project={} -> 200".format(self.project.id)))
+    self.assertRegex(summary, r"wall time [\d.]+ ms, of which [1-9]\d* SQL queries [\d.]+ ms")
+    self.assertIn("database driver", summary)
+    self.assertIn("rest framework", summary)
+    self.assertIn("top functions by cumulative time:", summary)
+    # the raw profile loads with pstats
+    stats = pstats.Stats(os.path.join(self.directory, name[:-len(".txt")] + ".prof"))
+    self.assertGreater(stats.total_tt, 0)
+
+  def test_wrong_token_not_profiled(self):
+    with self.profilingSettings():
+      response = self.client.get("/issues/", HTTP_X_PROFILE="guess")
+    self.assertFalse(response.has_header("X-Profile"))
+    self.assertEqual(os.listdir(self.directory), [])
+
+  def test_sampled_requests_profiled(self):
+    with self.profilingSettings(PROFILING_TOKEN=None, PROFILING_SAMPLE_RATE=1.0):
+      response = self.client.get("/issues/")
+    self.assertTrue(response.has_header("X-Profile"))
+    self.assertEqual(len(os.listdir(self.directory)), 2)
+
+  def test_disabled_without_directory(self):
+    with self.profilingSettings(PROFILING_DIR=None):
+      response = self.client.get("/issues/", HTTP_X_PROFILE="secret")
+    self.assertFalse(response.has_header("X-Profile"))
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def profilingSettings(self, **overrides):
+    values = {"PROFILING_DIR": self.directory, "PROFILING_TOKEN": "secret", "PROFILING_SAMPLE_RATE": 0}
+    values.update(overrides)
+    return override_settings(**values)
+
+
+class TestChanges(APITestCase):
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Synced Project")
+    self.sprint = Sprint.objects.create(name="Synced Sprint 1", project=self.project)
+    self.target = Sprint.objects.create(name="Synced Sprint 2", project=self.project)
+    self.user = User.objects.create(name="Synced User", active=True)
+    self.user.projects.add(self.project)
+    self.label = Label.objects.create(value="synced")
+    self.issue = Issue.objects.create(summary="Synced Issue", type="bug", project=self.project, sprint=self.sprint)
+    self.cursor = self.readAll()[-1]
+
+  def test_every_write_logged_in_order(self):
+    project_url = "/projects/{}".format(self.project.id)
+    self.client.patch("/projects/{}/issues/{}/assignee".format(self.project.id, self.issue.id), {"assignee": self.user.id})
+    self.client.patch("/issues/{}/status".format(self.issue.id), {"status": "assigned"})
+    self.client.patch("/issues/{}/label".format(self.issue.id), {"label": self.label.id})
+    watcher = User.objects.create(name="Synced Watcher", active=True)
+    watcher.projects.add(self.project)
+    self.client.patch(project_url + "/issues/watchers", {"action": "add", "issues": [self.issue.id], "watchers": [watcher.id]}, format="json")
+    self.client.patch(project_url + "/issues/watchers", {"action": "mute", "issues": [self.issue.id], "watchers": [watcher.id]}, format="json")
+    self.client.patch(project_url + "/issues", {"issues": [self.issue.id], "source_sprint": self.sprint.id, "target_sprint": self.target.id})
+    comment = self.client.post("/comments/", {"text": "Synced", "user": self.user.id, "issue": self.issue.id}).json()
+    Comment.objects.get(pk=comment["id"]).delete()
+
+    changes = self.client.get("/changes?project={}&since={}".format(self.project.id, self.cursor)).json()["results"]
+    self.assertEqual([(change["entity"], change["action"]) for change in changes], [
+      ("issue", "updated"),
+      ("issue", "updated"),
+      ("issue", "added"),
+      ("issue", "added"),
+      ("issue", "removed"),
+      ("issue", "updated"),
+      ("comment", "created"),
+      ("comment", "deleted"),
+    ])
+    # only the columns that changed
+    self.assertEqual(set(changes[0]["data"]), {"assignee_id", "updated_at"})
+    self.assertEqual(changes[0]["data"]["assignee_id"], self.user.id)
+    self.assertEqual(changes[1]["data"]["status"], "assigned")
+    self.assertEqual(changes[2]["data"], {"labels": [self.label.id]})
+    self.assertEqual(changes[3]["data"], {"watchers": [watcher.id]})
+    self.assertEqual(changes[4]["data"], {"watchers": [watcher.id]})
+    self.assertEqual(changes[5]["data"]["sprint_id"], self.target.id)
+    self.assertEqual(changes[6]["data"]["text"], "Synced")
+    self.assertTrue(all(change["entity_id"] == self.issue.id for change in changes[:6]))
+
+    # users and labels belong to no project, so only the unfiltered log has them
+    entities = set(change["entity"] for change in self.readAll(self.cursor, project=None, rows=True))
+    self.assertEqual(entities, {"issue", "comment", "user"})
+
+  def test_unchanged_saves_not_logged(self):
+    before = Change.objects.order_by("-id").values_list("id", flat=True).first()
+    issue = Issue.objects.get(pk=self.issue.id)
+    issue.save()
+    issue.desc = "Now described"
+    issue.save()
+    issue.save()
+    data = Change.objects.filter(id__gt=before).order_by("id").values_list("data", flat=True)
+    self.assertEqual([set(values) for values in data], [{"desc", "updated_at"}])
+
+  def test_sync_pages_through_new_changes_only(self):
+    for i in range(5):
+      Issue.objects.create(summary="Synced Issue {}".format(i), type="task", project=self.project, sprint=self.sprint)
+    changes = self.readAll(self.cursor, page_size=2, rows=True)
+    self.assertEqual([change["action"] for change in changes], ["created"] * 5)
+    self.assertEqual(sorted(change["id"] for change in changes), [change["id"] for change in changes])
+
+    # polling past the end returns nothing, then only what is written next
+    response = self.client.get("/changes?project={}&since={}".format(self.project.id, self.readAll(self.cursor)[-1])).json()
+    self.assertEqual((response["results"], response["more"]), ([], False))
+    issue_id = self.issue.id
+    self.issue.delete()
+    changes = self.client.get(response["next"]).json()["results"]
+    self.assertEqual([(change["entity"], change["entity_id"], change["action"]) for change in changes],
+                     [("issue", issue_id, "deleted")])
+
+  def test_sync_cost_independent_of_project_size(self):
+    Issue.objects.bulk_create([
+      Issue(summary="Bulk Issue {}".format(i), type="bug", project=self.project, sprint=self.sprint) for i in range(200)
+    ])
+    self.issue.labels.add(self.label)
+    url = "/changes?project={}&since={}".format(self.project.id, self.cursor)
+    with CaptureQueriesContext(connection) as context:
+      response = self.client.get(url)
+    self.assertEqual(len(response.json()["results"]), 1)
+    self.assertEqual(len(context.captured_queries), 1)
+
+  def test_entries_roll_back_with_their_write(self):
+    before = Change.objects.count()
+    with mock.patch("projects.transitions.statusChangeCounts", side_effect=RuntimeError):
+      with self.assertRaises(RuntimeError):
+        self.client.patch("/issues/status", {"issues": [self.issue.id], "status": "assigned"})
+    with self.assertRaises(RuntimeError):
+      with transaction.atomic():
+        self.issue.labels.add(self.label)
+        raise RuntimeError()
+    self.assertEqual(Change.objects.count(), before)
+
+  def test_bad_parameters(self):
+    self.assertEqual(self.client.get("/changes?project=x").status_code, 400)
+    self.assertEqual(self.client.get("/changes?since=x").status_code, 404)
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def readAll(self, since=None, project="self", page_size=None, rows=False):
+    # follows the next links until a page says there is no more; returns
+    # every row read, or the cursors of the pages
+    url = "/changes?"
+    if project == "self":
+      url += "project={}&".format(self.project.id)
+    if since:
+      url += "since={}&".format(since)
+    if page_size:
+      url += "page_size={}&".format(page_size)
+    results, cursors = [], []
+    while True:
+      response = self.client.get(url).json()
+      results.extend(response["results"])
+      url = response["next"]
+      cursors.append(QueryDict(url.split("?", 1)[1]).get("since"))
+      if not response["more"]:
+        return results if rows else cursors
+
+
+class TestJobs(APITestCase):
+
+  def setUp(self):
+    self.project = Project.objects.create(name="Watched Project")
+    self.sprint = Sprint.objects.create(name="Watched Sprint", project=self.project)
+    self.author = User.objects.create(name="Author", active=True)
+    self.watchers = [User.objects.create(name="Watcher {}".format(i), active=True) for i in range(2)]
+    self.issues = []
+    for i in range(4):
+      issue = Issue.objects.create(summary="Watched Issue {}".format(i), type="bug", project=self.project, sprint=self.sprint)
+      issue.watchers.add(*self.watchers)
+      self.issues.append(issue)
+    Job.objects.all().delete()
+
+  def test_comment_notifies_watchers_in_background(self):
+    response = self.client.post("/comments/", {"text": "Looking into it", "user": self.author.id, "issue": self.issues[0].id})
+    self.assertEqual(response.status_code, 201)
+    # the request only queued the job
+    self.assertEqual(Notification.objects.count(), 0)
+    self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    with mock.patch("sys.stdout", new_callable=io.StringIO) as out:
+      call_command("runjobs", once=True, threads=1)
+    self.assertEqual(out.getvalue().strip(), "Jobs done: 1, retried: 0, failed: 0")
+    self.assertFalse(Job.objects.exists())
+    results = self.client.get("/users/{}/notifications".format(self.watchers[1].id)).json()["results"]
+    self.assertEqual([(result["issue"], result["text"]) for result in results],
+                     [(self.issues[0].id, "New comment on Watched Issue 0: Looking into it")])
+    self.assertEqual(self.client.get("/users/{}/notifications".format(self.author.id)).json()["results"], [])
+
+  def test_issue_writes_notify_once_with_what_changed(self):
+    issue = self.issues[0]
+    self.author.projects.add(self.project)
+    label = Label.objects.create(value="urgent")
+    Job.objects.all().delete()
+    self.client.patch("/projects/{}/issues/{}/assignee".format(self.project.id, issue.id), {"assignee": self.author.id})
+    self.client.patch("/issues/{}/label".format(issue.id), {"label": label.id})
+    self.assertEqual(Job.objects.count(), 2)
+
+    with mock.patch("sys.stdout", new_callable=io.StringIO):
+      call_command("runjobs", once=True, threads=1)
+    for watcher in self.watchers:
+      texts = list(Notification.objects.filter(user=watcher).order_by("id").values_list("text", flat=True))
+      self.assertEqual(texts, ["Watched Issue 0 changed: assignee", "Labels added on Watched Issue 0"])
+
+  def test_jobs_only_queued_with_their_write(self):
+    with self.assertRaises(RuntimeError):
+      with transaction.atomic():
+        self.issues[0].labels.add(Label.objects.create(value="dropped"))
+        raise RuntimeError()
+    self.assertFalse(Job.objects.exists())
+
+  def test_batch_runs_in_constant_queries(self):
+    def notify(issues):
+      for issue in issues:
+        self.client.patch("/issues/{}/status".format(issue.id), {"status": "assigned"})
+      with CaptureQueriesContext(connection) as context:
+        counts = Worker(threads=1, batch_size=10).runOnce()
+      self.assertEqual(counts["done"], len(issues))
+      return len(context.captured_queries)
+
+    self.assertEqual(notify(self.issues[:1]), notify(self.issues[1:]))
+    self.assertEqual(Notification.objects.filter(text="Watched Issue 3 changed: status").count(), 2)
+
+  def test_failing_jobs_retried_with_backoff(self):
+    handler = mock.Mock(side_effect=ValueError("flaky"))
+    with mock.patch.dict(jobHandlers, {"flaky": handler}):
+      job = enqueue("flaky", {"n": 1})
+      waited = 0
+      for attempt in range(1, job.max_attempts + 1):
+        with self.after(waited):
+          counts = Worker(threads=1).runOnce()
+          # not due again before its backoff
+          self.assertEqual(Worker(threads=1).runOnce(), {"done": 0, "retried": 0, "failed": 0})
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, attempt)
+        self.assertIn("ValueError: flaky", job.last_error)
+        if attempt < job.max_attempts:
+          self.assertEqual(counts["retried"], 1)
+          self.assertEqual(job.status, Job.QUEUED)
+          waited += retryDelay(attempt) + 1
+      self.assertEqual(counts["failed"], 1)
+      self.assertEqual(job.status, Job.FAILED)
+    self.assertEqual(handler.call_count, job.max_attempts)
+    self.assertEqual([retryDelay(attempt) for attempt in range(1, 5)], [5, 10, 20, 40])
+
+  def test_crashed_worker_jobs_taken_over(self):
+    self.client.post("/comments/", {"text": "Crash test", "user": self.author.id, "issue": self.issues[0].id})
+    crashed = Worker("crashed", threads=1, visibility_timeout=60)
+    token, jobs = crashed.claim(10)
+    self.assertEqual(len(jobs), 1)
+
+    # claimed jobs are left alone until the claim expires
+    other = Worker("other", threads=1, visibility_timeout=60)
+    self.assertEqual(other.runOnce()["done"], 0)
+    with self.after(61):
+      self.assertEqual(other.runOnce()["done"], 1)
+    self.assertEqual(Notification.objects.count(), 2)
+
+    # the crashed worker coming back finds its claim lost and writes nothing
+    self.assertEqual(crashed.runBatch(token, jobs), {})
+    self.assertEqual(Notification.objects.count(), 2)
+    self.assertFalse(Job.objects.exists())
+
+  def test_job_crashing_every_worker_fails(self):
+    job = enqueue("notify_watchers", {"changes": []})
+    for attempt in range(job.max_attempts):
+      with self.after(61 * attempt):
+        self.assertEqual(len(Worker(threads=1, visibility_timeout=60).claim(10)[1]), 1)
+    with self.after(61 * job.max_attempts):
+      self.assertEqual(Worker(threads=1).claim(10)[1], [])
+    job.refresh_from_db()
+    self.assertEqual((job.status, job.attempts), (Job.FAILED, job.max_attempts))
+    self.assertIn("Visibility timeout", job.last_error)
+
+
+  """
+  TESTING HELPER FUNCTIONS
+  """
+  def after(self, seconds):
+    # the clock the workers read, moved forward
+    now = timezone.now() + timedelta(seconds=seconds)
+    return mock.patch("projects.jobs.timezone.now", return_value=now)
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import projectScope, responseCache
+from .changes import entry, logChanges
+from .counters import statusChangeCounts
+from .models import Issue
+
+
+def transitionIssues(issue_ids, updated_status):
+    """
+    Moves every issue in issue_ids whose status is the one right before
+    updated_status on to updated_status, with a single conditional UPDATE
+    (... WHERE status = <expected>). Returns the ids that moved; the others
+    were not in the expected status and are left unwritten.
+    """
+    expected = Issue.previousStatus[updated_status]
+
+    with transaction.atomic():
+        # lock the matching rows so the ids reported are exactly the ones the
+        # UPDATE writes, and so counters move once per issue
+        rows = list(Issue.objects
+                        .select_for_update()
+                        .filter(id__in=issue_ids)
+                        .filter(status=expected)
+                        .order_by('id')
+                        .values_list('id', 'project_id', 'sprint_id', 'type'))
+        if not rows:
+            return []
+
+        moved_ids = [row[0] for row in rows]
+        now = timezone.now()
+        (Issue.objects
+            .filter(id__in=moved_ids)
+            .filter(status=expected)
+            .update(status=updated_status, updated_at=now))
+        statusChangeCounts([row[1:] for row in rows], expected, updated_status)
+        logChanges([entry(Issue, row[0], row[1], 'updated', {'status': updated_status, 'updated_at': now}) for row in rows])
+        responseCache.bumpOnWrite(*[projectScope(row[1]) for row in rows])
+    return moved_ids
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework import routers
 from . import views
-from .views import ProjectView, UserView, IssueView, LabelView, SprintView, CommentView
+from . import async_views
+from .views import CacheStatsView, ChangesView, MetricsView, ProjectView, UserView, IssueView, LabelView, SprintView, CommentView
 
 project_list = ProjectView.as_view({
         'get': 'list',
@@ -15,6 +16,14 @@ project_detail = ProjectView.as_view({
     'delete': 'destroy'
 })
 
+project_summary = ProjectView.as_view({
+    'get': 'get_summary'
+})
+
+project_export = ProjectView.as_view({
+    'get': 'export'
+})
+
 project_issues = IssueView.as_view({
     'get': 'get_all_issues_of_project',
     'post': 'create',
@@ -29,6 +38,10 @@ issue_search = IssueView.as_view({
     'get': 'search_issues',
 })
 
+issue_fulltext = IssueView.as_view({
+    'get': 'fulltext_search',
+})
+
 issue_detail = IssueView.as_view({
     'get': 'retrieve'
 })
@@ -37,10 +50,18 @@ issue_assign = IssueView.as_view({
     'patch': 'assign_issue'
 })
 
+issue_assignees = IssueView.as_view({
+    'patch': 'assign_issues'
+})
+
 issue_watcher = IssueView.as_view({
     'patch': 'update_watcher'
 })
 
+issue_watchers = IssueView.as_view({
+    'patch': 'update_watchers'
+})
+
 issue_label = IssueView.as_view({
     'patch': 'add_label_to_issue'
 })
@@ -49,6 +70,10 @@ issue_status = IssueView.as_view({
     'patch': 'update_issue_status'
 })
 
+issues_status = IssueView.as_view({
+    'patch': 'update_issues_status'
+})
+
 issue_comment = IssueView.as_view({
     'get': 'get_issue_comments',
     'post': 'add_comment'
@@ -68,6 +93,10 @@ user_issues = UserView.as_view({
     'get': 'get_issues_assigned_to_user',
 })
 
+user_notifications = UserView.as_view({
+    'get': 'get_notifications',
+})
+
 label_list = LabelView.as_view({
     'get': 'list',
     'post': 'create'
@@ -91,10 +120,16 @@ urlpatterns = [
     path("projects/", project_list),
     path('projects/<int:pk>', project_detail),
     path('projects/<int:pk>/issues', project_issues),
+    path('projects/<int:pk>/summary', project_summary),
+    path('projects/<int:pk>/export', project_export),
     path('issues/', issue_list),
     path('issues/search', issue_search),
+    path('issues/fulltext', issue_fulltext),
+    path('issues/status', issues_status),
     path('issues/<int:pk>', issue_detail),
     path('projects/<int:pid>/issues/<int:iid>/assignee', issue_assign),
+    path('projects/<int:pid>/issues/assignees', issue_assignees),
+    path('projects/<int:pid>/issues/watchers', issue_watchers),
     path('projects/<int:pid>/issues/<int:iid>/watcher', issue_watcher),
     path('issues/<int:iid>/label', issue_label),
     path('issues/<int:iid>/status', issue_status),
@@ -102,8 +137,20 @@ urlpatterns = [
     path('users/', user_list),
     path('users/<int:pk>', user_detail),
     path('users/<int:pk>/issues', user_issues),
+    path('users/<int:pk>/notifications', user_notifications),
     path('labels/', label_list),
     path('sprints/', sprint_list),
     path('sprints/<int:pk>', sprint_detail),
-    path('comments/', comment_list)
+    path('comments/', comment_list),
+    path('changes', ChangesView.as_view()),
+    path('stats/caches', CacheStatsView.as_view()),
+    path('metrics', MetricsView.as_view()),
+
+    # async read endpoints for the ASGI deployment
+    path('async/issues/', async_views.issueList),
+    path('async/issues/search', async_views.searchIssues),
+    path('async/issues/<int:pk>', async_views.issueDetail),
+    path('async/projects/<int:pk>/issues', async_views.projectIssues),
+    path('async/projects/<int:pid>/issues/<int:iid>/comments', async_views.issueComments),
+    path('async/users/<int:pk>/issues', async_views.userIssues),
 ]
\ No newline at end of file
@@ -2,37 +2,176 @@ from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import Q
-from django.http import HttpResponseNotFound, HttpResponse
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Case, Exists, OuterRef, Value, When
+from django.http import HttpResponseNotFound, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
-
-from .models import Project, User, Issue, Label, Sprint, Comment
-from .serializers import ProjectSerializer, UserSerializer, IssueSerializer, LabelSerializer, SprintSerializer, CommentSerializer
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .models import Project, User, Issue, Label, Sprint, Comment, Notification
+from .serializers import ProjectSerializer, UserSerializer, IssueSerializer, LabelSerializer, SprintSerializer, CommentSerializer, NotificationSerializer
+from .pagination import ChangePagination, KeysetPagination, RankPagination
+from .rowserializers import getRowSerializer
+from .streaming import streamList, wantsStream
+from .cache import cachedResponse, projectScope, responseCache
+from .changes import changesAfter, entry, linkChanges, logChanges
+from .counters import moveIssueCounts, projectSummary
+from .export import EXPORT_FORMATS, exportRows, renderExport
+from .membership import membershipCache
+from .metrics import allMetrics, cacheStats
+from .fulltext import rankedMatches
+from .search import SearchError, compileSearch, facetCounts, parseFacets
+from .transitions import transitionIssues
+from .etags import projectEtag, projectIssuesEtag, issueEtag, issueCommentsEtag, sprintEtag
 from django.core import serializers
 
-class ProjectView(viewsets.ModelViewSet):
+# many-to-many relations emitted by IssueSerializer; list endpoints fetch them
+# in one batched query each instead of two queries per issue
+ISSUE_PREFETCH = ('labels', 'watchers')
+
+
+class RowListMixin:
+    """
+    Serves list() through a RowSerializer, which renders the same JSON as the
+    view's serializer without building a model instance per row. With
+    ?stream=true the whole list is streamed instead of paginated.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if wantsStream(request):
+            if self.paginator is not None:
+                queryset = queryset.order_by(*self.paginator.ordering)
+            return streamList(queryset, self.get_serializer_class())
+
+        rows = getRowSerializer(self.get_serializer_class())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page))
+        return Response(rows.serialize(queryset))
+
+
+class CacheStatsView(APIView):
+    """
+    Hit ratios of this worker process's caches.
+    """
+
+    def get(self, request):
+        return Response(cacheStats())
+
+
+class MetricsView(APIView):
+    """
+    Request and cache metrics of every worker process (see metrics.py), in the
+    Prometheus text exposition format.
+    """
+
+    def get(self, request):
+        lines = allMetrics()
+        return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ChangesView(APIView):
+    """
+    The change log, oldest entry first, from the ?since= cursor returned with
+    the last page read; ?project= keeps to the entries of one project.
+    """
+
+    def get(self, request):
+        project = request.query_params.get("project")
+        if project is not None and not project.isdigit():
+            return HttpResponseBadRequest("Changes Error: 'project' must be an integer, got '{}'.".format(project))
+
+        # a deleted project's entries are still served, so it is not looked up
+        paginator = ChangePagination()
+        position = paginator.getPosition(request)
+        changes = changesAfter(position, paginator.page_size + 1, project)
+        return paginator.get_paginated_response(changes)
+
+
+class ProjectView(RowListMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
 
+    @method_decorator(condition(etag_func=projectEtag))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def get_summary(self, request, pk):
+        # check if project exists
+        project = safeGet(pk, Project)
+        if type(project) == HttpResponseNotFound:
+            return project
+
+        response = projectSummary(project.id)
+        response["project"] = project.id
+        return Response(response)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk):
+        # 'format' is taken by DRF's renderer selection
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("Export Error: 'output' must be one of {}, got '{}'.".format(
+                ", ".join(EXPORT_FORMATS), output))
 
-class UserView(viewsets.ModelViewSet):
+        # check if project exists
+        project = safeGet(pk, Project)
+        if type(project) == HttpResponseNotFound:
+            return project
+
+        response = StreamingHttpResponse(renderExport(exportRows(project.id), output), content_type=EXPORT_FORMATS[output])
+        response["Content-Disposition"] = 'attachment; filename="project-{}.{}"'.format(project.id, output)
+        return response
+
+
+class UserView(RowListMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
     @action(detail=True, methods=['get'])
     def get_issues_assigned_to_user(self, request, pk):
-        issues = Issue.objects.filter(assignee=pk).order_by('-creation_date')
-        response = IssueSerializer(issues, many=True)
-        return Response(response.data)
+        issues = Issue.objects.prefetch_related(*ISSUE_PREFETCH).filter(assignee=pk)
+        paginator = KeysetPagination()
+        if wantsStream(request):
+            return streamList(issues.order_by(*paginator.ordering), IssueSerializer)
+
+        page = paginator.paginate_queryset(issues, request, view=self)
+        response = getRowSerializer(IssueSerializer).serialize(page)
+        return paginator.get_paginated_response(response)
+
+    @action(detail=True, methods=['get'])
+    def get_notifications(self, request, pk):
+        # check if user exists
+        user = safeGet(pk, User)
+        if type(user) == HttpResponseNotFound:
+            return user
+
+        # newest first, written by the runjobs worker
+        notifications = Notification.objects.filter(user=user.id)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        response = getRowSerializer(NotificationSerializer).serialize(page)
+        return paginator.get_paginated_response(response)
     
 
-class IssueView(viewsets.ModelViewSet):
-    queryset = Issue.objects.all()
+class IssueView(RowListMixin, viewsets.ModelViewSet):
+    queryset = Issue.objects.prefetch_related(*ISSUE_PREFETCH)
     serializer_class = IssueSerializer
+    pagination_class = KeysetPagination
 
+    @method_decorator(condition(etag_func=issueEtag))
+    @cachedResponse(lambda view, request, pk: issueScope(pk))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     @action(detail=True, methods=['get'])
+    @method_decorator(condition(etag_func=projectIssuesEtag))
+    @cachedResponse(lambda view, request, pk: projectScope(pk))
     def get_all_issues_of_project(self, request, pk):
 
         # check if project exists
@@ -40,18 +179,14 @@ class IssueView(viewsets.ModelViewSet):
         if type(project) == HttpResponseNotFound:
             return project
 
-        
-        issues = Issue.objects.filter(project=pk).order_by('-creation_date')
-        response = IssueSerializer(issues, many=True)
-        return Response(response.data)
-        
-        # issues = Issue.objects.filter(project=pk).order_by('-creation_date')
-        # paginator = Paginator(issues, 2) # show 50 issues per page
-        # page_number = request.GET.get('page')
-        # page_obj = paginator.get_page(page_number)
-        # return render(request, {'page_obj': page_obj})
-        
-        # return response
+        # newest issues first, one page at a time
+        issues = self.get_queryset().filter(project=pk)
+        if wantsStream(request):
+            return streamList(issues.order_by(*self.paginator.ordering), IssueSerializer)
+
+        page = self.paginate_queryset(issues)
+        response = getRowSerializer(IssueSerializer).serialize(page)
+        return self.get_paginated_response(response)
 
     @action(detail=True, methods=['patch'])
     def assign_issue(self, request, pid, iid):
@@ -87,23 +222,78 @@ class IssueView(viewsets.ModelViewSet):
 
     def checkUserValid(self, user, project):
         response = None
+        error = eligibilityError(user.name, user.isActive(), membershipCache.isMember(user.id, project.id), project.name)
+        if error != None:
+            response = HttpResponse(error)
+        return response
 
-        # booleans
-        notActive = not user.isActive()
-        notInProject = not user.inProject(project.id)
-
-        # check if user active
-        if notActive:
-            response = HttpResponse("Inactive User: User {} is marked as inactive".format(user.name))
+    @action(detail=True, methods=['patch'])
+    def assign_issues(self, request, pid):
+        pairs = request.data.get("assignments", [])
 
-        # check if user is a part of the project
-        if notInProject:
-            response = HttpResponse("Unqualified User: User {} is not a part of project {}.".format(user.name, project.name))
+        # check if project exists
+        project = safeGet(pid, Project)
+        if type(project) == HttpResponseNotFound:
+            return project
 
-        if notActive and notInProject:
-            response = HttpResponse("Inactive User: User {0} is marked as inactive\nUnqualified User: User {0} is not a part of project {1}.".format(user.name, project.name))
-        
-        return response
+        if not isinstance(pairs, list):
+            return HttpResponseBadRequest("Assignment Error: 'assignments' must be a list of {\"issue\": id, \"assignee\": id} pairs.")
+
+        assignments = {}
+        errors = []
+        for pair in pairs:
+            try:
+                iid = int(pair["issue"])
+                user_id = int(pair["assignee"])
+            except (KeyError, TypeError, ValueError):
+                errors.append({"pair": pair, "error": "Assignment Error: Pair must have integer 'issue' and 'assignee' ids."})
+                continue
+            if iid in assignments:
+                errors.append({"issue": iid, "assignee": user_id, "error": "Assignment Error: Issue {} is assigned more than once.".format(iid)})
+                continue
+            assignments[iid] = user_id
+
+        # one query for every user's eligibility, one for the issues
+        users = checkUsersValid(set(assignments.values()), project)
+        issue_ids = set(Issue.objects
+                            .filter(project=project.id)
+                            .filter(id__in=list(assignments))
+                            .values_list('id', flat=True))
+
+        valid = {}
+        for iid, user_id in assignments.items():
+            error = None
+            if iid not in issue_ids:
+                error = "Not Found Error: Issue with id = {} does not exist in project {}.".format(iid, project.name)
+            elif user_id not in users:
+                error = "Not Found Error: User with id = {} does not exist.".format(user_id)
+            else:
+                error = users[user_id]
+            if error != None:
+                errors.append({"issue": iid, "assignee": user_id, "error": error})
+            else:
+                valid[iid] = user_id
+
+        # apply every assignment with one UPDATE
+        if valid:
+            now = timezone.now()
+            with transaction.atomic():
+                (Issue.objects
+                    .filter(project=project.id)
+                    .filter(id__in=list(valid))
+                    .update(assignee=Case(*[When(id=iid, then=Value(user_id)) for iid, user_id in valid.items()]),
+                            updated_at=now))
+                logChanges([entry(Issue, iid, project.id, 'updated', {'assignee_id': user_id, 'updated_at': now})
+                            for iid, user_id in sorted(valid.items())])
+                responseCache.bumpOnWrite(projectScope(project.id))
+
+        issues = self.get_queryset().filter(id__in=list(valid)).order_by('id')
+        response = getRowSerializer(IssueSerializer).serialize(issues)
+        return Response({
+            "assigned": sorted(valid),
+            "errors": errors,
+            "issues": response,
+        })
 
     @action(detail=True, methods=['patch'])
     def add_label_to_issue(self, request, iid):
@@ -131,64 +321,110 @@ class IssueView(viewsets.ModelViewSet):
     def update_issue_status(self, request, iid):
         data = request.data
         updated_status = data['status']
-        
+
         # check if issue exists
         issue = safeGet(iid, Issue)
         if type(issue) == HttpResponseNotFound:
             return issue
 
-        # update issue status
-        issue.updateStatus(updated_status)
-        issue.save()
-        
+        # check the transition is allowed before writing anything
+        if not issue.canUpdateStatus(updated_status):
+            return statusError(issue.status, updated_status)
+
+        # update issue status, unless another request changed it meanwhile
+        if not transitionIssues([issue.id], updated_status):
+            return HttpResponse(
+                "Status Conflict: Issue {} is no longer '{}', status was not updated to '{}'."
+                .format(issue.summary, issue.status, updated_status), status=409)
+
+        issue.refresh_from_db()
         response = IssueSerializer(issue)
         return Response(response.data)
 
-    @action(detail=True, methods=['get'])
-    def search_issues(self, request):
+    @action(detail=False, methods=['patch'])
+    def update_issues_status(self, request):
         data = request.data
-        
-        logic = data.get('logic')
-        project = data.get('project')
-        type = data.get('type')
-        status = data.get('status')
-        assignee = data.get('assignee')
-        label = data.get('label')
-        desc = data.get('desc')
+        updated_status = data.get("status")
 
-        response = None
-        issues = Issue.objects.all()
-        if logic == "and":
-            if project: issues = issues.filter(project=project)
-            if type: issues = issues.filter(type=type)
-            if status: issues = issues.filter(status=status)
-            if assignee: issues = issues.filter(assignee=assignee)
-            if desc: issues = issues.filter(desc=desc)
-            if label: issues = issues.filter(labels=label)
-        elif logic == "or":
-            issues = issues.filter(Q(project=project) | 
-                        Q(type=type) | 
-                        Q(status=status) | 
-                        Q(assignee=assignee) | 
-                        Q(desc=desc) | 
-                        Q(labels=label))
+        # issues arrive as a repeated form field or as a JSON list
+        if hasattr(data, 'getlist'):
+            iids = data.getlist("issues")
         else:
-            response = HttpResponseNotFound("Logic operation '{}' does not exist.  Must be one of ['and', 'or']".format(logic))
-
-        if response == None:
-            response = IssueSerializer(issues, many=True)
-            response = Response(response.data)
-        return response
+            iids = data.get("issues", [])
+        try:
+            issue_ids = list(dict.fromkeys(int(iid) for iid in iids))
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Issue Error: Issue ids {} must be integers.".format(iids))
+
+        # only issues in the status right before the new one can move
+        if updated_status not in Issue.previousStatus:
+            return HttpResponseBadRequest(
+                "Status Error: Issues cannot be updated to '{}'.  Must be one of {}."
+                .format(updated_status, list(Issue.previousStatus)))
+
+        updated_ids = transitionIssues(issue_ids, updated_status)
+        updated = set(updated_ids)
+        rejected_ids = [iid for iid in issue_ids if iid not in updated]
+
+        return Response({
+            "status": updated_status,
+            "updated": updated_ids,
+            "rejected": rejected_ids,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search_issues(self, request):
+        # criteria come from the query string, see search.py
+        try:
+            predicate = compileSearch(request.query_params)
+            facets, facet_limit = parseFacets(request.query_params)
+        except SearchError as error:
+            return HttpResponseBadRequest(str(error))
+
+        issues = self.get_queryset().filter(predicate)
+        if wantsStream(request):
+            return streamList(issues.order_by(*self.paginator.ordering), IssueSerializer)
+
+        page = self.paginate_queryset(issues)
+        response = self.paginator.getPaginatedData(getRowSerializer(IssueSerializer).serialize(page))
+
+        # counts over every matching issue, not just this page
+        if facets:
+            response["facets"] = facetCounts(issues, facets, facet_limit)
+        return Response(response)
+
+    @action(detail=False, methods=['get'])
+    def fulltext_search(self, request):
+        text = request.query_params.get("q", "").strip()
+        project = request.query_params.get("project")
+        if not text:
+            return HttpResponseBadRequest("Search Error: 'q' must hold the words to search for.")
+        if project is not None and not project.isdigit():
+            return HttpResponseBadRequest("Search Error: 'project' values must be integers, got '{}'.".format(project))
+
+        # best matches first, one page at a time
+        paginator = RankPagination()
+        position = paginator.getPosition(request)
+        matches = rankedMatches(text, position, paginator.page_size + 1, project)
+
+        rows = getRowSerializer(IssueSerializer).serialize(Issue.objects.filter(id__in=[pk for pk, _ in matches]))
+        rows = dict((row["id"], row) for row in rows)
+        response = [dict(rows[pk], rank=rank) for pk, rank in matches if pk in rows]
+        return paginator.get_paginated_response(response)
 
-    # TODO: add exception handling
     @action(detail=True, methods=['patch'])
     def move_issues(self, request, pk):
         data = request.data
 
-        iids = data.getlist("issues")
-        issue_ids = []
-        for iid in iids:
-            issue_ids.append(int(iid))
+        # issues arrive as a repeated form field or as a JSON list
+        if hasattr(data, 'getlist'):
+            iids = data.getlist("issues")
+        else:
+            iids = data.get("issues", [])
+        try:
+            issue_ids = list(dict.fromkeys(int(iid) for iid in iids))
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Issue Error: Issue ids {} must be integers.".format(iids))
         source_sprint = data.get("source_sprint")
         target_sprint = data.get("target_sprint")
 
@@ -202,25 +438,50 @@ class IssueView(viewsets.ModelViewSet):
         if type(checkSprint) == HttpResponseNotFound:
             return checkSprint
 
-        issues = (Issue.objects
-                        .filter(project=pk)
-                        .filter(sprint=source_sprint)
-                        .filter(id__in=issue_ids))
-
         # check if target sprint exists
         newSprint = safeGet(target_sprint, Sprint)
         if type(newSprint) == HttpResponseNotFound:
             return newSprint
 
-        # move issues to new sprint
-        for issue in issues:
-            issue.setSprint(newSprint)
-            issue.save()
-
-        response = IssueSerializer(issues, many=True)
-        return Response(response.data)
+        # check target sprint is a part of the project
+        if newSprint.project_id != project.id:
+            return HttpResponseBadRequest(
+                "Sprint Error: Sprint {} is not a part of project {}.  Issues can only be moved between sprints of the same project."
+                .format(newSprint.name, project.name))
+
+        # move every matching issue with a single UPDATE; the matching rows are
+        # locked first so the ids reported as moved are exactly the ones written
+        with transaction.atomic():
+            moved_ids = list(Issue.objects
+                                .select_for_update()
+                                .filter(project=pk)
+                                .filter(sprint=source_sprint)
+                                .filter(id__in=issue_ids)
+                                .order_by('id')
+                                .values_list('id', flat=True))
+            if moved_ids:
+                now = timezone.now()
+                moveIssueCounts(moved_ids, checkSprint.id, newSprint.id)
+                Issue.objects.filter(id__in=moved_ids).update(sprint=newSprint, updated_at=now)
+                logChanges([entry(Issue, iid, project.id, 'updated', {'sprint_id': newSprint.id, 'updated_at': now})
+                            for iid in moved_ids])
+                responseCache.bumpOnWrite(projectScope(project.id))
+
+        # issues not in the project or not in the source sprint are left alone
+        moved = set(moved_ids)
+        rejected_ids = [iid for iid in issue_ids if iid not in moved]
+
+        issues = self.get_queryset().filter(id__in=moved_ids).order_by('id')
+        response = getRowSerializer(IssueSerializer).serialize(issues)
+        return Response({
+            "target_sprint": newSprint.id,
+            "moved": moved_ids,
+            "rejected": rejected_ids,
+            "issues": response,
+        })
 
     @action(detail=True, methods=['get'])
+    @method_decorator(condition(etag_func=issueCommentsEtag))
     def get_issue_comments(self, request, pid, iid):
         # check if project exists
         project = safeGet(pid, Project)
@@ -233,8 +494,11 @@ class IssueView(viewsets.ModelViewSet):
             return issue
 
         comments = Comment.objects.filter(issue=iid) # .order_by('-creation_date')
-        response = CommentSerializer(comments, many=True)
-        return Response(response.data)
+        if wantsStream(request):
+            return streamList(comments, CommentSerializer)
+
+        response = getRowSerializer(CommentSerializer).serialize(comments)
+        return Response(response)
 
     @action(detail=True, methods=['post'])
     def add_comment(self, request, pid, iid):
@@ -331,24 +595,172 @@ class IssueView(viewsets.ModelViewSet):
         return response
 
 
-class SprintView(viewsets.ModelViewSet):
+    @action(detail=True, methods=['patch'])
+    def update_watchers(self, request, pid):
+        data = request.data
+        action = data.get("action")
+
+        # check if project exists
+        project = safeGet(pid, Project)
+        if type(project) == HttpResponseNotFound:
+            return project
+
+        if action not in ("add", "mute"):
+            return HttpResponseNotFound(
+                "Not Found Error: Action {} does not exist.  Users can either be added ('add') or muted ('mute') from an issue's watchlist."
+                .format(action))
+
+        # ids arrive as repeated form fields or as JSON lists
+        if hasattr(data, 'getlist'):
+            iids = data.getlist("issues")
+            uids = data.getlist("watchers")
+        else:
+            iids = data.get("issues", [])
+            uids = data.get("watchers", [])
+        if not isinstance(iids, list) or not isinstance(uids, list):
+            return HttpResponseBadRequest("Watcher Error: 'issues' and 'watchers' must be lists of integer ids.")
+        try:
+            issue_ids = list(dict.fromkeys(int(iid) for iid in iids))
+            watcher_ids = list(dict.fromkeys(int(uid) for uid in uids))
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Watcher Error: 'issues' and 'watchers' must be lists of integer ids.")
+
+        errors = []
+
+        # check the issues are a part of the project
+        assignees = dict(Issue.objects
+                            .filter(project=project.id)
+                            .filter(id__in=issue_ids)
+                            .values_list('id', 'assignee_id'))
+        for iid in issue_ids:
+            if iid not in assignees:
+                errors.append({"issue": iid, "error": "Not Found Error: Issue with id = {} does not exist in project {}.".format(iid, project.name)})
+
+        # make sure watchers are valid users (active & part of project), unless muting
+        if action == "add":
+            users = checkUsersValid(watcher_ids, project)
+            for uid in watcher_ids:
+                error = users.get(uid, "Not Found Error: User with id = {} does not exist.".format(uid))
+                if error != None:
+                    errors.append({"watcher": uid, "error": error})
+            watcher_ids = [uid for uid in watcher_ids if uid in users and users[uid] == None]
+
+        # one indexed lookup for the links that already exist
+        WatcherLink = Issue.watchers.through
+        existing = set(WatcherLink.objects
+                        .filter(issue_id__in=list(assignees))
+                        .filter(user_id__in=watcher_ids)
+                        .values_list('issue_id', 'user_id'))
+
+        if action == "add":
+            links = []
+            for iid, assignee_id in assignees.items():
+                for uid in watcher_ids:
+                    if uid == assignee_id:
+                        errors.append({"issue": iid, "watcher": uid, "error":
+                            "Watcher Designation Error: User {} is already an assignee.  User cannot be designated as both an assignee and a watcher.".format(uid)})
+                    elif (iid, uid) not in existing:
+                        links.append(WatcherLink(issue_id=iid, user_id=uid))
+            changed_ids = sorted(set(link.issue_id for link in links))
+        else:
+            changed_ids = sorted(set(iid for iid, uid in existing))
+
+        # set-based insert or delete on the through table
+        if changed_ids:
+            with transaction.atomic():
+                if action == "add":
+                    WatcherLink.objects.bulk_create(links, ignore_conflicts=True)
+                    changed = len(links)
+                    pairs = [(link.issue_id, link.user_id) for link in links]
+                else:
+                    changed, _ = (WatcherLink.objects
+                                    .filter(issue_id__in=changed_ids)
+                                    .filter(user_id__in=watcher_ids)
+                                    .delete())
+                    pairs = sorted(existing)
+                # the through table bypasses m2m_changed, so touch and log the issues here
+                Issue.objects.filter(id__in=changed_ids).update(updated_at=timezone.now())
+                logChanges(linkChanges(Issue.watchers.field, 'added' if action == "add" else 'removed',
+                                        pairs, dict.fromkeys(changed_ids, project.id)))
+                responseCache.bumpOnWrite(projectScope(project.id))
+        else:
+            changed = 0
+
+        return Response({
+            "action": action,
+            "changed": changed,
+            "issues": changed_ids,
+            "errors": errors,
+        })
+
+
+class SprintView(RowListMixin, viewsets.ModelViewSet):
     queryset = Sprint.objects.all()
     serializer_class = SprintSerializer
 
+    @cachedResponse(lambda view, request: 'sprints')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(condition(etag_func=sprintEtag))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class LabelView(viewsets.ModelViewSet):
+
+class LabelView(RowListMixin, viewsets.ModelViewSet):
     queryset = Label.objects.all()
     serializer_class = LabelSerializer
 
+    @cachedResponse(lambda view, request: 'labels')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
-class CommentView(viewsets.ModelViewSet):
+class CommentView(RowListMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
 
 
+def issueScope(issueId):
+    # issue details are cached under their project's version
+    project_id = Issue.objects.filter(pk=issueId).values_list('project_id', flat=True).first()
+    return projectScope(project_id)
+
+
 '''
 error handling functions
 '''
+def checkUsersValid(user_ids, project):
+    # one query: maps every existing user id to its eligibilityError (None if valid)
+    member = User.projects.through.objects.filter(user=OuterRef('pk'), project=project.id)
+    users = {}
+    for user_id, name, active, in_project in (User.objects
+                                                .filter(id__in=list(user_ids))
+                                                .annotate(in_project=Exists(member))
+                                                .values_list('id', 'name', 'active', 'in_project')):
+        users[user_id] = eligibilityError(name, active, in_project, project.name)
+    return users
+
+
+def eligibilityError(user_name, active, in_project, project_name):
+    # returns why a user cannot be assigned to or watch issues of the project
+    if not active and not in_project:
+        return "Inactive User: User {0} is marked as inactive\nUnqualified User: User {0} is not a part of project {1}.".format(user_name, project_name)
+    if not active:
+        return "Inactive User: User {} is marked as inactive".format(user_name)
+    if not in_project:
+        return "Unqualified User: User {} is not a part of project {}.".format(user_name, project_name)
+    return None
+
+
+def statusError(status, updated_status):
+    if status not in Issue.nextStatus:
+        return HttpResponseBadRequest("Status Error: Issue status = {}, it can no longer be updated.".format(status))
+    return HttpResponseBadRequest(
+        "Status Error: Issue status cannot be updated from {} to {}.  The next status is {}."
+        .format(status, updated_status, Issue.nextStatus[status]))
+
+
 def safeGet(entityId, Entity):
     try:
         entity = Entity.objects.get(pk=entityId)